@@ -0,0 +1,122 @@
+"""
+Pool sizing for scheduler.py --min-workers: the number of active slots follows CPU and memory pressure.
+
+Every interval, the pool shrinks if MemAvailable (/proc/meminfo) is below the reserve, by as many slots as containers
+of the largest measured size (`docker stats`) would free. It grows if cores are idle, i.e., the 1-minute load
+(/proc/loadavg) and the number of busy slots are below the number of CPUs, and the available memory stays above the
+reserve with one more container per new slot. The pool size stays between min_workers and max_workers.
+"""
+import logging
+import math
+import os
+import re
+import subprocess
+from typing import Dict, NamedTuple, Optional, Tuple
+
+SIZE = re.compile(r"([0-9.]+)\s*([KMGT]?i?B)", re.IGNORECASE)
+SIZE_UNITS = {"b": 1, "kb": 10**3, "mb": 10**6, "gb": 10**9, "tb": 10**12, "kib": 2**10, "mib": 2**20, "gib": 2**30, "tib": 2**40}
+DOCKER_STATS_TIMEOUT_SECONDS = 20
+GIB = 2**30
+
+
+class Pressure(NamedTuple):
+    """Host load and memory, memory of the running containers of the pool"""
+
+    load: float
+    cpus: int
+    available: int
+    total: int
+    container_memory: Dict[str, int]
+
+    def __str__(self):
+        return (
+            f"load {self.load:.1f}/{self.cpus} cores, {self.available / GIB:.1f}/{self.total / GIB:.1f} GiB available, "
+            f"{len(self.container_memory)} containers using {sum(self.container_memory.values()) / GIB:.1f} GiB"
+        )
+
+
+def read_loadavg(path: str = "/proc/loadavg") -> float:
+    """1-minute load average"""
+    with open(path) as f:
+        return float(f.read().split()[0])
+
+
+def read_meminfo(path: str = "/proc/meminfo") -> Tuple[int, int]:
+    """Available and total memory in bytes"""
+    values = {}
+    with open(path) as f:
+        for line in f:
+            key, value = line.split(":", 1)
+            values[key] = int(value.split()[0]) * 1024  # kB
+    return values["MemAvailable"], values["MemTotal"]
+
+
+def parse_size(text: str) -> Optional[int]:
+    """Bytes of a docker size like '1.2GiB' or '512MB'"""
+    match = SIZE.match(text.strip())
+    if match is None or match.group(2).lower() not in SIZE_UNITS:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).lower()])
+
+
+def container_memory(prefix: str) -> Dict[str, int]:
+    """Memory use of the running containers whose name starts with prefix (empty if docker is not available)"""
+    try:
+        result = subprocess.run(
+            ["docker", "stats", "--no-stream", "--format", "{{.Name}}\t{{.MemUsage}}"],
+            capture_output=True,
+            text=True,
+            timeout=DOCKER_STATS_TIMEOUT_SECONDS,
+        )
+    except (OSError, subprocess.TimeoutExpired) as ex:
+        logging.debug(f"docker stats failed: {ex}")
+        return {}
+    memory = {}
+    for line in result.stdout.splitlines():
+        name, _, usage = line.partition("\t")
+        if name.startswith(prefix) and (size := parse_size(usage.split("/")[0])) is not None:
+            memory[name] = size
+    return memory
+
+
+class PoolSizer:
+    """Decides the number of active slots from the pressure on the host"""
+
+    def __init__(
+        self,
+        min_workers: int,
+        max_workers: int,
+        memory_reserve: int = 2 * GIB,
+        container_memory_estimate: int = 2 * GIB,
+        container_prefix: Optional[str] = None,
+    ):
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self._memory_reserve = memory_reserve
+        self._container_memory_estimate = container_memory_estimate
+        self._container_prefix = container_prefix  # None: no containers (local commands)
+        self._largest_container = 0
+
+    def pressure(self) -> Pressure:
+        available, total = read_meminfo()
+        memory = container_memory(self._container_prefix) if self._container_prefix is not None else {}
+        return Pressure(read_loadavg(), len(os.sched_getaffinity(0)), available, total, memory)
+
+    def decide(self, size: int, busy: int, pressure: Pressure) -> Tuple[int, str]:
+        """New pool size and reason, given the current size and number of busy slots"""
+        # memory spikes (Binary Ninja) are bounded by the largest container seen so far, not by the average
+        self._largest_container = max([self._largest_container, *pressure.container_memory.values()])
+        per_container = self._largest_container or self._container_memory_estimate
+        if pressure.available < self._memory_reserve:
+            shrink = max(1, math.ceil((self._memory_reserve - pressure.available) / per_container))
+            new_size = max(self.min_workers, size - shrink)
+            return new_size, f"memory below reserve of {self._memory_reserve / GIB:.1f} GiB"
+        # busy slots count as load before the load average catches up with a resize
+        idle_cores = math.floor(pressure.cpus - max(pressure.load, busy))
+        if busy < size or idle_cores < 1:
+            return size, "slots waiting for samples" if busy < size else "no idle cores"
+        memory_slots = (pressure.available - self._memory_reserve) // per_container
+        grow = min(idle_cores, memory_slots)
+        if grow < 1:
+            return size, f"no memory for another container of {per_container / GIB:.1f} GiB"
+        return min(self.max_workers, size + grow), f"{idle_cores} idle cores, memory for {memory_slots} containers of {per_container / GIB:.1f} GiB"
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Micro benchmarks for filter.py on synthetic data. Each benchmark compares against the previous
+(per-row/per-group) implementation and asserts that both produce identical results.
+
+python benchmark.py tracebacks --rows 1000000
+python benchmark.py topk --rows 1000000
+python benchmark.py collector --workers 1 2 4 8 16 32
+"""
+import argparse
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import warnings
+from contextlib import contextmanager
+from multiprocessing import Pool
+from pathlib import Path
+
+from pandas import DataFrame
+from pandas.testing import assert_frame_equal
+
+import tracebacks
+from collector import Collector, prepare_shard
+from filter import DBFilter
+
+FILES = ["/home/dewolf/decompiler/pipeline/controlflowanalysis/restructuring.py", "/home/dewolf/decompiler/structures/graphs/cfg.py"]
+EXCEPTIONS = ["ValueError: invalid value", "KeyError: 'x'", "AssertionError", "RecursionError: maximum recursion depth exceeded"]
+
+
+@contextmanager
+def timed(label: str, timings: dict):
+    start = time.perf_counter()
+    yield
+    timings[label] = time.perf_counter() - start
+    print(f"{label:>12}: {timings[label]:.3f}s")
+
+
+def synthetic_failed_runs(rows: int, unique_tracebacks: int, seed: int = 0) -> DataFrame:
+    """Failed runs drawing exception and traceback from a pool of unique_tracebacks distinct crashes"""
+    rng = random.Random(seed)
+    pool = []
+    for _ in range(unique_tracebacks):
+        exception = rng.choice(EXCEPTIONS)
+        frames = "".join(
+            f'  File "{rng.choice(FILES)}", line {rng.randint(1, 2000)}, in func_{rng.randint(0, 99)}\n    statement\n'
+            for _ in range(rng.randint(1, 30))
+        )
+        pool.append((exception, f"Traceback (most recent call last):\n{frames}{exception}"))
+    crashes = [rng.choice(pool) for _ in range(rows)]
+    # copy strings, rows read from SQLite are distinct objects
+    return DataFrame(
+        {
+            "dewolf_exception": [f"{exception} "[:-1] for exception, _ in crashes],
+            "dewolf_traceback": [f"{traceback} "[:-1] for _, traceback in crashes],
+            "function_basic_block_count": [rng.randint(1, 500) for _ in range(rows)],
+        }
+    )
+
+
+def per_row_case_groups(failed_runs: DataFrame) -> DataFrame:
+    """Previous implementation of DBFilter._get_filtered: Series.apply per row"""
+    failed_runs["error_file_path"] = failed_runs["dewolf_traceback"].apply(DBFilter._get_last_file_path)
+    failed_runs["error_line"] = failed_runs["dewolf_traceback"].apply(DBFilter._get_last_line_number)
+    failed_runs["case_group"] = (
+        failed_runs["dewolf_exception"].str.split().str[0].str.strip(": ")
+        + "@"
+        + failed_runs["error_file_path"].str.split("/").str[-1]
+        + ":"
+        + failed_runs["error_line"]
+    )
+    failed_runs["dewolf_traceback"] = failed_runs["dewolf_traceback"].apply(DBFilter.truncate_middle)
+    return failed_runs
+
+
+def vectorized_case_groups(failed_runs: DataFrame) -> DataFrame:
+    failed_runs = tracebacks.add_case_groups(failed_runs)
+    failed_runs["dewolf_traceback"] = tracebacks.truncate_middle(failed_runs["dewolf_traceback"])
+    return failed_runs
+
+
+def benchmark_tracebacks(args: argparse.Namespace):
+    print(f"generating {args.rows} failed runs ({args.unique} unique tracebacks)...")
+    df = synthetic_failed_runs(args.rows, args.unique)
+    timings = {}
+    with timed("per-row", timings):
+        expected = per_row_case_groups(df.copy())
+    with timed("vectorized", timings):
+        result = vectorized_case_groups(df.copy())
+    assert_frame_equal(expected, result)
+    print(f"{'speedup':>12}: {timings['per-row'] / timings['vectorized']:.1f}x")
+
+
+def per_group_smallest(failed_runs: DataFrame, k: int) -> DataFrame:
+    """Previous implementation of DBFilter._get_filtered: DataFrame.nsmallest per group"""
+    f = lambda x: x.nsmallest(k, "function_basic_block_count")
+    with warnings.catch_warnings():
+        # pandas >= 2.2 deprecates passing the grouping columns to apply
+        warnings.simplefilter("ignore", FutureWarning)
+        return failed_runs.groupby(DBFilter.GROUP_KEYS).apply(f).reset_index(drop=True)
+
+
+def benchmark_topk(args: argparse.Namespace):
+    print(f"generating {args.rows} failed runs ({args.unique} unique tracebacks)...")
+    df = synthetic_failed_runs(args.rows, args.unique)
+    # rows that groupby or nsmallest treat specially
+    df.loc[df.sample(frac=0.01, random_state=1).index, "function_basic_block_count"] = None
+    df.loc[df.sample(frac=0.01, random_state=2).index, "dewolf_exception"] = None
+    df["row"] = range(len(df))
+    timings = {}
+    with timed("per-group", timings):
+        expected = per_group_smallest(df, args.k)
+    with timed("sort-rank", timings):
+        result = DBFilter.smallest_per_group(df, DBFilter.GROUP_KEYS, "function_basic_block_count", args.k)
+    result = result.reset_index(drop=True)
+    # nsmallest orders ties with an unstable sort if a group has at most k rows, compare in canonical order
+    sort_keys = DBFilter.GROUP_KEYS + ["function_basic_block_count", "row"]
+    canonical = lambda x: x.sort_values(sort_keys, kind="stable").reset_index(drop=True)
+    assert_frame_equal(canonical(expected), canonical(result))
+    assert result.equals(canonical(result)), "groups not ordered by key and size, or ties not in row order"
+    print(f"{'speedup':>12}: {timings['per-group'] / timings['sort-rank']:.1f}x")
+
+
+def write_results(task) -> int:
+    """Insert rows like bugfinder (one commit per function) into database, return the number of rows that were written"""
+    database, worker, rows = task
+    written = 0
+    with sqlite3.connect(database, timeout=5) as con:
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS dewolf (id INTEGER NOT NULL PRIMARY KEY, function_name TEXT, sample_hash TEXT, is_successful INTEGER)"
+        )
+        for row in range(rows):
+            try:
+                con.execute("INSERT INTO dewolf (function_name, sample_hash, is_successful) VALUES (?, ?, 1)", (f"sub_{row}", str(worker)))
+                con.commit()
+                written += 1
+            except sqlite3.OperationalError:  # database is locked
+                con.rollback()
+    return written
+
+
+def benchmark_collector(args: argparse.Namespace):
+    """Rows/s of workers writing one shared samples.sqlite3 and of workers writing per-worker shards merged by the collector"""
+    for workers in args.workers:
+        expected = workers * args.rows
+        with tempfile.TemporaryDirectory() as directory:
+            directory = Path(directory)
+            timings = {}
+            with Pool(workers) as pool:
+                with timed("shared", timings):
+                    shared = sum(pool.map(write_results, [(directory / "shared.sqlite3", worker, args.rows) for worker in range(workers)]))
+                shards = [directory / "results" / f"{worker}.sqlite3" for worker in range(workers)]
+                for shard in shards:
+                    prepare_shard(shard)
+                with timed("shards", timings):
+                    pool.map(write_results, [(shard, worker, args.rows) for worker, shard in enumerate(shards)])
+                    merged = Collector(directory / "samples.sqlite3").collect(shards)
+            assert merged == expected, f"collector merged {merged} of {expected} rows"
+            print(
+                f"{workers:>3} workers: shared {shared / timings['shared']:.0f} rows/s ({expected - shared} lost), "
+                f"shards {merged / timings['shards']:.0f} rows/s"
+            )
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmarks for filter.py")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    parser_tracebacks = subparsers.add_parser("tracebacks", help="traceback parsing, case_group and truncation")
+    parser_tracebacks.add_argument("--rows", type=int, default=1_000_000, help="number of failed runs (default: 1000000)")
+    parser_tracebacks.add_argument("--unique", type=int, default=10_000, help="number of distinct tracebacks (default: 10000)")
+    parser_tracebacks.set_defaults(func=benchmark_tracebacks)
+    parser_topk = subparsers.add_parser("topk", help="k smallest cases per unique exception and traceback")
+    parser_topk.add_argument("--rows", type=int, default=1_000_000, help="number of failed runs (default: 1000000)")
+    parser_topk.add_argument("--unique", type=int, default=10_000, help="number of distinct tracebacks (default: 10000)")
+    parser_topk.add_argument("-k", type=int, default=10, help="cases per group (default: 10)")
+    parser_topk.set_defaults(func=benchmark_topk)
+    parser_collector = subparsers.add_parser("collector", help="concurrent workers writing results, shared DB vs collected shards")
+    parser_collector.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32], help="worker counts (default: 1 to 32)")
+    parser_collector.add_argument("--rows", type=int, default=2000, help="rows per worker (default: 2000)")
+    parser_collector.set_defaults(func=benchmark_collector)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    args.func(args)
+    sys.exit(0)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Merge per-worker result shards into samples.sqlite3.
+
+Containers writing one bind-mounted samples.sqlite3 contend on its single writer lock, so with many workers rows are
+lost or bugfinder fails with `database is locked`. With `scheduler.py --collect-interval`, each slot writes its own
+shard (data/results/<label>-<slot>.sqlite3, one writer at a time) and the collector periodically copies new rows
+into samples.sqlite3 in one transaction per shard (ATTACH + INSERT ... SELECT). Shards are in WAL mode, so reading
+a shard does not block its writer. The last merged rowid of each shard is kept in collector_progress of the output,
+updated in the same transaction as the rows, so a shard is never merged twice.
+
+python collector.py data/results data/samples.sqlite3 --remove
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Iterable, List
+
+PROGRESS_SCHEMA = """CREATE TABLE IF NOT EXISTS collector_progress (
+    shard TEXT NOT NULL PRIMARY KEY,
+    source TEXT,
+    last_rowid INTEGER
+)
+"""
+# same as DBFilter.WRITE_PRAGMAS: filter.py and the web app keep reading samples.sqlite3 while rows are merged
+WRITE_PRAGMAS = ["PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL"]
+BUSY_TIMEOUT_SECONDS = 60
+
+
+def shard_files(paths: Iterable[Path]) -> List[Path]:
+    """Shard files of the given files and directories (*.sqlite3 in a directory)"""
+    files = []
+    for path in paths:
+        files.extend(sorted(path.glob("*.sqlite3")) if path.is_dir() else [path])
+    return files
+
+
+def prepare_shard(path: Path):
+    """Create an empty shard in WAL mode (persistent), before a worker writes to it"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with sqlite3.connect(path) as con:
+        con.execute("PRAGMA journal_mode=WAL")
+    con.close()
+
+
+def remove_shard(path: Path):
+    for suffix in ("", "-wal", "-shm"):
+        Path(f"{path}{suffix}").unlink(missing_ok=True)
+
+
+class Collector:
+    """Copies new rows of result shards into the dewolf table of output"""
+
+    def __init__(self, output: Path):
+        self._output = Path(output)
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self._output, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+        for pragma in WRITE_PRAGMAS:
+            con.execute(pragma)
+        con.execute(PROGRESS_SCHEMA)
+        return con
+
+    def collect(self, shards: Iterable[Path], remove: bool = False) -> int:
+        """Merge new rows of all shards, remove merged shards (only if no worker writes to them), return merged rows"""
+        merged = 0
+        con = self._connect()
+        try:
+            for shard in shards:
+                try:
+                    merged += self._merge(con, shard)
+                except sqlite3.Error as ex:
+                    logging.warning(f"could not merge shard {shard}: {ex}")
+                    continue
+                if remove:
+                    remove_shard(shard)
+                    con.execute("DELETE FROM collector_progress WHERE shard = ?", (str(shard.absolute()),))
+        finally:
+            con.close()
+        return merged
+
+    @staticmethod
+    def _merge(con: sqlite3.Connection, shard: Path) -> int:
+        """Copy rows added to shard since the last merge in one transaction, return their number"""
+        stat = os.stat(shard)
+        source = f"{stat.st_dev}:{stat.st_ino}"  # a removed and recreated shard starts over
+        con.execute("ATTACH DATABASE ? AS shard", (str(shard),))
+        try:
+            table = con.execute("SELECT sql FROM shard.sqlite_master WHERE type = 'table' AND name = 'dewolf'").fetchone()
+            if table is None:
+                return 0  # no sample finished yet
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                if con.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'dewolf'").fetchone() is None:
+                    con.execute(table[0])  # unqualified CREATE TABLE creates the table in main
+                output_columns = {row[1] for row in con.execute("PRAGMA main.table_info(dewolf)")}
+                # the INTEGER PRIMARY KEY (id) is assigned by the output, ids of different shards collide
+                columns = [
+                    row[1]
+                    for row in con.execute("PRAGMA shard.table_info(dewolf)")
+                    if row[1] in output_columns and not (row[5] and row[2].upper() == "INTEGER")
+                ]
+                progress = con.execute("SELECT source, last_rowid FROM collector_progress WHERE shard = ?", (str(shard.absolute()),)).fetchone()
+                last_rowid = progress[1] if progress is not None and progress[0] == source else 0
+                max_rowid = con.execute("SELECT COALESCE(MAX(rowid), 0) FROM shard.dewolf").fetchone()[0]
+                rows = 0
+                if max_rowid > last_rowid:
+                    column_list = ", ".join(columns)
+                    rows = con.execute(
+                        f"INSERT INTO main.dewolf ({column_list}) SELECT {column_list} FROM shard.dewolf WHERE rowid > ? AND rowid <= ? ORDER BY rowid",
+                        (last_rowid, max_rowid),
+                    ).rowcount
+                    con.execute(
+                        "INSERT OR REPLACE INTO collector_progress (shard, source, last_rowid) VALUES (?, ?, ?)",
+                        (str(shard.absolute()), source, max_rowid),
+                    )
+                con.execute("COMMIT")
+            except BaseException:
+                con.execute("ROLLBACK")
+                raise
+            return rows
+        finally:
+            con.execute("DETACH DATABASE shard")
+
+    def run(self, paths: List[Path], stop: threading.Event, interval: float):
+        """Merge the shards of paths (files or directories) every interval seconds until stop is set"""
+        while not stop.wait(interval):
+            start = time.perf_counter()
+            merged = self.collect(shard_files(paths))
+            if merged:
+                logging.info(f"collected {merged} rows into {self._output.name} in {time.perf_counter() - start:.2f}s")
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Merge per-worker result shards into samples.sqlite3")
+    parser.add_argument("shards", type=Path, nargs="+", help="Shard files or directories of shards (*.sqlite3)")
+    parser.add_argument("output", type=Path, help="Output database, e.g., data/samples.sqlite3")
+    parser.add_argument("--remove", action="store_true", help="Remove shards after merging (no worker may write to them)")
+    parser.add_argument("--watch", type=float, help="Keep merging every X seconds instead of once")
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace) -> int:
+    collector = Collector(args.output)
+    if args.watch:
+        collector.run(args.shards, threading.Event(), args.watch)
+        return 0
+    start = time.perf_counter()
+    shards = shard_files(args.shards)
+    merged = collector.collect(shards, remove=args.remove)
+    logging.info(f"collected {merged} rows from {len(shards)} shards into {args.output} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parse_arguments()
+    sys.exit(main(args))
@@ -1,12 +1,20 @@
 #!/usr/bin/env python3
 import argparse
 import logging
+import os
 import sqlite3
 import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional, Union
+from typing import Iterator, List, Optional, Tuple, Union
 
-from pandas import DataFrame, read_sql_query, to_datetime, unique
+from pandas import DataFrame, concat, isna, read_sql_query, to_datetime, unique
+
+import tracebacks
+from collector import Collector
 
 
 class DBFilter:
@@ -66,20 +74,85 @@ class DBFilter:
 
     """
 
+    # smallest case of each case group per commit and tag, listed on the index page of the web app
+    REPRESENTATIVES_SCHEMA = """CREATE TABLE IF NOT EXISTS case_group_representatives (
+        id INTEGER NOT NULL PRIMARY KEY,
+        dewolf_current_commit TEXT,
+        tag TEXT,
+        case_group TEXT,
+        dewolf_error_id INTEGER,
+        function_basic_block_count INTEGER,
+        errors_per_group_count_pre_filter INTEGER,
+        UNIQUE (dewolf_current_commit, tag, case_group)
+    )
+    """
+    REPRESENTATIVES_QUERY = """INSERT INTO case_group_representatives (
+            dewolf_current_commit, tag, case_group, dewolf_error_id, function_basic_block_count, errors_per_group_count_pre_filter
+        )
+        SELECT dewolf_current_commit, tag, case_group, id, function_basic_block_count, errors_per_group_count_pre_filter FROM (
+            SELECT *, ROW_NUMBER() OVER (
+                PARTITION BY dewolf_current_commit, tag, case_group ORDER BY function_basic_block_count, id
+            ) AS row_number
+            FROM dewolf_errors
+            WHERE {condition}
+        )
+        WHERE row_number = 1
+    """
+
+    # full-text index for the search view, kept in sync with dewolf_errors by triggers.
+    # The trigram tokenizer matches substrings (case-insensitive), like the LIKE '%...%' it replaces.
+    SEARCH_INDEX_SCHEMA = [
+        """CREATE VIRTUAL TABLE IF NOT EXISTS dewolf_errors_fts USING fts5(
+            dewolf_exception, dewolf_traceback, function_name, content='dewolf_errors', content_rowid='id', tokenize='trigram'
+        )""",
+        """CREATE TRIGGER IF NOT EXISTS dewolf_errors_fts_insert AFTER INSERT ON dewolf_errors BEGIN
+            INSERT INTO dewolf_errors_fts (rowid, dewolf_exception, dewolf_traceback, function_name)
+            VALUES (new.id, new.dewolf_exception, new.dewolf_traceback, new.function_name);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS dewolf_errors_fts_delete AFTER DELETE ON dewolf_errors BEGIN
+            INSERT INTO dewolf_errors_fts (dewolf_errors_fts, rowid, dewolf_exception, dewolf_traceback, function_name)
+            VALUES ('delete', old.id, old.dewolf_exception, old.dewolf_traceback, old.function_name);
+        END""",
+        """CREATE TRIGGER IF NOT EXISTS dewolf_errors_fts_update AFTER UPDATE OF dewolf_exception, dewolf_traceback, function_name
+        ON dewolf_errors BEGIN
+            INSERT INTO dewolf_errors_fts (dewolf_errors_fts, rowid, dewolf_exception, dewolf_traceback, function_name)
+            VALUES ('delete', old.id, old.dewolf_exception, old.dewolf_traceback, old.function_name);
+            INSERT INTO dewolf_errors_fts (rowid, dewolf_exception, dewolf_traceback, function_name)
+            VALUES (new.id, new.dewolf_exception, new.dewolf_traceback, new.function_name);
+        END""",
+    ]
+
+    # composite indexes follow the access paths of the web app (see VIEW_QUERIES and --explain):
+    # - index page, representatives, pruning: WHERE commit AND tag, PARTITION BY case_group ORDER BY basic blocks
+    # - related cases: WHERE case_group ORDER BY basic blocks
+    # - sample hash search and --list --commit: LIKE 'abc%' is case-insensitive, so only a NOCASE index can serve it
+    # - GitHub issues by case_group (index page, case page) and by number (issue update)
     INDEX_CREATION = """
        CREATE INDEX IF NOT EXISTS idx_dewolf_errors_is_successful ON dewolf_errors(is_successful);
-       CREATE INDEX IF NOT EXISTS idx_dewolf_errors_dewolf_current_commit ON dewolf_errors(dewolf_current_commit);
-       CREATE INDEX IF NOT EXISTS idx_dewolf_errors_case_group ON dewolf_errors(case_group);
        CREATE INDEX IF NOT EXISTS idx_dewolf_function_basic_block_count ON dewolf_errors(function_basic_block_count);
        CREATE INDEX IF NOT EXISTS idx_dewolf_errors_tag ON dewolf_errors(tag);
+       CREATE INDEX IF NOT EXISTS idx_dewolf_errors_commit_tag_case_group ON dewolf_errors(dewolf_current_commit, tag, case_group, function_basic_block_count);
+       CREATE INDEX IF NOT EXISTS idx_dewolf_errors_case_group_basic_blocks ON dewolf_errors(case_group, function_basic_block_count);
+       CREATE INDEX IF NOT EXISTS idx_dewolf_errors_sample_hash ON dewolf_errors(sample_hash COLLATE NOCASE);
+       CREATE INDEX IF NOT EXISTS idx_dewolf_errors_commit_sample_hash ON dewolf_errors(dewolf_current_commit COLLATE NOCASE, sample_hash);
+       CREATE INDEX IF NOT EXISTS idx_githubissue_case_group ON samples_githubissue(case_group);
+       CREATE INDEX IF NOT EXISTS idx_githubissue_number ON samples_githubissue(number);
     """
+    # single column indexes that are a prefix of a composite index above
+    OBSOLETE_INDEXES = ["idx_dewolf_errors_dewolf_current_commit", "idx_dewolf_errors_case_group"]
+
+    # journal_mode=WAL is persistent, synchronous=NORMAL is durable in WAL mode except for a power loss, 64 MiB page cache
+    WRITE_PRAGMAS = ["PRAGMA journal_mode=WAL", "PRAGMA synchronous=NORMAL", "PRAGMA cache_size=-65536"]
+
+    GROUP_KEYS = ["dewolf_exception", "dewolf_traceback"]
 
-    def __init__(self, df: DataFrame, tag: Optional[str] = None):
+    def __init__(self, df: DataFrame, tag: Optional[str] = None, max_cases: int = 10):
         self._summary = None
         self._filtered = None
         self._samples = None
         self._df = df
         self._tag = tag
+        self._max_cases = max_cases
 
     @property
     def is_empty(self):
@@ -96,11 +169,11 @@ class DBFilter:
         self._tag = value
 
     @classmethod
-    def from_file(cls, file_path):
+    def from_file(cls, file_path, max_cases: int = 10):
         with sqlite3.connect(file_path) as con:
             df = read_sql_query(cls.QUERY, con)
             df["timestamp"] = to_datetime(df["timestamp"], format="mixed")
-        return cls(df)
+        return cls(df, max_cases=max_cases)
 
     @classmethod
     def init_db(cls, file_path):
@@ -113,35 +186,81 @@ class DBFilter:
             conn.commit()
             cursor.execute(cls.SUMMARY_SCHEMA)
             conn.commit()
-            for index_query in cls.INDEX_CREATION.splitlines():
-                cursor.execute(index_query)
-                conn.commit()
-            cursor.execute(f"PRAGMA index_list('dewolf_errors')")
-            indexes = cursor.fetchall()
+            cursor.execute(cls.REPRESENTATIVES_SCHEMA)
+            conn.commit()
+            cls._create_indexes(cursor)
+            conn.commit()
+            cls._create_search_index(cursor, rebuild=True)
+            conn.commit()
+            cursor.execute("DELETE FROM case_group_representatives")
+            cursor.execute(cls.REPRESENTATIVES_QUERY.format(condition="1"))
+            conn.commit()
+            print(f"Representatives created for {cursor.rowcount} case groups")
             print("Indexes created for:")
-            for index in indexes:
-                print(f"\tTable 'dewolf_errors': Index '{index[1]}'")
+            for table in ("dewolf_errors", "samples_githubissue"):
+                for index in cursor.execute(f"PRAGMA index_list('{table}')").fetchall():
+                    print(f"\tTable '{table}': Index '{index[1]}'")
+
+    @classmethod
+    def _create_indexes(cls, cursor: sqlite3.Cursor):
+        """Create indexes (no-op if they exist) and drop obsolete ones"""
+        for index_query in cls.INDEX_CREATION.splitlines():
+            cursor.execute(index_query)
+        for index_name in cls.OBSOLETE_INDEXES:
+            cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+
+    @classmethod
+    def _create_search_index(cls, cursor: sqlite3.Cursor, rebuild: bool = False):
+        """
+        Create full-text index and triggers if they do not exist, index existing rows if created (or rebuild)
+        """
+        exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'dewolf_errors_fts'").fetchone() is not None
+        try:
+            for statement in cls.SEARCH_INDEX_SCHEMA:
+                cursor.execute(statement)
+        except sqlite3.OperationalError as ex:
+            # SQLite without FTS5 or trigram tokenizer (< 3.34), search falls back to LIKE
+            logging.warning(f"could not create full-text index: {ex}")
+            return
+        if rebuild or not exists:
+            cursor.execute("INSERT INTO dewolf_errors_fts (dewolf_errors_fts) VALUES ('rebuild')")
+
+    @classmethod
+    def _connect(cls, database_path: Union[str, Path]) -> sqlite3.Connection:
+        """
+        Connect to filtered.sqlite3 for writing: WAL lets the web app keep reading while a write is in progress
+        """
+        con = sqlite3.connect(database_path)
+        for pragma in cls.WRITE_PRAGMAS:
+            con.execute(pragma)
+        return con
+
+    @classmethod
+    def _update_representatives(cls, cursor: sqlite3.Cursor, commit: str, tag: Optional[str]):
+        """Recompute case_group_representatives of commit and tag from dewolf_errors"""
+        cursor.execute("DELETE FROM case_group_representatives WHERE dewolf_current_commit = ? AND tag IS ?", (commit, tag))
+        cursor.execute(cls.REPRESENTATIVES_QUERY.format(condition="dewolf_current_commit = ? AND tag IS ?"), (commit, tag))
 
     @staticmethod
-    def _write_df_to_sqlite3(df: DataFrame, database_path: Union[str, Path], table_name: str, append: bool = False):
+    def _insert_df(cursor: sqlite3.Cursor, df: DataFrame, table_name: str):
         """
-        Write DataFrame to SQLite table
+        Append DataFrame rows (without id) to an existing table, using the given cursor (and its transaction).
+        Return number of inserted rows, an empty DataFrame (which may have no columns) inserts nothing.
         """
-        dtype_mapping = {
-            "int64": "INTEGER",
-            "float64": "REAL",
-            "bool": "INTEGER",  # SQLite uses INTEGER for boolean values
-            "datetime64[ns]": "TEXT",  # SQLite does not have a separate datetime type
-            "object": "TEXT",  # For all other non-numeric types
-        }
-        dtype = {name: dtype_mapping.get(str(dt), "TEXT") for name, dt in df.dtypes.items()}
-        dtype["id"] = "INTEGER NOT NULL PRIMARY KEY"
-        if append:
-            with sqlite3.connect(database_path) as con:
-                df.drop("id", axis=1).to_sql(table_name, con, index=False, if_exists="append", dtype=dtype)
-        else:
-            with sqlite3.connect(database_path) as con:
-                df.to_sql(table_name, con, index=False, if_exists="replace", dtype=dtype)
+        if df.empty:
+            return 0
+        df = df.drop(columns="id", errors="ignore")
+        for column in df.select_dtypes("datetime").columns:
+            # same representation as DataFrame.to_sql
+            df[column] = [None if isna(ts) else ts.isoformat(" ") for ts in df[column]]
+        rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+        columns = ", ".join(df.columns)
+        placeholders = ", ".join("?" * len(df.columns))
+        start = time.perf_counter()
+        cursor.executemany(f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})", rows)
+        elapsed = time.perf_counter() - start
+        logging.info(f"inserted {len(df)} rows into {table_name} in {elapsed:.2f}s ({len(df) / max(elapsed, 1e-9):.0f} rows/s)")
+        return len(df)
 
     def _get_summary(self) -> DataFrame:
         """
@@ -191,32 +310,34 @@ class DBFilter:
 
     def _get_filtered(self) -> DataFrame:
         """
-        Filter dataset to contain 10 smallest cases per unique exception AND traceback
+        Filter dataset to contain max_cases (default: 10) smallest cases per unique exception AND traceback
         generate case id for semantic grouping of similar errors. (e.g., ExceptionType@file.py:42)
         """
         failed_runs = self._df[self._df.is_successful == 0].copy()
-        # enrich dewolf errors data
-        failed_runs["error_file_path"] = failed_runs["dewolf_traceback"].apply(self._get_last_file_path)
-        failed_runs["error_line"] = failed_runs["dewolf_traceback"].apply(self._get_last_line_number)
-        # case id: ExceptionType@file.py:42
-        failed_runs["case_group"] = (
-            failed_runs["dewolf_exception"].str.split().str[0].str.strip(": ")
-            + "@"
-            + failed_runs["error_file_path"].str.split("/").str[-1]
-            + ":"
-            + failed_runs["error_line"]
-        )
+        # enrich dewolf errors data, case id: ExceptionType@file.py:42
+        failed_runs = tracebacks.add_case_groups(failed_runs)
         errors_per_group_count = failed_runs["case_group"].value_counts()
         failed_runs["errors_per_group_count_pre_filter"] = failed_runs["case_group"].map(errors_per_group_count)
         # truncate traceback
-        failed_runs["dewolf_traceback"] = failed_runs["dewolf_traceback"].apply(self.truncate_middle)
+        failed_runs["dewolf_traceback"] = tracebacks.truncate_middle(failed_runs["dewolf_traceback"])
         # filter n smallest unique per exception and traceback
-        f = lambda x: x.nsmallest(10, "function_basic_block_count")
-        filtered_df = failed_runs.groupby(["dewolf_exception", "dewolf_traceback"]).apply(f)
+        filtered_df = self.smallest_per_group(failed_runs, self.GROUP_KEYS, "function_basic_block_count", self._max_cases)
         filtered_df["tag"] = self._tag
-        assert isinstance(filtered_df, DataFrame)
         return filtered_df.reset_index(drop=True)
 
+    @staticmethod
+    def smallest_per_group(df: DataFrame, keys: List[str], by: str, k: int) -> DataFrame:
+        """
+        Select the k rows with the smallest 'by' value per group,
+        same result as df.groupby(keys).apply(lambda x: x.nsmallest(k, by)) without a Python call per group.
+        Groups are ordered by key, rows by 'by' (NaN last), ties keep row order.
+        """
+        # compact integer code per group (sorted by key, -1 for NaN keys, which groupby drops)
+        group_codes = df.groupby(keys, sort=True).ngroup()
+        ranked = df.assign(_group_code=group_codes)[group_codes >= 0]
+        ranked = ranked.sort_values(["_group_code", by], kind="stable")
+        return ranked[ranked.groupby("_group_code").cumcount() < k].drop(columns="_group_code")
+
     @staticmethod
     def truncate_middle(s, n=4000, indicator="... TRUNCATED ..."):
         """
@@ -247,9 +368,9 @@ class DBFilter:
 
     @property
     def samples(self) -> DataFrame:
-        if self._summary is None:
-            self._summary = self._get_samples()
-        return self._summary
+        if self._samples is None:
+            self._samples = self._get_samples()
+        return self._samples
 
     @property
     def filtered(self) -> DataFrame:
@@ -258,18 +379,411 @@ class DBFilter:
         return self._filtered
 
     def write(self, file_path: Path):
-        # create tables
-        with sqlite3.connect(file_path) as con:
+        # filter before opening the transaction, so the write lock is only held while inserting
+        summary, filtered = self.summary, self.filtered
+        with self._connect(file_path) as con:
             cursor = con.cursor()
-            cursor.execute(self.ISSUE_SCHEMA)
-            con.commit()
-            cursor.execute(self.ERROR_SCHEMA)
-            con.commit()
-            cursor.execute(self.SUMMARY_SCHEMA)
+            # one transaction for schemas, summary, and filtered rows
+            cursor.execute("BEGIN")
+            for schema in (self.ISSUE_SCHEMA, self.ERROR_SCHEMA, self.SUMMARY_SCHEMA, self.REPRESENTATIVES_SCHEMA):
+                cursor.execute(schema)
+            self._create_indexes(cursor)
+            self._create_search_index(cursor)
+            self._insert_df(cursor, summary, "summary")
+            self._insert_df(cursor, filtered, "dewolf_errors")
+            commits = [] if filtered.empty else filtered["dewolf_current_commit"].unique()
+            for commit in commits:
+                self._update_representatives(cursor, commit, self.tag)
+
+
+class StreamingDBFilter(DBFilter):
+    """
+    DBFilter that reads samples.sqlite3 in chunks instead of loading the whole table into one DataFrame.
+    summary and samples are aggregated chunk by chunk over the columns they need,
+    filtered keeps at most max_cases candidates per (exception, traceback) group.
+    Peak memory depends on chunksize and the number of samples/groups, not on the number of rows.
+    """
+
+    STATS_QUERY = """SELECT sample_hash, dewolf_current_commit, function_platform, binaryninja_version, is_successful,
+        timestamp, dewolf_decompilation_time, dewolf_max_basic_blocks, sample_total_function_count,
+        sample_decompilable_function_count,
+        CASE WHEN is_successful = 0 THEN dewolf_exception END AS failed_exception,
+        CASE WHEN is_successful = 0 THEN dewolf_traceback END AS failed_traceback
+        FROM dewolf"""
+    FAILED_QUERY = "SELECT * FROM dewolf WHERE is_successful = 0"
+    SAMPLE_KEYS = ["sample_hash", "dewolf_current_commit"]
+
+    def __init__(
+        self, file_path: Union[str, Path], tag: Optional[str] = None, chunksize: int = 100_000, max_cases: int = 10
+    ):
+        super().__init__(DataFrame(), tag, max_cases=max_cases)
+        self._file_path = file_path
+        self._chunksize = chunksize
+        self._failed_query_params = ()
+        self._stats = None
+
+    @classmethod
+    def from_file(cls, file_path, chunksize: int = 100_000, max_cases: int = 10):
+        return cls(file_path, chunksize=chunksize, max_cases=max_cases)
+
+    @property
+    def is_empty(self):
+        """The is_empty property."""
+        with sqlite3.connect(self._file_path) as con:
+            return con.execute("SELECT NOT EXISTS (SELECT 1 FROM dewolf)").fetchone()[0] == 1
+
+    def _iter_chunks(self, query: str, params: tuple = ()) -> Iterator[DataFrame]:
+        """Yield the result of query in DataFrames of at most chunksize rows"""
+        with sqlite3.connect(self._file_path) as con:
+            for chunk in read_sql_query(query, con, params=params, chunksize=self._chunksize):
+                chunk["timestamp"] = to_datetime(chunk["timestamp"], format="mixed")
+                yield chunk
+
+    def _get_stats(self) -> Tuple[DataFrame, DataFrame]:
+        """Summary and per sample statistics, aggregated on first use"""
+        if self._stats is None:
+            self._stats = self._aggregate_stats()
+        return self._stats
+
+    def _aggregate_stats(self) -> Tuple[DataFrame, DataFrame]:
+        """
+        Single pass over the light-weight columns, computes summary and per sample statistics
+        """
+        commits = {}
+        total_functions = total_errors = 0
+        time_sum, time_count = 0.0, 0
+        exceptions, tracebacks, sample_hashes = set(), set(), set()
+        samples = {}
+        for chunk in self._iter_chunks(self.STATS_QUERY):
+            commits.update(dict.fromkeys(chunk.dewolf_current_commit.unique()))
+            failed = chunk[chunk.is_successful == 0]
+            total_functions += len(chunk)
+            total_errors += len(failed)
+            times = chunk.dewolf_decompilation_time.dropna()
+            time_sum += times.sum()
+            time_count += len(times)
+            exceptions.update(failed.failed_exception.unique())
+            tracebacks.update(failed.failed_traceback.unique())
+            sample_hashes.update(chunk.sample_hash.unique())
+            self._update_samples(samples, chunk)
+
+        if len(commits) != 1:
+            logging.error(f"expect exactly one commit in samples.sqlite3. Got: {list(commits)}")
+            raise ValueError("Non-unique commit data")
+        summary = {
+            "id": 0,
+            "dewolf_current_commit": next(iter(commits)),
+            "avg_dewolf_decompilation_time": time_sum / time_count if time_count else float("nan"),
+            "total_functions": total_functions,
+            "total_errors": total_errors,
+            "unique_exceptions": len(exceptions),
+            "unique_tracebacks": len(tracebacks),
+            "processed_samples": len(sample_hashes),
+            "tag": self.tag,
+        }
+        return DataFrame(summary, index=[0]), self._samples_to_df(samples)
+
+    def _update_samples(self, samples: dict, chunk: DataFrame):
+        """Merge per sample statistics of chunk into samples (dict keyed by sample hash and commit)"""
+        chunk = chunk.assign(count_error=chunk.is_successful == 0, count_success=chunk.is_successful == 1)
+        grouped = chunk.groupby(self.SAMPLE_KEYS, sort=False)
+        counts = grouped.agg(
+            count_error=("count_error", "sum"),
+            count_success=("count_success", "sum"),
+            count_total_processed=("is_successful", "count"),
+            timestamp_min=("timestamp", "min"),
+            timestamp_max=("timestamp", "max"),
+        )
+        firsts = grouped.head(1).set_index(self.SAMPLE_KEYS)
+        for key, row in counts.iterrows():
+            if (sample := samples.get(key)) is None:
+                first = firsts.loc[key]
+                sample = samples[key] = {
+                    "platform": {},
+                    "binaryninja_version": {},
+                    "count_error": 0,
+                    "count_success": 0,
+                    "count_total_processed": 0,
+                    "timestamp_min": row.timestamp_min,
+                    "timestamp_max": row.timestamp_max,
+                    "dewolf_max_basic_blocks": first.dewolf_max_basic_blocks,
+                    "sample_total_function_count": first.sample_total_function_count,
+                    "sample_decompilable_function_count": first.sample_decompilable_function_count,
+                }
+            sample["count_error"] += row.count_error
+            sample["count_success"] += row.count_success
+            sample["count_total_processed"] += row.count_total_processed
+            sample["timestamp_min"] = min(sample["timestamp_min"], row.timestamp_min)
+            sample["timestamp_max"] = max(sample["timestamp_max"], row.timestamp_max)
+        # keep order of first appearance, like pandas.unique
+        for column, target in (("function_platform", "platform"), ("binaryninja_version", "binaryninja_version")):
+            for sample_hash, commit, value in chunk[self.SAMPLE_KEYS + [column]].drop_duplicates().itertuples(index=False):
+                samples[(sample_hash, commit)][target][value] = None
+
+    @staticmethod
+    def _samples_to_df(samples: dict) -> DataFrame:
+        rows = []
+        for (sample_hash, commit), sample in sorted(samples.items()):
+            rows.append(
+                {
+                    "sample_hash": sample_hash,
+                    "dewolf_current_commit": commit,
+                    "platform": ",".join(sample["platform"]),
+                    "binaryninja_version": ",".join(sample["binaryninja_version"]),
+                    "count_error": sample["count_error"],
+                    "count_success": sample["count_success"],
+                    "count_total_processed": sample["count_total_processed"],
+                    "timestamp": sample["timestamp_min"],
+                    "duration_seconds": (sample["timestamp_max"] - sample["timestamp_min"]).total_seconds(),
+                    "dewolf_max_basic_blocks": sample["dewolf_max_basic_blocks"],
+                    "sample_total_function_count": sample["sample_total_function_count"],
+                    "sample_decompilable_function_count": sample["sample_decompilable_function_count"],
+                }
+            )
+        df = DataFrame(rows)
+        df["id"] = df.index
+        return df
+
+    def _get_summary(self) -> DataFrame:
+        return self._get_stats()[0]
+
+    def _get_samples(self) -> DataFrame:
+        return self._get_stats()[1]
+
+    def _get_filtered(self) -> DataFrame:
+        """
+        Stream failed runs, keep the max_cases smallest candidates per unique exception AND traceback.
+        Candidates precede the rows of later chunks, so ties are resolved by row order.
+        """
+        filtered_df = None
+        errors_per_group_count = Counter()
+        for chunk in self._iter_chunks(self.FAILED_QUERY, self._failed_query_params):
+            if chunk.empty:
+                continue  # the empty result of a query without rows, its columns have no dtypes
+            chunk = tracebacks.add_case_groups(chunk)
+            errors_per_group_count.update(chunk["case_group"].dropna())
+            chunk["dewolf_traceback"] = tracebacks.truncate_middle(chunk["dewolf_traceback"])
+            candidates = chunk if filtered_df is None else concat([filtered_df, chunk], ignore_index=True)
+            filtered_df = self.smallest_per_group(candidates, self.GROUP_KEYS, "function_basic_block_count", self._max_cases)
+        if filtered_df is None:
+            # no failed runs: no rows, but the columns and dtypes of filtered rows (dtypes inferred from a row, like DBFilter)
+            filtered_df = tracebacks.add_case_groups(next(self._iter_chunks("SELECT * FROM dewolf LIMIT 1")).iloc[:0])
+        filtered_df["errors_per_group_count_pre_filter"] = filtered_df["case_group"].map(dict(errors_per_group_count))
+        filtered_df["tag"] = self._tag
+        return filtered_df.reset_index(drop=True)
+
+
+class SQLiteDBFilter(StreamingDBFilter):
+    """
+    StreamingDBFilter that pushes the summary and per sample aggregation down into SQLite (GROUP BY and window functions).
+    Results match the pandas implementation, which remains as fallback if the SQLite version lacks window functions.
+    """
+
+    COMMITS_QUERY = "SELECT DISTINCT dewolf_current_commit FROM dewolf"
+    # COUNT(DISTINCT ..) ignores NULL, pandas.unique counts it as a value
+    SUMMARY_QUERY = """SELECT
+        AVG(dewolf_decompilation_time) AS avg_dewolf_decompilation_time,
+        COUNT(*) AS total_functions,
+        COALESCE(SUM(is_successful = 0), 0) AS total_errors,
+        COUNT(DISTINCT CASE WHEN is_successful = 0 THEN dewolf_exception END)
+            + COALESCE(MAX(is_successful = 0 AND dewolf_exception IS NULL), 0) AS unique_exceptions,
+        COUNT(DISTINCT CASE WHEN is_successful = 0 THEN dewolf_traceback END)
+            + COALESCE(MAX(is_successful = 0 AND dewolf_traceback IS NULL), 0) AS unique_tracebacks,
+        COUNT(DISTINCT sample_hash) + COALESCE(MAX(sample_hash IS NULL), 0) AS processed_samples
+        FROM dewolf
+    """
+    # parts: one scan over dewolf, everything after works on (sample, platform, version) combinations.
+    # unique values are concatenated in order of first appearance, like pandas.unique
+    SAMPLES_QUERY = """WITH parts AS (
+            SELECT sample_hash, dewolf_current_commit, function_platform, binaryninja_version,
+                SUM(is_successful = 0) AS count_error,
+                SUM(is_successful = 1) AS count_success,
+                COUNT(is_successful) AS count_total_processed,
+                MIN(timestamp) AS timestamp_min,
+                MAX(timestamp) AS timestamp_max,
+                MIN(rowid) AS first_rowid
+            FROM dewolf
+            WHERE sample_hash IS NOT NULL AND dewolf_current_commit IS NOT NULL
+            GROUP BY sample_hash, dewolf_current_commit, function_platform, binaryninja_version
+        ),
+        ranked AS (
+            SELECT *,
+                ROW_NUMBER() OVER (
+                    PARTITION BY sample_hash, dewolf_current_commit, function_platform ORDER BY first_rowid
+                ) = 1 AS is_first_platform,
+                ROW_NUMBER() OVER (
+                    PARTITION BY sample_hash, dewolf_current_commit, binaryninja_version ORDER BY first_rowid
+                ) = 1 AS is_first_version
+            FROM parts
+        ),
+        samples AS (
+            SELECT sample_hash, dewolf_current_commit,
+                group_concat(CASE WHEN is_first_platform THEN function_platform END) OVER w AS platform,
+                group_concat(CASE WHEN is_first_version THEN binaryninja_version END) OVER w AS binaryninja_version,
+                SUM(count_error) OVER w AS count_error,
+                SUM(count_success) OVER w AS count_success,
+                SUM(count_total_processed) OVER w AS count_total_processed,
+                MIN(timestamp_min) OVER w AS timestamp,
+                MAX(timestamp_max) OVER w AS timestamp_max,
+                ROW_NUMBER() OVER w AS part_number,
+                first_rowid
+            FROM ranked
+            WINDOW w AS (
+                PARTITION BY sample_hash, dewolf_current_commit ORDER BY first_rowid
+                ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING
+            )
+        )
+        SELECT s.sample_hash, s.dewolf_current_commit, s.platform, s.binaryninja_version,
+            s.count_error, s.count_success, s.count_total_processed, s.timestamp, s.timestamp_max,
+            d.dewolf_max_basic_blocks, d.sample_total_function_count, d.sample_decompilable_function_count
+        FROM samples s
+        JOIN dewolf d ON d.rowid = s.first_rowid
+        WHERE s.part_number = 1
+        ORDER BY s.sample_hash, s.dewolf_current_commit
+    """
+
+    def _get_summary(self) -> DataFrame:
+        """
+        Return DataFrame containing summary statistics over all samples
+        """
+        try:
+            with sqlite3.connect(self._file_path) as con:
+                commits = [commit for commit, in con.execute(self.COMMITS_QUERY)]
+                stats = read_sql_query(self.SUMMARY_QUERY, con)
+        except sqlite3.OperationalError as ex:
+            logging.warning(f"SQL aggregation failed ({ex}), falling back to pandas")
+            return super()._get_summary()
+        if len(commits) != 1:
+            logging.error(f"expect exactly one commit in samples.sqlite3. Got: {commits}")
+            raise ValueError("Non-unique commit data")
+        summary = {"id": 0, "dewolf_current_commit": commits[0], **stats.to_dict("records")[0], "tag": self.tag}
+        return DataFrame(summary, index=[0])
+
+    def _get_samples(self) -> DataFrame:
+        """
+        Return DataFrame containing per sample statistics
+        """
+        try:
+            with sqlite3.connect(self._file_path) as con:
+                samples = read_sql_query(self.SAMPLES_QUERY, con)
+        except sqlite3.OperationalError as ex:
+            logging.warning(f"SQL aggregation failed ({ex}), falling back to pandas")
+            return super()._get_samples()
+        samples["timestamp"] = to_datetime(samples["timestamp"], format="mixed")
+        timestamp_max = to_datetime(samples.pop("timestamp_max"), format="mixed")
+        samples.insert(samples.columns.get_loc("timestamp") + 1, "duration_seconds", (timestamp_max - samples["timestamp"]).dt.total_seconds())
+        samples["id"] = samples.index
+        return samples
+
+
+class IncrementalDBFilter(SQLiteDBFilter):
+    """
+    SQLiteDBFilter that only filters rows added to samples.sqlite3 since its last run.
+    The high-water mark (last processed rowid) is kept per commit, tag, and input file in filter_progress.
+    New candidates are merged into the smallest cases of the commit and tag already in filtered.sqlite3,
+    errors_per_group_count_pre_filter is updated in place, and the summary row of the input file is replaced.
+    """
+
+    PROGRESS_SCHEMA = """CREATE TABLE IF NOT EXISTS filter_progress (
+        id INTEGER NOT NULL PRIMARY KEY,
+        dewolf_current_commit TEXT,
+        tag TEXT,
+        source TEXT,
+        last_rowid INTEGER,
+        summary_id INTEGER,
+        updated_at TEXT
+    )
+    """
+    FAILED_QUERY = "SELECT * FROM dewolf WHERE is_successful = 0 AND rowid > ? AND rowid <= ?"
+    # keep max_cases per exception and traceback, ordered like DBFilter.smallest_per_group (NULL last, ties by row)
+    PRUNE_QUERY = """DELETE FROM dewolf_errors WHERE id IN (
+        SELECT id FROM (
+            SELECT id, ROW_NUMBER() OVER (
+                PARTITION BY dewolf_exception, dewolf_traceback
+                ORDER BY function_basic_block_count IS NULL, function_basic_block_count, id
+            ) AS case_number
+            FROM dewolf_errors
+            WHERE dewolf_current_commit = ? AND tag IS ?
+        )
+        WHERE case_number > ?
+    )
+    """
+
+    @property
+    def source(self) -> str:
+        """Identity of the input file, samples.sqlite3 is rotated by renaming"""
+        stat = os.stat(self._file_path)
+        return f"{stat.st_dev}:{stat.st_ino}"
+
+    def write(self, file_path: Path):
+        commit = self.summary.dewolf_current_commit[0]
+        with sqlite3.connect(self._file_path) as con:
+            max_rowid = con.execute("SELECT COALESCE(MAX(rowid), 0) FROM dewolf").fetchone()[0]
+        with self._connect(file_path) as con:
+            cursor = con.cursor()
+            for schema in (self.ISSUE_SCHEMA, self.ERROR_SCHEMA, self.SUMMARY_SCHEMA, self.REPRESENTATIVES_SCHEMA, self.PROGRESS_SCHEMA):
+                cursor.execute(schema)
+            self._create_indexes(cursor)
+            self._create_search_index(cursor)
+            progress = cursor.execute(
+                "SELECT id, last_rowid, summary_id FROM filter_progress WHERE dewolf_current_commit = ? AND tag IS ? AND source = ?",
+                (commit, self.tag, self.source),
+            ).fetchone()
+            progress_id, last_rowid, summary_id = progress or (None, 0, None)
+            if max_rowid <= last_rowid:
+                logging.info(f"no new rows since rowid {last_rowid}")
+                return
+            logging.info(f"filtering rows {last_rowid + 1} to {max_rowid}")
+            self._failed_query_params = (last_rowid, max_rowid)
+            summary_id = self._write_summary(cursor, summary_id)
+            self._merge_filtered(cursor, commit)
+            if progress_id is None:
+                cursor.execute(
+                    "INSERT INTO filter_progress (dewolf_current_commit, tag, source, last_rowid, summary_id, updated_at) VALUES (?, ?, ?, ?, ?, datetime('now'))",
+                    (commit, self.tag, self.source, max_rowid, summary_id),
+                )
+            else:
+                cursor.execute(
+                    "UPDATE filter_progress SET last_rowid = ?, summary_id = ?, updated_at = datetime('now') WHERE id = ?",
+                    (max_rowid, summary_id, progress_id),
+                )
             con.commit()
 
-        self._write_df_to_sqlite3(self.summary, file_path, table_name="summary", append=True)
-        self._write_df_to_sqlite3(self.filtered, file_path, table_name="dewolf_errors", append=True)
+    def _write_summary(self, cursor: sqlite3.Cursor, summary_id: Optional[int]) -> int:
+        """Replace summary row of the input file (summary is always computed over the whole input), return its id"""
+        summary = self.summary.drop(columns="id")
+        if summary_id is not None:
+            assignments = ", ".join(f"{column} = ?" for column in summary.columns)
+            values = summary.astype(object).where(summary.notna(), None).iloc[0].tolist()
+            cursor.execute(f"UPDATE summary SET {assignments} WHERE id = ?", (*values, summary_id))
+            if cursor.rowcount == 1:
+                return summary_id
+        self._insert_df(cursor, summary, "summary")
+        return cursor.execute("SELECT last_insert_rowid()").fetchone()[0]
+
+    def _merge_filtered(self, cursor: sqlite3.Cursor, commit: str):
+        """Merge smallest cases of the new rows into dewolf_errors of commit and tag"""
+        filtered = self.filtered
+        if filtered.empty:
+            return
+        existing_counts = dict(
+            cursor.execute(
+                """SELECT case_group, MAX(errors_per_group_count_pre_filter) FROM dewolf_errors
+                WHERE dewolf_current_commit = ? AND tag IS ? GROUP BY case_group""",
+                (commit, self.tag),
+            )
+        )
+        new_counts = filtered.drop_duplicates("case_group").set_index("case_group")["errors_per_group_count_pre_filter"]
+        totals = {case_group: existing_counts.get(case_group, 0) + int(count) for case_group, count in new_counts.items()}
+        cursor.executemany(
+            """UPDATE dewolf_errors SET errors_per_group_count_pre_filter = ?
+            WHERE dewolf_current_commit = ? AND tag IS ? AND case_group = ?""",
+            [(total, commit, self.tag, case_group) for case_group, total in totals.items()],
+        )
+        filtered = filtered.assign(errors_per_group_count_pre_filter=filtered["case_group"].map(totals))
+        self._insert_df(cursor, filtered, "dewolf_errors")
+        cursor.execute(self.PRUNE_QUERY, (commit, self.tag, self._max_cases))
+        self._update_representatives(cursor, commit, self.tag)
 
 
 def print_sample_hashes(db_file: Path, commit: str = ""):
@@ -289,14 +803,196 @@ def print_sample_hashes(db_file: Path, commit: str = ""):
         cursor.close()
 
 
-def print_slow_sample_hashes(db_file: Path, duration: int):
+WORKLIST_QUERY = """SELECT DISTINCT sample_hash, function_name FROM dewolf_errors
+    WHERE dewolf_current_commit LIKE ? AND sample_hash IS NOT NULL AND function_name IS NOT NULL
+    ORDER BY sample_hash, function_name
+"""
+
+
+def print_worklist(db_file: Path, commit: str):
+    """Print failed functions of a commit as '<sample hash>\\t<function name>', grouped by sample (scheduler.py input)"""
+    with sqlite3.connect(db_file) as con:
+        for sample_hash, function_name in con.execute(WORKLIST_QUERY, (commit[:8] + "%",)):
+            print(f"{sample_hash}\t{function_name}", flush=True)
+
+
+def differential_report(db_file: Path, baseline_db: Path, commit: str) -> DataFrame:
+    """
+    Compare a differential run (samples.sqlite3 of the --worklist of commit) with the errors of commit in baseline_db.
+    Per case group: functions that are fixed, still fail with the same case group, fail with another case group
+    (changed), or were not run, and functions failing with a case group that is new in the differential run.
+    """
+    with sqlite3.connect(baseline_db) as con:
+        before = read_sql_query(
+            "SELECT DISTINCT sample_hash, function_name, case_group FROM dewolf_errors WHERE dewolf_current_commit LIKE ?",
+            con,
+            params=(commit[:8] + "%",),
+        )
+    with sqlite3.connect(db_file) as con:
+        after = read_sql_query("SELECT sample_hash, function_name, is_successful, dewolf_exception, dewolf_traceback FROM dewolf", con)
+    failed = after[after["is_successful"] == 0].copy()
+    after["case_group_after"] = None
+    if not failed.empty:
+        after.loc[failed.index, "case_group_after"] = tracebacks.add_case_groups(failed)["case_group"]
+    keys = ["sample_hash", "function_name"]
+    after = after.drop_duplicates(keys, keep="last")[keys + ["case_group_after"]]
+    compared = before.merge(after, on=keys, how="left", indicator=True)
+    compared["result"] = "changed"
+    compared.loc[compared["case_group_after"] == compared["case_group"], "result"] = "still_failing"
+    compared.loc[compared["case_group_after"].isna(), "result"] = "fixed"
+    compared.loc[compared["_merge"] == "left_only", "result"] = "not_run"
+    report = compared.groupby(["case_group", "result"]).size().unstack(fill_value=0)
+    new = after[after["case_group_after"].notna() & ~after["case_group_after"].isin(before["case_group"])]
+    report = concat([report, new.groupby("case_group_after").size().rename("new").rename_axis("case_group").to_frame()])
+    columns = ["fixed", "still_failing", "changed", "not_run", "new"]
+    return report.reindex(columns=columns).fillna(0).astype(int).sort_index()
+
+
+def print_differential_report(db_file: Path, baseline_db: Path, commit: str):
+    report = differential_report(db_file, baseline_db, commit)
+    if report.empty:
+        print(f"no errors of {commit} in {baseline_db}")
+        return
+    print(report.to_string())
+    totals = report.sum()
+    print(", ".join(f"{total} {column.replace('_', ' ')}" for column, total in totals.items()))
+
+
+# queries of the web app views (webapp/samples/views.py) and --list, with placeholder parameters
+VIEW_QUERIES = {
+    "index: representatives": (
+        """SELECT * FROM dewolf_errors WHERE id IN (
+            SELECT dewolf_error_id FROM case_group_representatives WHERE dewolf_current_commit = ? AND tag = ?
+        ) ORDER BY errors_per_group_count_pre_filter DESC""",
+        ("0123abcd", "quick"),
+    ),
+    "index: representatives (untagged)": (
+        """SELECT * FROM dewolf_errors WHERE id IN (
+            SELECT dewolf_error_id FROM case_group_representatives WHERE dewolf_current_commit = ? AND tag IS NULL
+        ) ORDER BY errors_per_group_count_pre_filter DESC""",
+        ("0123abcd",),
+    ),
+    "index: smallest per case group (fallback)": (
+        """SELECT * FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY case_group ORDER BY function_basic_block_count) AS row_number
+            FROM dewolf_errors WHERE dewolf_current_commit = ? AND tag = ?
+        ) WHERE row_number = 1 ORDER BY errors_per_group_count_pre_filter DESC""",
+        ("0123abcd", "quick"),
+    ),
+    "search: sample hash prefix": ("SELECT * FROM dewolf_errors WHERE sample_hash LIKE ? ESCAPE '\\'", ("abcd%",)),
+    "case: related cases": (
+        "SELECT * FROM dewolf_errors WHERE case_group = ? AND NOT id = ? ORDER BY function_basic_block_count LIMIT 10",
+        ("ValueError@cfg.py:42", 1),
+    ),
+    "index/case: issues of the case groups on the page": (
+        "SELECT * FROM samples_githubissue WHERE case_group IN (?, ?) ORDER BY id",
+        ("ValueError@cfg.py:42", "KeyError@cfg.py:7"),
+    ),
+    "update issues: issue by number": ("SELECT * FROM samples_githubissue WHERE number = ? LIMIT 21", (1,)),
+    "list: sample hashes of commit": ("SELECT DISTINCT sample_hash FROM dewolf_errors WHERE dewolf_current_commit LIKE ?", ("0123abcd%",)),
+}
+
+
+def explain_view_queries(db_file: Path) -> int:
+    """Print EXPLAIN QUERY PLAN of the web app queries on filtered.sqlite3, return number of full table scans"""
+    full_scans = 0
+    with sqlite3.connect(db_file) as con:
+        tables = {name for (name,) in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for name, (query, params) in VIEW_QUERIES.items():
+            print(f"{name}:")
+            try:
+                plan = con.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall()
+            except sqlite3.OperationalError as ex:
+                print(f"\t{ex}")
+                continue
+            for _, _, _, detail in plan:
+                # 'SCAN <table>' without index reads every row, 'SEARCH' and scans of subqueries are fine
+                words = detail.split()
+                is_full_scan = words[0] == "SCAN" and words[1] in tables and "INDEX" not in words
+                full_scans += is_full_scan
+                print(f"\t{detail}{'  <-- full table scan' if is_full_scan else ''}")
+    return full_scans
+
+
+SLOW_SAMPLES_INDEX = "CREATE INDEX IF NOT EXISTS idx_dewolf_sample_hash_timestamp ON dewolf(sample_hash, timestamp)"
+# timestamp ('YYYY-MM-DD HH:MM:SS[.ffffff]') in integer microseconds, exact unlike julianday() floats
+# (SQLite date functions round fractional seconds to milliseconds, so only the whole seconds are passed to strftime)
+TIMESTAMP_MICROSECONDS = """(CAST(strftime('%s', substr(timestamp, 1, 19)) AS INTEGER) * 1000000 + CASE WHEN instr(timestamp, '.')
+    THEN CAST(substr(substr(timestamp, instr(timestamp, '.') + 1) || '000000', 1, 6) AS INTEGER) ELSE 0 END)"""
+# whole seconds between a function and the next function of the same sample, truncated like the previous pandas
+# implementation (total_seconds().astype(int)); the index covers partition and order
+SLOW_SAMPLES_QUERY = {
+    "timestamp": f"""SELECT DISTINCT sample_hash FROM (
+            SELECT sample_hash, (
+                LEAD({TIMESTAMP_MICROSECONDS}) OVER (PARTITION BY sample_hash ORDER BY timestamp) - {TIMESTAMP_MICROSECONDS}
+            ) / 1000000 AS duration_seconds
+            FROM dewolf
+            WHERE sample_hash IS NOT NULL
+        )
+        WHERE duration_seconds >= ?
+    """,
+    "decompilation_time": """SELECT DISTINCT sample_hash FROM dewolf
+        WHERE sample_hash IS NOT NULL AND dewolf_decompilation_time >= ?
+    """,
+}
+
+
+def print_slow_sample_hashes(db_file: Path, duration: int, metric: str = "timestamp"):
     """Given path to samples.sqlite3 and duration in seconds:
-    print sample hashes of samples that contain a function with decompilation time of more than 'duration' seconds"""
-    df = DBFilter.from_file(db_file)._df
-    diff_shift = lambda x: x["timestamp"].diff().shift(-1).dt.total_seconds()
-    df["duration_seconds"] = df.groupby("sample_hash").apply(diff_shift).droplevel(0).fillna(-1).astype("int")
-    for sample_hash in df[df.duration_seconds >= duration]["sample_hash"].unique():
-        print(sample_hash)
+    print sample hashes of samples that contain a function with decompilation time of more than 'duration' seconds.
+    metric 'timestamp' measures the time until the next function of the sample was recorded (includes timeouts),
+    'decompilation_time' uses the recorded dewolf_decompilation_time. Hashes are printed as soon as they are found."""
+    with sqlite3.connect(db_file) as con:
+        if metric == "timestamp":
+            try:
+                con.execute(SLOW_SAMPLES_INDEX)
+            except sqlite3.OperationalError as ex:
+                logging.warning(f"could not create index on {db_file}: {ex}")
+        for (sample_hash,) in con.execute(SLOW_SAMPLES_QUERY[metric], (duration,)):
+            print(sample_hash, flush=True)
+
+
+DETECTION_QUERY = "SELECT timestamp, dewolf_exception, dewolf_traceback FROM dewolf WHERE is_successful = 0"
+
+
+def detection_times(db_file: Path, known_db: Optional[Path] = None, chunksize: int = 100_000) -> DataFrame:
+    """
+    Seconds from the start of a run (samples.sqlite3 or a rotated <tag>_<commit>.sqlite3) to the first error of each
+    crash group. A group is new if known_db (filtered.sqlite3) has no error of it for another commit.
+    """
+    first_seen = {}
+    with sqlite3.connect(db_file) as con:
+        commit, start = con.execute("SELECT dewolf_current_commit, MIN(timestamp) FROM dewolf").fetchone()
+        for chunk in read_sql_query(DETECTION_QUERY, con, chunksize=chunksize):
+            chunk = tracebacks.add_case_groups(chunk)
+            for case_group, timestamp in chunk.groupby("case_group")["timestamp"].min().items():
+                first_seen[case_group] = min(timestamp, first_seen.get(case_group, timestamp))
+    known = set()
+    if known_db is not None:
+        with sqlite3.connect(known_db) as con:
+            query = "SELECT DISTINCT case_group FROM dewolf_errors WHERE dewolf_current_commit IS NOT ?"
+            known = {case_group for (case_group,) in con.execute(query, (commit,))}
+    groups = DataFrame(list(first_seen.items()), columns=["case_group", "first_seen"])
+    groups["seconds"] = (to_datetime(groups["first_seen"], format="mixed") - to_datetime(start, format="mixed")).dt.total_seconds()
+    groups["new"] = ~groups["case_group"].isin(known)
+    return groups.sort_values("seconds", kind="stable").reset_index(drop=True)
+
+
+def print_detection_times(db_file: Path, known_db: Optional[Path] = None):
+    """Print time to first detection per crash group and a summary for the new groups"""
+    groups = detection_times(db_file, known_db)
+    if groups.empty:
+        print("no crash groups")
+        return
+    print(groups.to_string(index=False))
+    new = groups.loc[groups["new"], "seconds"]
+    if new.empty:
+        print(f"no new crash groups ({len(groups)} known)")
+        return
+    print(
+        f"{len(new)} new crash groups ({len(groups) - len(new)} known): first after {new.min():.0f}s, "
+        f"median {new.median():.0f}s, last after {new.max():.0f}s"
+    )
 
 
 def existing_file(path):
@@ -307,9 +1003,29 @@ def existing_file(path):
     return file_path
 
 
+@contextmanager
+def merged_input(files: List[Path]) -> Iterator[Path]:
+    """The input file, or a temporary samples.sqlite3 with the rows of all result shards (see collector.py)"""
+    if len(files) == 1:
+        yield files[0]
+        return
+    with tempfile.TemporaryDirectory() as directory:
+        merged = Path(directory) / "samples.sqlite3"
+        rows = Collector(merged).collect(files)
+        logging.info(f"merged {rows} rows of {len(files)} shards")
+        yield merged
+
+
 def parse_arguments() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Bug finding tool for dewolf decompiler")
-    parser.add_argument("-i", "--input", required=True, type=existing_file, help="Path to SQLite file")
+    parser.add_argument(
+        "-i",
+        "--input",
+        required=True,
+        type=existing_file,
+        nargs="+",
+        help="Path to SQLite file, or result shards of one run (data/results/*.sqlite3) that are merged first",
+    )
     parser.add_argument(
         "-o",
         "--output",
@@ -319,15 +1035,87 @@ def parse_arguments() -> argparse.Namespace:
     )
     parser.add_argument("-l", "--list", action="store_true", help="List sample hashes contained in SQLite DB")
     parser.add_argument("-s", "--slow", type=int, help="List samples with functions that take more than X seconds.")
+    parser.add_argument(
+        "--slow-metric",
+        choices=SLOW_SAMPLES_QUERY.keys(),
+        default="timestamp",
+        help="Duration of a function for --slow: time until the next function of the sample (timestamp, default) or dewolf_decompilation_time",
+    )
+    parser.add_argument(
+        "--detection-times",
+        action="store_true",
+        help="Print seconds from the start of the run (input: samples.sqlite3 or a rotated run) to the first error of each crash group",
+    )
+    parser.add_argument(
+        "--known",
+        type=existing_file,
+        help="With --detection-times: filtered.sqlite3, crash groups of other commits in it are not new",
+    )
+    parser.add_argument(
+        "--worklist",
+        action="store_true",
+        help="List '<sample hash>\\t<function name>' of the failed functions of --commit, for a differential run",
+    )
+    parser.add_argument(
+        "--differential",
+        type=existing_file,
+        help="Input is a differential run of the --worklist of --commit: compare it with the errors in this (filtered) DB",
+    )
     parser.add_argument("--commit", type=str, help="Filter by commit hash when listing sample hashes", required=False)
     parser.add_argument("--tag", type=str, help="Add a tag to filtered rows.", required=False)
     parser.add_argument("--init", action="store_true", help="Create tables and index if it does not exist")
+    parser.add_argument(
+        "--explain",
+        action="store_true",
+        help="Print query plans of the web app queries on the input (filtered) DB, exit 1 if any does a full table scan",
+    )
+    parser.add_argument(
+        "--max-cases",
+        type=int,
+        default=10,
+        help="Number of smallest cases kept per unique exception and traceback (default: 10)",
+    )
+    parser.add_argument(
+        "--sql",
+        action="store_true",
+        help="Aggregate summary and per sample statistics inside SQLite, stream filtered rows (see --chunksize).",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only filter rows added since the last incremental run and merge them into the output (implies --sql).",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        help="Stream input in chunks of X rows instead of loading it at once (bounded memory for large inputs).",
+    )
     return parser.parse_args()
 
 
 def main(args: argparse.Namespace) -> int:
+    if len(args.input) > 1 and (args.incremental or args.init):
+        logging.error("--incremental and --init need a single input, merge shards into samples.sqlite3 with collector.py")
+        return 1
+    with merged_input(args.input) as input_file:
+        return run(argparse.Namespace(**{**vars(args), "input": input_file}))
+
+
+def run(args: argparse.Namespace) -> int:
     if args.slow is not None:
-        print_slow_sample_hashes(args.input, args.slow)
+        print_slow_sample_hashes(args.input, args.slow, metric=args.slow_metric)
+        return 0
+    if args.worklist or args.differential:
+        if not args.commit:
+            logging.error("--worklist and --differential need --commit")
+            return 1
+        if args.worklist:
+            print_worklist(args.input, args.commit)
+        else:
+            print_differential_report(args.input, args.differential, args.commit)
+        return 0
+    if args.detection_times:
+        print_detection_times(args.input, known_db=args.known)
         return 0
     if args.list:
         print_sample_hashes(args.input, commit=args.commit)
@@ -335,8 +1123,17 @@ def main(args: argparse.Namespace) -> int:
     if args.init:
         DBFilter.init_db(args.input)
         return 0
+    if args.explain:
+        return 1 if explain_view_queries(args.input) else 0
     logging.info("filtering database")
-    f = DBFilter.from_file(args.input)
+    if args.incremental:
+        f = IncrementalDBFilter.from_file(args.input, chunksize=args.chunksize or 100_000, max_cases=args.max_cases)
+    elif args.sql:
+        f = SQLiteDBFilter.from_file(args.input, chunksize=args.chunksize or 100_000, max_cases=args.max_cases)
+    elif args.chunksize:
+        f = StreamingDBFilter.from_file(args.input, chunksize=args.chunksize, max_cases=args.max_cases)
+    else:
+        f = DBFilter.from_file(args.input, max_cases=args.max_cases)
     f.tag = args.tag
     if f.is_empty:
         logging.warning("empty df. is samples.sqlite3 empty?")
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Move binaries from infolder into the sample store (data/samples/ab/cd/<sha256>).
+
+Replaces the per-file `file`, `sha256sum`, and `mv` calls of worker.sh: the infolder is scanned once, file types
+are detected from magic bytes, and files are hashed in a process pool. Files that are not executables or object
+files are removed, as are samples that are already stored. Hashes of moved files are printed to stdout (e.g., for
+scheduler.py), every file is recorded in a CSV manifest.
+
+python ingest.py infolder data --manifest data/ingest_manifest.csv | python scheduler.py
+"""
+import argparse
+import csv
+import logging
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from webapp.samples.store import SampleStore
+from webapp.samples.utils import sha256sum
+
+MAGIC_SIZE = 20  # size of a COFF file header, the other types need less
+MACHO_MAGICS = {b"\xfe\xed\xfa\xce", b"\xfe\xed\xfa\xcf", b"\xce\xfa\xed\xfe", b"\xcf\xfa\xed\xfe"}
+# machine field of COFF object files (i386, amd64, ARM, ARMv7 Thumb, ARM64, IA64)
+COFF_MACHINES = {0x014C, 0x8664, 0x01C0, 0x01C4, 0xAA64, 0x0200}
+# COFF file header: machine, number of sections, timestamp, symbol table pointer, number of symbols, optional header size, flags
+COFF_HEADER = struct.Struct("<HHIIIHH")
+COFF_SECTION_HEADER_SIZE = 40
+MANIFEST_FIELDS = ["timestamp", "file_name", "sha256", "file_type", "size", "action"]
+INDEX_BATCH_SIZE = 100  # files added to the store per index transaction
+
+
+def file_type(header: bytes, size: int) -> Optional[str]:
+    """
+    Executable type from the first bytes (MAGIC_SIZE) of a file of the given size, None if not allowed.
+    Same types as the `file` filter of worker.sh (ELF, Mach-O, PE32, COFF, DOS executable).
+    """
+    if header.startswith(b"\x7fELF"):
+        return "ELF"
+    if header.startswith(b"MZ"):
+        return "PE/DOS"  # PE files start with a DOS header
+    if header[:4] in MACHO_MAGICS:
+        return "Mach-O"
+    if header.startswith(b"\xca\xfe\xba\xbe") and len(header) >= 8:
+        # universal binary, unless it is a Java class file (major version >= 45 instead of the number of architectures)
+        return "Mach-O" if struct.unpack(">I", header[4:8])[0] < 45 else None
+    if len(header) >= COFF_HEADER.size and is_coff_header(header[: COFF_HEADER.size], size):
+        return "COFF"
+    return None
+
+
+def is_coff_header(header: bytes, size: int) -> bool:
+    """
+    Whether header is a plausible COFF file header: the machine field alone matches many files (0x0200 is any file
+    starting with two zero bytes), so the file must also have sections and hold their headers and the symbol table.
+    """
+    machine, sections, _, symbol_table, _, optional_header_size, _ = COFF_HEADER.unpack(header)
+    return (
+        machine in COFF_MACHINES
+        and sections > 0
+        and COFF_HEADER.size + optional_header_size + sections * COFF_SECTION_HEADER_SIZE <= size
+        and symbol_table <= size
+    )
+
+
+def inspect(path: str) -> Tuple[str, Optional[str], Optional[str], int]:
+    """Return path, file type, sha256 (None if type not allowed), and size of a file (runs in a worker process)"""
+    with open(path, "rb") as f:
+        header = f.read(MAGIC_SIZE)
+        size = os.fstat(f.fileno()).st_size
+    kind = file_type(header, size)
+    sha256 = sha256sum(path) if kind is not None else None
+    return path, kind, sha256, size
+
+
+def scan(infolder: Path, limit: Optional[int] = None, min_age: float = 0) -> List[str]:
+    """Regular files in infolder (not recursive, without .gitignore), skip files modified in the last min_age seconds"""
+    modified_before = time.time() - min_age
+    with os.scandir(infolder) as entries:
+        files = (
+            entry.path
+            for entry in entries
+            if entry.is_file(follow_symlinks=False) and entry.name != ".gitignore" and (not min_age or entry.stat().st_mtime <= modified_before)
+        )
+        return list(islice(files, limit))
+
+
+def ingest(
+    infolder: Path, store: SampleStore, workers: Optional[int] = None, limit: Optional[int] = None, min_age: float = 0
+) -> Iterator[dict]:
+    """Inspect files of infolder in parallel, add executables to the store (in batches) and remove others"""
+    files = scan(infolder, limit, min_age)
+    if not files:
+        return
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        chunksize = max(1, min(256, len(files) // (4 * workers)))
+        inspected = pool.map(inspect, files, chunksize=chunksize)
+        while batch := list(islice(inspected, INDEX_BATCH_SIZE)):
+            for path, kind, _, _ in batch:
+                if kind is None:
+                    os.unlink(path)
+            added = iter(store.add_many((path, sha256, kind) for path, kind, sha256, _ in batch if kind is not None))
+            for path, kind, sha256, size in batch:
+                yield {
+                    "timestamp": datetime.now().isoformat(" ", "seconds"),
+                    "file_name": os.path.basename(path),
+                    "sha256": sha256,
+                    "file_type": kind,
+                    "size": size,
+                    "action": "removed" if kind is None else "moved" if next(added) else "duplicate",
+                }
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Move executables from infolder into the sample store")
+    parser.add_argument("infolder", type=Path, help="Directory of new files")
+    parser.add_argument("store", type=Path, help="Sample store directory (e.g., data)")
+    parser.add_argument("--manifest", type=Path, help="Append one CSV row per file to this manifest")
+    parser.add_argument("-w", "--workers", type=int, help="Number of hashing processes (default: number of CPUs)")
+    parser.add_argument("--limit", type=int, help="Ingest at most X files")
+    parser.add_argument("--min-age", type=float, default=0, help="Skip files modified in the last X seconds (still being written)")
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace) -> int:
+    start = time.perf_counter()
+    counts = {"moved": 0, "duplicate": 0, "removed": 0}
+    manifest_file = None
+    if args.manifest is not None:
+        write_header = not args.manifest.exists()
+        manifest_file = open(args.manifest, "a", newline="")
+        manifest = csv.DictWriter(manifest_file, fieldnames=MANIFEST_FIELDS)
+        if write_header:
+            manifest.writeheader()
+    try:
+        with SampleStore(args.store) as store:
+            for record in ingest(args.infolder, store, workers=args.workers, limit=args.limit, min_age=args.min_age):
+                counts[record["action"]] += 1
+                if manifest_file is not None:
+                    manifest.writerow(record)
+                if record["action"] == "moved":
+                    print(record["sha256"], flush=True)
+                elif record["action"] == "removed":
+                    logging.debug(f"removed {record['file_name']}: file type not allowed")
+    finally:
+        if manifest_file is not None:
+            manifest_file.close()
+    elapsed = time.perf_counter() - start
+    total = sum(counts.values())
+    logging.info(
+        f"ingested {total} files ({counts['moved']} moved, {counts['duplicate']} duplicates, {counts['removed']} removed) in {elapsed:.1f}s "
+        f"({total / elapsed if elapsed else 0:.0f} files/s)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parse_arguments()
+    sys.exit(main(args))
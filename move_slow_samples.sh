@@ -2,18 +2,11 @@
 
 # Create ./data/slow_samples.txt by:
 # python filter.py -i data/<commit_hash>.sqlite3 --slow 300 | tee -a data/slow_samples.txt
+# (hashes are printed as they are found; add --slow-metric decompilation_time to use the recorded decompilation time
+# instead of the time until the next function of the sample was recorded)
 FILE_LIST="./data/slow_samples.txt"
-DEST_DIR="./data/cold_storage/"
 
-# Check if the destination directory exists, if not create it
-if [ ! -d "$DEST_DIR" ]; then
-    echo "ERROR: $DEST_DIR does not exist."
-    exit 1
-fi
-
-# Loop through each line in the sample list 
-# and move sample from ./infolder and ./data/samples to ./data/cold_storage
-while IFS= read -r file; do
-    mv "./infolder/$file" "$DEST_DIR"
-    mv "./data/samples/$file" "$DEST_DIR"
-done < "$FILE_LIST"
+# Move samples from the hot tier (./data/samples) to cold storage (./data/cold_storage),
+# queued samples are unqueued so they are skipped in the current run
+source "$(pwd)/.venv/bin/activate"
+python -m webapp.samples.store move cold_storage < "$FILE_LIST"
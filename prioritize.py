@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Set priorities of the samples in the sample store, so likely crashing and cheap samples are processed first.
+
+History comes from the rotated `<tag>_<commit>.sqlite3` files of the last runs (newest first per sample):
+past duration, number of errors, and sample_decompilable_function_count. Samples that are case group
+representatives of the last commit are preferred, as they reproduce a known crash with a small function.
+Durations and timeouts recorded by scheduler.py override the history; samples that hit max_time in their last
+run are taken after all others (low-priority lane, see SampleStore.take). The number of functions per sample is
+stored as well, scheduler.py --shard-functions splits large samples by it.
+
+priority = crash rate (errors per processed function) * representative weight / expected seconds
+
+python prioritize.py --store data --filtered data/filtered.sqlite3
+"""
+import argparse
+import logging
+import re
+import sqlite3
+import statistics
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from webapp.samples.store import HOT, SampleStore
+
+HISTORY_FILE = re.compile(r"\w+_[0-9a-f]{40}\.sqlite3(\.~\d+~)?")  # rotated by worker.sh, with mv --backup suffix
+HISTORY_QUERY = """SELECT sample_hash,
+        count(*) AS processed_functions,
+        sum(is_successful = 0) AS errors,
+        max(sample_decompilable_function_count) AS decompilable_functions,
+        (julianday(max(timestamp)) - julianday(min(timestamp))) * 86400 AS seconds
+    FROM dewolf
+    WHERE sample_hash IS NOT NULL
+    GROUP BY sample_hash
+"""
+REPRESENTATIVES_QUERY = """SELECT DISTINCT e.sample_hash
+    FROM case_group_representatives r JOIN dewolf_errors e ON e.id = r.dewolf_error_id
+    WHERE r.dewolf_current_commit = (SELECT dewolf_current_commit FROM summary ORDER BY id DESC LIMIT 1)
+"""
+REPRESENTATIVE_WEIGHT = 4.0
+MIN_SECONDS = 1.0  # do not let samples with (nearly) no functions dominate
+
+
+def history_files(data_dir: Path, runs: int) -> List[Path]:
+    """Rotated samples.sqlite3 files of the last runs, newest first"""
+    files = [path for path in data_dir.iterdir() if HISTORY_FILE.fullmatch(path.name)]
+    return sorted(files, key=lambda path: path.stat().st_mtime, reverse=True)[:runs]
+
+
+def load_history(files: List[Path]) -> Dict[str, dict]:
+    """Per sample statistics of the newest run that processed the sample"""
+    history = {}
+    for file in files:
+        try:
+            with sqlite3.connect(f"file:{file}?mode=ro", uri=True) as con:
+                con.row_factory = sqlite3.Row
+                for row in con.execute(HISTORY_QUERY):
+                    history.setdefault(row["sample_hash"], dict(row))
+        except sqlite3.Error as ex:
+            logging.warning(f"skipping history file {file}: {ex}")
+    return history
+
+
+def load_representatives(filtered_db: Optional[Path]) -> Set[str]:
+    """Hashes of samples with a case group representative of the last commit"""
+    if filtered_db is None or not filtered_db.is_file():
+        return set()
+    try:
+        with sqlite3.connect(f"file:{filtered_db}?mode=ro", uri=True) as con:
+            return {sample_hash for (sample_hash,) in con.execute(REPRESENTATIVES_QUERY)}
+    except sqlite3.OperationalError as ex:
+        logging.warning(f"no case group representatives in {filtered_db}: {ex}")
+        return set()
+
+
+def priorities(
+    sample_hashes: List[str], history: Dict[str, dict], representatives: Set[str], recorded_seconds: Dict[str, float]
+) -> Dict[str, float]:
+    """Priority per sample, samples without history get the median priority"""
+    processed = sum(stats["processed_functions"] for stats in history.values())
+    seconds_per_function = sum(stats["seconds"] or 0 for stats in history.values()) / processed if processed else None
+    result = {}
+    for sample_hash in sample_hashes:
+        stats = history.get(sample_hash)
+        if stats is None:
+            continue
+        seconds = recorded_seconds.get(sample_hash, stats["seconds"])
+        if not seconds and seconds_per_function is not None:
+            seconds = (stats["decompilable_functions"] or stats["processed_functions"]) * seconds_per_function
+        crash_rate = (stats["errors"] + 1) / (stats["processed_functions"] + 2)
+        weight = REPRESENTATIVE_WEIGHT if sample_hash in representatives else 1.0
+        result[sample_hash] = crash_rate * weight / max(seconds or 0, MIN_SECONDS)
+    median = statistics.median(result.values()) if result else 0.0
+    return {sample_hash: result.get(sample_hash, median) for sample_hash in sample_hashes}
+
+
+def function_counts(history: Dict[str, dict]) -> Dict[str, int]:
+    """Functions per sample, processed rows count all shards of a sharded run"""
+    return {
+        sample_hash: max(stats["decompilable_functions"] or 0, stats["processed_functions"]) for sample_hash, stats in history.items()
+    }
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Set priorities of stored samples from the history of past runs")
+    parser.add_argument("--store", type=Path, default=Path("data"), help="Sample store directory with history files (default: data)")
+    parser.add_argument("--filtered", type=Path, default=Path("data/filtered.sqlite3"), help="Filtered DB with case group representatives")
+    parser.add_argument("--runs", type=int, default=3, help="Number of past runs (rotated SQLite files) to use (default: 3)")
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace) -> int:
+    files = history_files(args.store, args.runs)
+    history = load_history(files)
+    representatives = load_representatives(args.filtered)
+    with SampleStore(args.store) as store:
+        recorded = store.recorded_runs()
+        sample_hashes = list(store.hashes(HOT))
+        recorded_seconds = {sample_hash: seconds for sample_hash, (seconds, _) in recorded.items()}
+        store.set_priorities(priorities(sample_hashes, history, representatives, recorded_seconds), function_counts(history))
+    timed_out = sum(1 for sample_hash in sample_hashes if recorded.get(sample_hash, (None, False))[1])
+    logging.info(
+        f"prioritized {len(sample_hashes)} samples from {len(files)} runs: {sum(h in history for h in sample_hashes)} with history, "
+        f"{len(representatives & set(sample_hashes))} representatives, {timed_out} in the low-priority lane (timed out)"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parse_arguments()
+    sys.exit(main(args))
@@ -0,0 +1,679 @@
+#!/usr/bin/env python3
+"""
+Run dewolf's bugfinder on sample hashes with a fixed number of parallel slots.
+
+Sample hashes are read line by line (stdin or file) into a bounded queue. Each slot runs one blocking
+`docker run --rm` at a time and takes the next sample as soon as its container exits, so the pool is
+refilled on completion instead of polling `docker ps`. Tasks exceeding max_time are killed by container name.
+Lines of the form '<sample hash>\t<function name>' (filter.py --worklist) limit a sample to these functions
+(differential run, needs --samples-per-container), consecutive lines of a sample form one task.
+If data_dir has a sample store index, the duration and timeout of each sample are recorded for prioritize.py, and
+the processed sample is unqueued (samples taken with `store take --keep` stay queued until then).
+With collect_interval, each slot writes its own result shard in data/results, merged into samples.sqlite3 by
+collector.py every collect_interval seconds and at the end of the run (no contention on one SQLite writer lock).
+With min_workers, the number of active slots (at most workers) follows the load and memory of the host, see autoscale.py.
+
+find infolder -type f -printf "%f\\n" | python scheduler.py --workers 8 --max-time 600
+"""
+import argparse
+import json
+import logging
+import queue
+import re
+import shlex
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from itertools import groupby
+from typing import Iterator, List, NamedTuple, Optional, TextIO, Tuple, Union
+
+from autoscale import GIB, PoolSizer
+from collector import Collector, prepare_shard, shard_files
+from webapp.samples.store import SampleStore
+
+SHA256 = re.compile(r"[0-9a-fA-F]{64}")
+TIMEOUT_EXIT_CODE = 124  # exit code of coreutils timeout
+KILL_GRACE_SECONDS = 30  # time for the in-container timeout to stop bugfinder before the container is killed
+RESULTS_DIR = "results"  # result shards in data_dir, one per slot
+MAX_AUTOSCALE_FAILURES = 5  # consecutive failed reads of load and memory before the pool size stays fixed
+
+
+class Shard(NamedTuple):
+    """Every count-th function of a sample, starting at index (PersistentScheduler --shard-functions)"""
+
+    sample_hash: str
+    index: int
+    count: int
+    decompilable_functions: Optional[int] = None  # of the whole sample, from the history
+
+    def __str__(self):
+        return f"{self.sample_hash} [shard {self.index + 1}/{self.count}]"
+
+
+class Functions(NamedTuple):
+    """Some functions of a sample, e.g., the functions that failed on the last commit (differential run)"""
+
+    sample_hash: str
+    names: Tuple[str, ...]
+    decompilable_functions: Optional[int] = None  # of the whole sample, from the history
+
+    def __str__(self):
+        return f"{self.sample_hash} [{len(self.names)} functions]"
+
+
+def read_samples(lines: TextIO) -> Iterator[Tuple[str, List[str]]]:
+    """Sample hashes and function names ('<hash>' or '<hash>\\t<function name>' lines), skips invalid hashes"""
+    for sample_hash, sample_lines in groupby((line.rstrip("\n").partition("\t") for line in lines), key=lambda fields: fields[0].strip()):
+        if not SHA256.fullmatch(sample_hash):
+            logging.warning(f"skipping invalid sample hash: {sample_hash!r}")
+            continue
+        yield sample_hash, [function_name for _, _, function_name in sample_lines if function_name]
+
+
+class Scheduler:
+    """Fixed-size pool of slots fed from a bounded queue of sample hashes"""
+
+    def __init__(
+        self,
+        workers: int = 8,
+        max_time: int = 600,
+        image: str = "bugfinder-dewolf",
+        data_dir: Path = Path("data"),
+        command: Optional[str] = None,
+        label: str = "default",
+        total: Optional[int] = None,
+        progress_file: Optional[Path] = None,
+        healthcheck_file: Optional[Path] = None,
+        collect_interval: float = 0,
+        min_workers: Optional[int] = None,
+        memory_reserve: int = 2 * GIB,
+        autoscale_interval: float = 30,
+    ):
+        self._workers = workers
+        self._max_time = max_time
+        self._image = image
+        self._data_dir = Path(data_dir).absolute()
+        self._store = SampleStore(self._data_dir)
+        self._record_runs = self._store.has_index  # durations and timeouts for prioritize.py
+        self._command = command
+        self._label = label
+        self._total = total
+        self._progress_file = progress_file
+        self._healthcheck_file = healthcheck_file
+        self._collect_interval = collect_interval
+        self._collector = Collector(self._data_dir / "samples.sqlite3")
+        self._queue = queue.Queue(maxsize=2 * workers)
+        self._lock = threading.Lock()
+        self._pool_sizer = None
+        if min_workers is not None and min_workers < workers:
+            prefix = f"{image}-{label}-" if command is None else None
+            self._pool_sizer = PoolSizer(min_workers, workers, memory_reserve=memory_reserve, container_prefix=prefix)
+        self._autoscale_interval = autoscale_interval
+        self._pool_size = self._pool_sizer.min_workers if self._pool_sizer is not None else workers  # slots >= size are parked
+        self._pool_changed = threading.Condition(self._lock)
+        self._pool_seconds = 0.0  # integral of the pool size over time, for the idle slot ratio
+        self._pool_resized = None
+        self._drained = False  # all samples are taken, parked slots take their end marker
+        self._running = {}  # slot -> (sample hash, start time)
+        self._processed = 0
+        self._read = 0  # samples read from the input, exceeds total if samples are streamed in during the run
+        self._timeouts = 0
+        self._failures = 0
+        self._idle_seconds = 0.0
+        self._start = None
+
+    def task_command(self, slot: int, sample_hash: str) -> List[str]:
+        """Command processing one sample, a local command (--command) or a dewolf container"""
+        if self._command is not None:
+            return shlex.split(self._command.format(sample_hash=sample_hash, sqlite_file=self._sqlite_file(slot)))
+        return [
+            "docker",
+            "run",
+            "--rm",
+            "--name",
+            self._container_name(slot, sample_hash),
+            "--mount",
+            f"type=bind,source={self._data_dir},target=/data",
+            self._image,
+            "timeout",
+            str(self._max_time),
+            "python",
+            "decompiler/util/bugfinder/bugfinder.py",
+            self._sample_path(sample_hash),
+            "--sqlite-file",
+            self._container_path(self._sqlite_file(slot)),
+        ]
+
+    def _sample_path(self, sample_hash: str) -> str:
+        """Path of the sample in the container, on the host for a local command"""
+        path = self._store.locate(sample_hash) or self._store.path(sample_hash)
+        return str(path) if self._command is not None else self._container_path(path)
+
+    def _container_path(self, path: Path) -> str:
+        """Path in the container, data_dir is mounted as /data"""
+        return f"/data/{path.relative_to(self._data_dir).as_posix()}"
+
+    def _sqlite_file(self, slot: int) -> Path:
+        """Output database of the slot, its result shard if results are collected"""
+        if self._collect_interval:
+            return self._data_dir / RESULTS_DIR / f"{self._label}-{slot}.sqlite3"
+        return self._data_dir / "samples.sqlite3"
+
+    def _container_name(self, slot: int, sample_hash: str) -> str:
+        """Unique per task, a killed container of the slot may not be removed yet"""
+        return f"{self._image}-{self._label}-{slot}-{sample_hash[:12]}"
+
+    def _run_task(self, slot: int, sample_hash: str):
+        self._record(slot, sample_hash, *self._run_container(slot, sample_hash))
+
+    def _run_container(self, slot: int, sample_hash: str) -> Tuple[bool, bool]:
+        """Run one sample, block until it exits or is killed after max_time, return timed out and failed"""
+        timeout = self._max_time + KILL_GRACE_SECONDS if self._command is None else self._max_time
+        try:
+            result = subprocess.run(
+                self.task_command(slot, sample_hash), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=timeout
+            )
+            timed_out, failed = result.returncode == TIMEOUT_EXIT_CODE, result.returncode != 0
+        except subprocess.TimeoutExpired:
+            # subprocess.run killed the docker client (or local command), the container is still running
+            if self._command is None:
+                subprocess.run(["docker", "kill", self._container_name(slot, sample_hash)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            timed_out, failed = True, True
+        except OSError as ex:
+            logging.error(f"slot {slot}: could not run task for {sample_hash}: {ex}")
+            timed_out, failed = False, True
+        return timed_out, failed
+
+    def _record(
+        self, slot: int, sample_hash: str, timed_out: bool, failed: bool, seconds: Optional[float] = None, record_run: bool = True
+    ):
+        with self._lock:
+            self._processed += 1
+            self._timeouts += timed_out
+            self._failures += failed and not timed_out
+            if self._record_runs and record_run:
+                try:
+                    seconds = time.monotonic() - self._running[slot][1] if seconds is None else seconds
+                    self._store.record_run(sample_hash, seconds, timed_out)
+                except sqlite3.Error as ex:
+                    logging.warning(f"could not record run of {sample_hash}: {ex}")
+        if timed_out:
+            logging.warning(f"slot {slot}: {sample_hash} exceeded {self._max_time}s")
+        elif failed:
+            logging.warning(f"slot {slot}: {sample_hash} failed")
+
+    def _next_sample(self, slot: int) -> Optional[str]:
+        """Wait for the next sample of the slot (None at the end of the input), count the waiting time as idle"""
+        self._wait_active(slot)
+        wait_start = time.monotonic()
+        sample_hash = self._queue.get()
+        if sample_hash is None:
+            with self._pool_changed:
+                self._drained = True  # end markers follow the last sample
+                self._pool_changed.notify_all()
+        else:
+            with self._lock:
+                self._idle_seconds += time.monotonic() - wait_start
+                self._running[slot] = (sample_hash, time.monotonic())
+            self._write_status()
+        return sample_hash
+
+    def _is_active(self, slot: int) -> bool:
+        """Slot is part of the pool"""
+        return slot < self._pool_size
+
+    def _wait_active(self, slot: int) -> bool:
+        """Wait while the slot is parked, return False if all samples were taken meanwhile"""
+        with self._pool_changed:
+            self._pool_changed.wait_for(lambda: self._is_active(slot) or self._drained)
+            return self._is_active(slot)
+
+    def _resize(self, size: int, reason: str):
+        """Set the number of active slots, running tasks of parked slots finish"""
+        with self._pool_changed:
+            now = time.monotonic()
+            self._pool_seconds += self._pool_size * (now - self._pool_resized)
+            self._pool_resized = now
+            old_size, self._pool_size = self._pool_size, size
+            self._pool_changed.notify_all()
+        logging.info(f"{self._label} run: pool {old_size} -> {size} slots ({reason})")
+
+    def _autoscale(self, stop: threading.Event):
+        """Resize the pool every autoscale_interval seconds, log every decision"""
+        failures = 0
+        while not stop.wait(self._autoscale_interval):
+            try:
+                pressure = self._pool_sizer.pressure()
+                failures = 0
+            except (OSError, ValueError, KeyError) as ex:
+                failures += 1
+                if failures >= MAX_AUTOSCALE_FAILURES:
+                    logging.error(f"cannot read load and memory {failures} times in a row, pool size stays at {self._pool_size}: {ex}")
+                    return
+                logging.warning(f"cannot read load and memory ({failures}/{MAX_AUTOSCALE_FAILURES}), pool stays at {self._pool_size} slots: {ex}")
+                continue
+            with self._lock:
+                size, busy = self._pool_size, len(self._running)
+            new_size, reason = self._pool_sizer.decide(size, busy, pressure)
+            if new_size != size:
+                self._resize(new_size, f"{reason}; {pressure}, {busy} busy")
+            else:
+                logging.info(f"{self._label} run: pool stays at {size} slots ({reason}; {pressure}, {busy} busy)")
+
+    def _task_done(self, slot: int):
+        with self._lock:
+            del self._running[slot]
+        self._write_status()
+
+    def _worker(self, slot: int):
+        while (sample_hash := self._next_sample(slot)) is not None:
+            self._run_task(slot, sample_hash)
+            self._task_done(slot)
+
+    def _write_status(self):
+        """Write progress (processed/total) and running tasks (healthcheck, shown on the dashboard)"""
+        with self._lock:
+            progress = f"{self._processed}/{max(self._total, self._read) if self._total is not None else '?'}\n"
+            now = time.monotonic()
+            running = [f"slot {slot}: {sample_hash} ({now - start:.0f}s)\n" for slot, (sample_hash, start) in sorted(self._running.items())]
+            if self._progress_file is not None:
+                self._progress_file.write_text(progress)
+            if self._healthcheck_file is not None:
+                self._healthcheck_file.write_text(f"{self._label} run slots ({len(running)}/{self._pool_size} busy):\n" + "".join(running))
+
+    def run(self, sample_hashes: TextIO) -> dict:
+        """Process all sample hashes (one per line), return metrics"""
+        self._start = self._pool_resized = time.monotonic()
+        self._write_status()
+        stop_collector = threading.Event()
+        stop_autoscale = threading.Event()
+        if self._pool_sizer is not None:
+            logging.info(f"{self._label} run: pool of {self._pool_size} slots ({self._pool_sizer.min_workers} to {self._workers})")
+            threading.Thread(target=self._autoscale, args=(stop_autoscale,), daemon=True).start()
+        threads = [threading.Thread(target=self._worker, args=(slot,), daemon=True) for slot in range(self._workers)]
+        if self._collect_interval:
+            self._collect(remove=True)  # shards left by an interrupted run
+            for slot in range(self._workers):
+                prepare_shard(self._sqlite_file(slot))
+            collector = threading.Thread(
+                target=self._collector.run, args=([self._data_dir / RESULTS_DIR], stop_collector, self._collect_interval), daemon=True
+            )
+            collector.start()
+        for thread in threads:
+            thread.start()
+        for sample_hash, function_names in read_samples(sample_hashes):
+            with self._lock:
+                self._read += 1
+            for task in self._tasks(sample_hash, function_names):
+                self._queue.put(task)  # blocks while all slots are busy and the queue is full
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join()
+        stop_autoscale.set()
+        if self._collect_interval:
+            stop_collector.set()
+            collector.join()
+            self._collect(remove=True)
+        self._write_status()
+        return self.metrics
+
+    def _collect(self, remove: bool = False):
+        """Merge the result shards into samples.sqlite3"""
+        shards = shard_files([self._data_dir / RESULTS_DIR]) if (self._data_dir / RESULTS_DIR).is_dir() else []
+        if shards:
+            start = time.perf_counter()
+            merged = self._collector.collect(shards, remove=remove)
+            logging.info(f"collected {merged} rows from {len(shards)} result shards in {time.perf_counter() - start:.1f}s")
+
+    def _tasks(self, sample_hash: str, function_names: List[str]) -> List[Union[str, Shard, Functions]]:
+        """Tasks of a sample, the whole sample (a container per sample cannot limit the functions)"""
+        return [sample_hash]
+
+    @property
+    def metrics(self) -> dict:
+        """Throughput and idle slot time (slots waiting for a sample) since the start of run"""
+        now = time.monotonic()
+        elapsed = now - self._start
+        with self._lock:
+            slot_seconds = self._pool_seconds + self._pool_size * (now - self._pool_resized)
+            return {
+                "processed": self._processed,
+                "timeouts": self._timeouts,
+                "failures": self._failures,
+                "elapsed_seconds": elapsed,
+                "samples_per_hour": self._processed / elapsed * 3600 if elapsed else 0.0,
+                "idle_slot_seconds": self._idle_seconds,
+                "idle_slot_ratio": self._idle_seconds / slot_seconds if slot_seconds else 0.0,
+                "pool_size": self._pool_size,
+            }
+
+
+class PersistentScheduler(Scheduler):
+    """
+    Scheduler whose slots are long-lived containers running worker_agent.py. Each slot listens on its own unix socket
+    in data_dir (mounted into the container), the agent takes samples over it and runs each in a forked child
+    with the time limit. A container is restarted after samples_per_container samples or when its agent crashes.
+
+    With shard_functions, samples with more functions (known from the history, see prioritize.py) are split into
+    shards that run on different slots, each decompiling every n-th function. Without a known function count,
+    shard_size splits samples by file size. All shards write to samples.sqlite3 under the sample hash, with the
+    function counts of the whole sample (see worker_agent.py), the sample counts as processed when its last shard is done.
+    """
+
+    AGENT_PATH = Path(__file__).absolute().with_name("worker_agent.py")
+    AGENT_MOUNT = "/opt/bugfinder/worker_agent.py"
+    CONNECT_TIMEOUT_SECONDS = 300  # container start and preloading Binary Ninja
+    MAX_START_FAILURES = 3  # consecutive failed container starts before the slot falls back to one container per sample
+
+    def __init__(self, samples_per_container: int = 100, shard_functions: int = 0, shard_size: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self._samples_per_container = samples_per_container
+        self._shard_functions = shard_functions
+        self._shard_size = shard_size
+        self._shards = {}  # sample hash -> [remaining shards, seconds, timed out, failed]
+        self._container_starts = 0
+
+    def agent_command(self, slot: int, start: int) -> List[str]:
+        """Command starting the agent of a slot, a local command (--command with {socket}) or a dewolf container"""
+        socket_path = self._socket_path(slot)
+        if self._command is not None:
+            return shlex.split(
+                self._command.format(
+                    socket=socket_path, max_time=self._max_time, max_samples=self._samples_per_container, sqlite_file=self._sqlite_file(slot)
+                )
+            )
+        return [
+            "docker",
+            "run",
+            "--rm",
+            "--name",
+            f"{self._image}-{self._label}-{slot}-agent-{start}",
+            "--mount",
+            f"type=bind,source={self._data_dir},target=/data",
+            "--mount",
+            f"type=bind,source={self.AGENT_PATH},target={self.AGENT_MOUNT},readonly",
+            self._image,
+            "python",
+            self.AGENT_MOUNT,
+            "--socket",
+            f"/data/{socket_path.name}",
+            "--max-time",
+            str(self._max_time),
+            "--max-samples",
+            str(self._samples_per_container),
+            "--sqlite-file",
+            self._container_path(self._sqlite_file(slot)),
+        ]
+
+    def _tasks(self, sample_hash: str, function_names: List[str]) -> List[Union[str, Shard, Functions]]:
+        """The given functions of a sample, or shards of large samples (at most one per slot)"""
+        if function_names:
+            with self._lock:
+                functions = self._store.size_and_functions(sample_hash)[1] if self._store.has_index else None
+            return [Functions(sample_hash, tuple(function_names), functions)]
+        if not (self._shard_functions or self._shard_size) or not self._store.has_index:
+            return [sample_hash]
+        with self._lock:
+            if sample_hash in self._shards:
+                return [sample_hash]  # duplicate input line
+            size, functions = self._store.size_and_functions(sample_hash)
+            if self._shard_functions and functions:
+                count = -(-functions // self._shard_functions)
+            elif self._shard_size and size:
+                count = -(-size // self._shard_size)
+            else:
+                count = 1
+            count = min(count, self._pool_size)
+            if count <= 1:
+                return [sample_hash]
+            self._shards[sample_hash] = [count, 0.0, False, False]
+        return [Shard(sample_hash, index, count, functions) for index in range(count)]
+
+    def _record(self, slot: int, task: Union[str, Shard, Functions], timed_out: bool, failed: bool, seconds: Optional[float] = None):
+        """Record a sample, or a shard (the sample is recorded with the last shard, timed out or failed if any shard was)"""
+        if isinstance(task, Functions):
+            # the duration of some functions does not tell the duration of the sample
+            super()._record(slot, task.sample_hash, timed_out, failed, record_run=False)
+            return
+        if not isinstance(task, Shard):
+            super()._record(slot, task, timed_out, failed, seconds)
+            return
+        if timed_out:
+            logging.warning(f"slot {slot}: {task} exceeded {self._max_time}s")
+        with self._lock:
+            state = self._shards[task.sample_hash]
+            state[0] -= 1
+            state[1] += time.monotonic() - self._running[slot][1]
+            state[2] |= timed_out
+            state[3] |= failed
+            if state[0] > 0:
+                return
+            del self._shards[task.sample_hash]
+        _, seconds, timed_out, failed = state
+        super()._record(slot, task.sample_hash, timed_out, failed, seconds)
+
+    def _run_task(self, slot: int, task: Union[str, Shard, Functions]):
+        """Fallback without agent, which limits the functions: function lists and first shards run the whole sample"""
+        if isinstance(task, str):
+            super()._run_task(slot, task)
+            return
+        run = not isinstance(task, Shard) or task.index == 0
+        timed_out, failed = self._run_container(slot, task.sample_hash) if run else (False, False)
+        self._record(slot, task, timed_out, failed)
+
+    def _socket_path(self, slot: int) -> Path:
+        return self._data_dir / f"{self._label}-{slot}.sock"
+
+    def _worker(self, slot: int):
+        socket_path = self._socket_path(slot)
+        socket_path.unlink(missing_ok=True)
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(str(socket_path))
+            server.listen(1)
+            server.settimeout(1)
+            start_failures = 0
+            finished = False
+            while not finished and start_failures < self.MAX_START_FAILURES:
+                if not self._wait_active(slot):  # a parked slot has no container, take its end marker
+                    self._next_sample(slot)
+                    finished = True
+                    break
+                with self._lock:
+                    self._container_starts += 1
+                    start = self._container_starts
+                agent = subprocess.Popen(self.agent_command(slot, start), stdout=subprocess.DEVNULL)
+                connection = self._accept(server, agent)
+                if connection is None:
+                    logging.error(f"slot {slot}: agent did not connect (exit code {agent.poll()})")
+                    start_failures += 1
+                else:
+                    start_failures = 0
+                    with connection:
+                        finished = self._serve(slot, connection)
+                self._stop_agent(agent)
+        socket_path.unlink(missing_ok=True)
+        if finished:
+            return
+        if self._command is None:
+            logging.error(f"slot {slot}: agent did not start, falling back to one container per sample")
+            super()._worker(slot)
+            return
+        logging.error(f"slot {slot}: agent did not start, remaining samples of the slot fail")
+        while (task := self._next_sample(slot)) is not None:
+            self._record(slot, task, timed_out=False, failed=True)
+            self._task_done(slot)
+
+    def _accept(self, server: socket.socket, agent: subprocess.Popen) -> Optional[socket.socket]:
+        """Wait until the agent connects, None if it exits or does not connect in time"""
+        deadline = time.monotonic() + self.CONNECT_TIMEOUT_SECONDS
+        while time.monotonic() < deadline and agent.poll() is None:
+            try:
+                connection, _ = server.accept()
+                return connection
+            except socket.timeout:
+                continue
+        return None
+
+    def _stop_agent(self, agent: subprocess.Popen):
+        try:
+            agent.wait(timeout=KILL_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            # killing the docker client does not stop the container, it is removed by its name
+            if self._command is None:
+                subprocess.run(["docker", "kill", agent.args[agent.args.index("--name") + 1]], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            agent.kill()
+            agent.wait()
+
+    def _serve(self, slot: int, connection: socket.socket) -> bool:
+        """
+        Send samples to a connected agent, return True at the end of the input, False if the agent exited or was
+        stopped because the slot is parked (frees the memory of its container)
+        """
+        messages = connection.makefile("r")
+        connection.settimeout(self._max_time + KILL_GRACE_SECONDS)
+        try:
+            ready = json.loads(messages.readline() or "{}").get("ready", False)
+            while ready:
+                if not self._is_active(slot):
+                    connection.sendall(b'{"exit": true}\n')
+                    return False
+                task = self._next_sample(slot)
+                if task is None:
+                    connection.sendall(b'{"exit": true}\n')
+                    return True
+                sample_hash = task if isinstance(task, str) else task.sample_hash
+                message = {"sample_hash": sample_hash, "sample_path": self._sample_path(sample_hash)}
+                if isinstance(task, Shard):
+                    message["shard"] = [task.index, task.count]
+                elif isinstance(task, Functions):
+                    message["functions"] = list(task.names)
+                if not isinstance(task, str):
+                    message["decompilable_functions"] = task.decompilable_functions
+                connection.sendall((json.dumps(message) + "\n").encode())
+                try:
+                    result = json.loads(messages.readline() or "{}")
+                except (socket.timeout, ConnectionError) as ex:
+                    result = {"timed_out": isinstance(ex, socket.timeout)}
+                if "exit_code" not in result:
+                    # agent crashed or hangs, the sample counts as processed (like a crashed container)
+                    logging.warning(f"slot {slot}: agent lost while processing {task}")
+                self._record(slot, task, result.get("timed_out", False), result.get("exit_code") != 0)
+                self._task_done(slot)
+                ready = result.get("ready", False)
+        except (socket.timeout, ConnectionError, json.JSONDecodeError) as ex:
+            logging.warning(f"slot {slot}: agent connection lost: {ex}")
+        return False
+
+    @property
+    def metrics(self) -> dict:
+        with self._lock:
+            container_starts = self._container_starts
+        return {**super().metrics, "container_starts": container_starts}
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Process sample hashes with a fixed pool of dewolf containers")
+    parser.add_argument(
+        "-i", "--input", type=argparse.FileType("r"), default=sys.stdin, help="File with one sample hash per line (default: stdin)"
+    )
+    parser.add_argument("-w", "--workers", type=int, default=8, help="Number of parallel tasks, the ceiling with --min-workers (default: 8)")
+    parser.add_argument(
+        "--min-workers",
+        type=int,
+        help="Size the pool between X and --workers slots from the load, available memory, and memory use of the containers",
+    )
+    parser.add_argument(
+        "--memory-reserve",
+        type=int,
+        default=2048,
+        help="With --min-workers: shrink the pool if less than X MiB are available, grow only above (default: 2048)",
+    )
+    parser.add_argument(
+        "--autoscale-interval", type=float, default=30, help="With --min-workers: seconds between pool size decisions (default: 30)"
+    )
+    parser.add_argument("--max-time", type=int, default=600, help="Time limit per sample in seconds (default: 600)")
+    parser.add_argument("--image", default="bugfinder-dewolf", help="dewolf docker image (default: bugfinder-dewolf)")
+    parser.add_argument("--data-dir", type=Path, default=Path("data"), help="Directory mounted as /data (default: data)")
+    parser.add_argument(
+        "--samples-per-container",
+        type=int,
+        default=1,
+        help="Keep containers running worker_agent.py for up to X samples (default: 1, a new container per sample)",
+    )
+    parser.add_argument(
+        "--shard-functions",
+        type=int,
+        default=0,
+        help="With --samples-per-container: split samples into shards of about X functions (default: 0, no sharding)",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=0,
+        help="With --samples-per-container: split samples without known function count into shards of about X bytes",
+    )
+    parser.add_argument(
+        "--command",
+        help="Run this local command per sample instead of a container, e.g., 'bugfinder.py {sample_hash}'. "
+        "With --samples-per-container, the local agent command, e.g., 'python worker_agent.py --socket {socket} --max-samples {max_samples}'. "
+        "{sqlite_file} is the output database of the slot",
+    )
+    parser.add_argument(
+        "--collect-interval",
+        type=float,
+        default=0,
+        help="Write results to one shard per slot (data/results) and merge them into samples.sqlite3 every X seconds "
+        "(default: 0, all slots write samples.sqlite3)",
+    )
+    parser.add_argument("--label", default="default", help="Name of the run (quick, long) for container names and healthcheck")
+    parser.add_argument("--total", type=int, help="Total number of samples, for the progress file")
+    parser.add_argument("--progress", type=Path, help="Write processed/total to this file")
+    parser.add_argument("--healthcheck", type=Path, help="Write running tasks to this file")
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace) -> int:
+    scheduler_args = dict(
+        workers=args.workers,
+        max_time=args.max_time,
+        image=args.image,
+        data_dir=args.data_dir,
+        command=args.command,
+        label=args.label,
+        total=args.total,
+        progress_file=args.progress,
+        healthcheck_file=args.healthcheck,
+        collect_interval=args.collect_interval,
+        min_workers=args.min_workers,
+        memory_reserve=args.memory_reserve * 2**20,
+        autoscale_interval=args.autoscale_interval,
+    )
+    if args.samples_per_container > 1:
+        scheduler = PersistentScheduler(
+            samples_per_container=args.samples_per_container,
+            shard_functions=args.shard_functions,
+            shard_size=args.shard_size,
+            **scheduler_args,
+        )
+    else:
+        scheduler = Scheduler(**scheduler_args)
+    metrics = scheduler.run(args.input)
+    logging.info(
+        f"{args.label} run: {metrics['processed']} samples in {metrics['elapsed_seconds']:.0f}s "
+        f"({metrics['samples_per_hour']:.0f} samples/h), {metrics['timeouts']} timeouts, {metrics['failures']} failures, "
+        f"idle slot time {metrics['idle_slot_seconds']:.0f}s ({metrics['idle_slot_ratio']:.1%})"
+        + (f", {metrics['container_starts']} container starts" if "container_starts" in metrics else "")
+        + (f", final pool size {metrics['pool_size']}" if args.min_workers is not None else "")
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parse_arguments()
+    sys.exit(main(args))
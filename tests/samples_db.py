@@ -0,0 +1,76 @@
+"""samples.sqlite3 files (dewolf table written by bugfinder) for tests"""
+import sqlite3
+from pathlib import Path
+from typing import List, Optional
+
+COMMIT = "0123456789abcdef0123456789abcdef01234567"
+
+DEWOLF_SCHEMA = """CREATE TABLE IF NOT EXISTS dewolf (
+    id INTEGER NOT NULL PRIMARY KEY,
+    function_name TEXT,
+    function_basic_block_count INTEGER,
+    function_size INTEGER,
+    function_arch TEXT,
+    function_platform TEXT,
+    sample_hash TEXT,
+    sample_name TEXT,
+    sample_total_function_count INTEGER,
+    sample_decompilable_function_count INTEGER,
+    dewolf_current_commit TEXT,
+    binaryninja_version TEXT,
+    dewolf_max_basic_blocks INTEGER,
+    dewolf_exception TEXT,
+    dewolf_traceback TEXT,
+    dewolf_decompilation_time REAL,
+    dewolf_undecorated_code TEXT,
+    is_successful INTEGER,
+    timestamp TIMESTAMP
+)"""
+
+
+def function_row(sample: int = 0, function: int = 0, **values) -> dict:
+    """Successful run of one function, values override the columns"""
+    row = {
+        "function_name": f"sub_{function:x}",
+        "function_basic_block_count": function % 7 + 1,
+        "function_size": 10 * function + 10,
+        "function_arch": "x86_64",
+        "function_platform": "linux-x86_64",
+        "sample_hash": f"{sample:064x}",
+        "sample_name": f"sample_{sample}",
+        "sample_total_function_count": 20,
+        "sample_decompilable_function_count": 18,
+        "dewolf_current_commit": COMMIT,
+        "binaryninja_version": "4.0.4958",
+        "dewolf_max_basic_blocks": 300,
+        "dewolf_exception": "",
+        "dewolf_traceback": "",
+        "dewolf_decompilation_time": 0.5 + function % 3,
+        "dewolf_undecorated_code": "int sub() {}",
+        "is_successful": 1,
+        "timestamp": f"2024-01-01 00:{sample % 60:02}:{function % 60:02}.{function:06}",
+    }
+    return {**row, **values}
+
+
+def failed_row(sample: int = 0, function: int = 0, exception: str = "ValueError: bad value", location: Optional[str] = None, **values) -> dict:
+    """Failed run of one function, the traceback ends in location ('<file>:<line>', default: cfg.py:<function % 3>)"""
+    file_name, _, line = (location or f"cfg.py:{function % 3 + 1}").partition(":")
+    traceback = (
+        "Traceback (most recent call last):\n"
+        '  File "/home/dewolf/decompiler/pipeline/pipeline.py", line 12, in run\n    stage.run(task)\n'
+        f'  File "/home/dewolf/decompiler/structures/{file_name}", line {line}, in run\n    raise error\n'
+        f"{exception}"
+    )
+    return function_row(sample, function, **{"dewolf_exception": exception, "dewolf_traceback": traceback, "is_successful": 0, **values})
+
+
+def write_samples(path: Path, rows: List[dict]) -> Path:
+    """Append rows to the dewolf table of path (created if needed), return path"""
+    with sqlite3.connect(path) as con:
+        con.execute(DEWOLF_SCHEMA)
+        for row in rows:
+            columns = ", ".join(row)
+            con.execute(f"INSERT INTO dewolf ({columns}) VALUES ({', '.join('?' * len(row))})", tuple(row.values()))
+    con.close()
+    return path
@@ -0,0 +1,49 @@
+import unittest
+
+from autoscale import GIB, PoolSizer, Pressure
+
+
+def pressure(available: float, load: float = 0.0, cpus: int = 8, **containers: float) -> Pressure:
+    """Pressure with available and container memory in GiB"""
+    return Pressure(load, cpus, int(available * GIB), 64 * GIB, {name: int(size * GIB) for name, size in containers.items()})
+
+
+class PoolSizerTests(unittest.TestCase):
+    def setUp(self):
+        self.sizer = PoolSizer(min_workers=3, max_workers=6, memory_reserve=2 * GIB, container_memory_estimate=GIB // 2)
+
+    def test_shrink_under_memory_pressure(self):
+        # 1.5 GiB below the reserve: 2 containers of the largest size (1 GiB)
+        size, reason = self.sizer.decide(6, 6, pressure(0.5, a=1, b=0.25))
+        self.assertEqual(size, 4)
+        self.assertIn("memory below reserve", reason)
+        # never below min_workers
+        self.assertEqual(self.sizer.decide(4, 4, pressure(0.5, a=1))[0], 3)
+        # even if the reserve is missed by a few bytes
+        self.assertEqual(self.sizer.decide(5, 5, pressure(1.999))[0], 4)
+
+    def test_shrink_by_largest_container_seen(self):
+        # without docker stats, the estimate is used
+        self.assertEqual(self.sizer.decide(6, 6, pressure(1))[0], 4)
+        self.sizer.decide(6, 6, pressure(10, a=2))
+        # the spike of a container that has finished still counts
+        self.assertEqual(self.sizer.decide(6, 6, pressure(1, a=0.5))[0], 5)
+
+    def test_grow_with_idle_cores_and_memory(self):
+        # 6 idle cores, memory for 3 more containers of 1 GiB
+        size, reason = PoolSizer(1, 16).decide(2, 2, pressure(5, load=1.5, a=1))
+        self.assertEqual((size, reason), (5, "6 idle cores, memory for 3 containers of 1.0 GiB"))
+        # capped by max_workers
+        self.assertEqual(self.sizer.decide(4, 4, pressure(20, load=1))[0], 6)
+
+    def test_no_growth(self):
+        self.assertEqual(self.sizer.decide(4, 3, pressure(20)), (4, "slots waiting for samples"))
+        # busy slots count as load before the load average catches up
+        self.assertEqual(self.sizer.decide(8, 8, pressure(20, load=0.5)), (8, "no idle cores"))
+        self.assertEqual(self.sizer.decide(4, 4, pressure(20, load=7.5)), (4, "no idle cores"))
+        # memory above the reserve, but not for another container
+        self.assertEqual(self.sizer.decide(4, 4, pressure(2.4, a=0.5)), (4, "no memory for another container of 0.5 GiB"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import sqlite3
+import tempfile
+import unittest
+from pathlib import Path
+
+from collector import Collector, prepare_shard, shard_files
+from tests.samples_db import function_row, write_samples
+
+
+class CollectorTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.results = Path(self.directory.name) / "results"
+        self.output = Path(self.directory.name) / "samples.sqlite3"
+        self.shards = [self.results / f"default-{slot}.sqlite3" for slot in range(2)]
+        for shard in self.shards:
+            prepare_shard(shard)
+        self.collector = Collector(self.output)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def collect(self, remove: bool = False) -> int:
+        return self.collector.collect(shard_files([self.results]), remove=remove)
+
+    def query(self, sql: str) -> list:
+        with sqlite3.connect(self.output) as con:
+            rows = con.execute(sql).fetchall()
+        con.close()
+        return rows
+
+    def names(self) -> list:
+        return self.query("SELECT id, sample_name, function_name FROM dewolf ORDER BY id")
+
+    def test_merging_resumes_from_progress(self):
+        self.assertEqual(self.collect(), 0)  # no sample finished yet
+        write_samples(self.shards[0], [function_row(0, function) for function in range(3)])
+        write_samples(self.shards[1], [function_row(1, 0)])
+        self.assertEqual(self.collect(), 4)
+        write_samples(self.shards[0], [function_row(0, 3)])
+        # a new collector (restarted scheduler) resumes from collector_progress of the output
+        self.collector = Collector(self.output)
+        self.assertEqual(self.collect(), 1)
+        self.assertEqual(self.collect(), 0)
+        # ids of the shards collide, the output assigns its own
+        self.assertEqual(
+            self.names(),
+            [(1, "sample_0", "sub_0"), (2, "sample_0", "sub_1"), (3, "sample_0", "sub_2"), (4, "sample_1", "sub_0")]
+            + [(5, "sample_0", "sub_3")],
+        )
+        self.assertEqual(
+            self.query("SELECT shard, last_rowid FROM collector_progress ORDER BY shard"),
+            [(str(self.shards[0].absolute()), 4), (str(self.shards[1].absolute()), 1)],
+        )
+
+    def test_rotated_shard_is_merged_from_the_start(self):
+        write_samples(self.shards[1], [function_row(1, function) for function in range(3)])
+        self.assertEqual(self.collect(), 3)
+        # replaced by a new file (new dev:inode) with fewer rows than were merged from the old one
+        rotated = self.results / "rotated.tmp"
+        prepare_shard(rotated)
+        write_samples(rotated, [function_row(2, 0)])
+        old_inode = self.shards[1].stat().st_ino
+        rotated.rename(self.shards[1])
+        self.assertNotEqual(self.shards[1].stat().st_ino, old_inode)
+        self.assertEqual(self.collect(), 1)
+        self.assertEqual(self.names()[-1], (4, "sample_2", "sub_0"))
+        stat = self.shards[1].stat()
+        self.assertEqual(self.query("SELECT source, last_rowid FROM collector_progress"), [(f"{stat.st_dev}:{stat.st_ino}", 1)])
+
+    def test_remove_merged_shards(self):
+        write_samples(self.shards[0], [function_row(0, 0)])
+        self.assertEqual(self.collect(remove=True), 1)
+        self.assertEqual(list(self.results.iterdir()), [])
+        self.assertEqual(self.query("SELECT count(*) FROM collector_progress"), [(0,)])
+
+
+if __name__ == "__main__":
+    unittest.main()
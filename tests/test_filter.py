@@ -0,0 +1,435 @@
+import io
+import random
+import sqlite3
+import tempfile
+import unittest
+import warnings
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from filter import (
+    DBFilter,
+    IncrementalDBFilter,
+    SQLiteDBFilter,
+    StreamingDBFilter,
+    differential_report,
+    print_differential_report,
+    print_slow_sample_hashes,
+    print_worklist,
+)
+from tests.samples_db import COMMIT, failed_row, function_row, write_samples
+
+
+def pandas_slow_sample_hashes(rows: list, duration: int) -> set:
+    """Previous implementation of print_slow_sample_hashes: timestamp diff per sample, truncated to whole seconds"""
+    df = pd.DataFrame(rows, columns=["sample_hash", "timestamp"])
+    df["timestamp"] = pd.to_datetime(df["timestamp"], format="ISO8601")
+    df = df.sort_values(["sample_hash", "timestamp"], kind="stable")
+    # the first diff of each sample is NaN, so the last row of the previous sample gets no duration
+    df["duration_seconds"] = df.groupby("sample_hash")["timestamp"].diff().shift(-1).dt.total_seconds().fillna(-1).astype("int")
+    return set(df[df.duration_seconds >= duration]["sample_hash"])
+
+
+class SlowSamplesTests(unittest.TestCase):
+    def slow_sample_hashes(self, rows: list, duration: int) -> set:
+        with tempfile.TemporaryDirectory() as directory:
+            database = Path(directory) / "samples.sqlite3"
+            with sqlite3.connect(database) as con:
+                con.execute("CREATE TABLE dewolf (id INTEGER PRIMARY KEY, sample_hash TEXT, timestamp TIMESTAMP)")
+                con.executemany("INSERT INTO dewolf (sample_hash, timestamp) VALUES (?, ?)", rows)
+            output = io.StringIO()
+            with redirect_stdout(output):
+                print_slow_sample_hashes(database, duration)
+            return set(output.getvalue().split())
+
+    def test_gap_exactly_at_threshold(self):
+        start = datetime(2024, 1, 1, 0, 0, 1, 151685)
+        gaps = {"exact": 300, "below": 299.999999, "above": 300.5, "exact_whole": 300}
+        rows = []
+        for sample_hash, gap in gaps.items():
+            first = start if sample_hash != "exact_whole" else start.replace(microsecond=0)
+            rows += [(sample_hash, str(first)), (sample_hash, str(first + timedelta(seconds=gap)))]
+        self.assertEqual(self.slow_sample_hashes(rows, 300), {"exact", "above", "exact_whole"})
+
+    def test_same_samples_as_pandas(self):
+        rng = random.Random(0)
+        rows = []
+        for sample in range(200):
+            timestamp = datetime(2024, 1, 1) + timedelta(seconds=rng.randint(0, 10**6))
+            for _ in range(rng.randint(1, 20)):
+                rows.append((f"sample_{sample}", str(timestamp)))
+                # whole seconds, with and without fractions, around the threshold
+                timestamp += timedelta(seconds=rng.choice([1, 299, 300, 301]), microseconds=rng.choice([0, 0, 1, 999999, rng.randint(0, 999999)]))
+        rng.shuffle(rows)
+        for duration in (1, 299, 300, 301):
+            self.assertEqual(self.slow_sample_hashes(rows, duration), pandas_slow_sample_hashes(rows, duration), duration)
+
+
+def pandas_smallest_per_group(df: pd.DataFrame, keys: list, by: str, k: int) -> pd.DataFrame:
+    """Previous implementation of DBFilter.smallest_per_group: DataFrame.nsmallest per group"""
+    with warnings.catch_warnings():
+        # pandas >= 2.2 deprecates passing the grouping columns to apply
+        warnings.simplefilter("ignore", FutureWarning)
+        return df.groupby(keys).apply(lambda x: x.nsmallest(k, by)).reset_index(drop=True)
+
+
+class SmallestPerGroupTests(unittest.TestCase):
+    KEYS = DBFilter.GROUP_KEYS
+    BY = "function_basic_block_count"
+
+    def assert_same_as_pandas(self, df: pd.DataFrame, k: int):
+        result = DBFilter.smallest_per_group(df, self.KEYS, self.BY, k).reset_index(drop=True)
+        # nsmallest orders ties with an unstable sort if a group has at most k rows, compare in canonical order
+        canonical = lambda x: x.sort_values(self.KEYS + [self.BY, "row"], kind="stable").reset_index(drop=True)
+        assert_frame_equal(canonical(pandas_smallest_per_group(df, self.KEYS, self.BY, k)), canonical(result))
+        self.assertTrue(result.equals(canonical(result)), "groups not ordered by key and size, or ties not in row order")
+
+    def test_edge_cases(self):
+        nan = float("nan")
+        rows = [
+            ("a", "t1", 5.0),  # group with more than k rows, ties at the cut
+            ("a", "t1", 3.0),
+            ("a", "t1", 3.0),
+            ("a", "t1", nan),
+            ("a", "t1", 3.0),
+            ("a", "t1", 1.0),
+            ("b", "t2", nan),  # group with fewer than k rows, NaN size
+            ("b", "t2", 2.0),
+            ("c", "t3", 4.0),  # group with exactly k rows, ties
+            ("c", "t3", 4.0),
+            ("c", "t3", 4.0),
+            (None, "t1", 1.0),  # NaN keys, dropped like groupby does
+            ("a", None, 1.0),
+            ("d", "t4", nan),  # only NaN sizes
+            ("d", "t4", nan),
+            ("d", "t4", nan),
+            ("d", "t4", nan),
+        ]
+        df = pd.DataFrame(rows, columns=self.KEYS + [self.BY])
+        df["row"] = range(len(df))
+        self.assert_same_as_pandas(df, 3)
+
+    def test_same_rows_as_pandas(self):
+        generator = random.Random(4)
+        rows = [
+            (
+                generator.choice(["ValueError", "KeyError", "IndexError", None]),
+                f"traceback {generator.randrange(20)}",
+                generator.choice([float(generator.randrange(10)), float("nan")]),
+            )
+            for _ in range(2000)
+        ]
+        df = pd.DataFrame(rows, columns=self.KEYS + [self.BY])
+        df["row"] = range(len(df))
+        for k in (1, 5, 50):
+            with self.subTest(k=k):
+                self.assert_same_as_pandas(df, k)
+
+
+class StreamingDBFilterTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.samples = Path(self.directory.name) / "samples.sqlite3"
+        self.filtered = Path(self.directory.name) / "filtered.sqlite3"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_stats_are_aggregated_once(self):
+        write_samples(self.samples, [function_row(0, 0), failed_row(0, 1), function_row(1, 0)])
+        db_filter = StreamingDBFilter(self.samples, chunksize=2)
+        with mock.patch.object(db_filter, "_iter_chunks", wraps=db_filter._iter_chunks) as iter_chunks:
+            self.assertEqual(db_filter.summary.total_functions[0], 3)
+            self.assertEqual(list(db_filter.samples.sample_hash), [f"{0:064x}", f"{1:064x}"])
+            self.assertIs(db_filter._get_samples(), db_filter.samples)
+        self.assertEqual(iter_chunks.call_count, 1)
+
+    def test_no_failed_runs(self):
+        write_samples(self.samples, [function_row(sample, function) for sample in range(3) for function in range(5)])
+        db_filter = StreamingDBFilter(self.samples, chunksize=4)
+        expected = DBFilter.from_file(self.samples).filtered
+        self.assertTrue(db_filter.filtered.empty)
+        self.assertEqual(db_filter.filtered.dtypes.to_dict(), expected.dtypes.to_dict())
+        db_filter.write(self.filtered)
+        with sqlite3.connect(self.filtered) as con:
+            self.assertEqual(con.execute("SELECT count(*) FROM dewolf_errors").fetchone()[0], 0)
+            self.assertEqual(con.execute("SELECT total_functions, total_errors FROM summary").fetchall(), [(15, 0)])
+        con.close()
+
+
+class InsertDataFrameTests(unittest.TestCase):
+    def test_empty_frames_are_skipped(self):
+        con = sqlite3.connect(":memory:")
+        con.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, a INTEGER)")
+        con.execute("BEGIN")
+        self.assertEqual(DBFilter._insert_df(con.cursor(), pd.DataFrame(), "t"), 0)
+        self.assertEqual(DBFilter._insert_df(con.cursor(), pd.DataFrame({"id": [], "a": []}), "t"), 0)
+        self.assertEqual(DBFilter._insert_df(con.cursor(), pd.DataFrame({"id": [7], "a": [1]}), "t"), 1)
+        self.assertTrue(con.in_transaction)
+        self.assertEqual(con.execute("SELECT id, a FROM t").fetchall(), [(1, 1)])
+        con.close()
+
+
+class SQLiteDBFilterTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.samples = Path(self.directory.name) / "samples.sqlite3"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assert_same_as_pandas(self, rows: list):
+        write_samples(self.samples, rows)
+        expected, result = DBFilter.from_file(self.samples), SQLiteDBFilter.from_file(self.samples, chunksize=3)
+        # NULLs as written by DBFilter._insert_df: a chunk with only NULLs of an INTEGER column has None instead of NaN
+        as_written = lambda df: df.astype(object).where(df.notna(), None)
+        for name in ("summary", "samples", "filtered"):
+            with self.subTest(name):
+                assert_frame_equal(as_written(getattr(result, name)), as_written(getattr(expected, name)), check_dtype=False)
+
+    def test_same_as_pandas(self):
+        rows = []
+        for sample in range(4):
+            for function in range(8):
+                values = {
+                    # several platforms and versions per sample, in order of first appearance
+                    "function_platform": ["linux-x86_64", "windows-x86", "linux-x86_64"][(sample + function) % 3],
+                    "binaryninja_version": ["4.0.4958", "3.5.4526"][function // 5],
+                    # NULL counts and times
+                    "sample_total_function_count": None if sample == 1 else 20,
+                    "sample_decompilable_function_count": None if sample in (1, 2) else 18,
+                    "dewolf_decompilation_time": None if function == 3 else 0.5 * function,
+                }
+                if function % 3 == 0:
+                    rows.append(failed_row(sample, function, exception=["ValueError: bad value", "KeyError: 'x'"][function % 2], **values))
+                else:
+                    rows.append(function_row(sample, function, **values))
+        rows.append(failed_row(5, 0, exception=None))
+        self.assert_same_as_pandas(rows)
+
+    def test_no_failed_runs(self):
+        self.assert_same_as_pandas([function_row(sample, function) for sample in range(3) for function in range(4)])
+
+
+class IncrementalDBFilterTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.samples = Path(self.directory.name) / "samples.sqlite3"
+        self.filtered = Path(self.directory.name) / "filtered.sqlite3"
+        rng = random.Random(5)
+        self.rows = [
+            failed_row(sample, function, rng.choice(["ValueError: bad value", "KeyError: 'x'"]), f"cfg.py:{rng.randint(1, 3)}")
+            if rng.random() < 0.5
+            else function_row(sample, function)
+            for sample in range(6)
+            for function in range(10)
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_incremental(self, samples: Path, max_cases: int = 2):
+        IncrementalDBFilter(samples, chunksize=7, max_cases=max_cases).write(self.filtered)
+
+    @staticmethod
+    def read_table(path: Path, table: str) -> pd.DataFrame:
+        with sqlite3.connect(path) as con:
+            df = pd.read_sql_query(f"SELECT * FROM {table}", con).drop(columns="id")
+        con.close()
+        return df.sort_values(list(df.columns), na_position="last", ignore_index=True)
+
+    def test_increments_match_full_run(self):
+        for rows in (self.rows[:25], self.rows[25:40], self.rows[40:]):
+            write_samples(self.samples, rows)
+            self.run_incremental(self.samples)
+        full = Path(self.directory.name) / "full.sqlite3"
+        SQLiteDBFilter(self.samples, chunksize=7, max_cases=2).write(full)
+        for table in ("dewolf_errors", "summary"):
+            with self.subTest(table=table):
+                assert_frame_equal(self.read_table(self.filtered, table), self.read_table(full, table))
+        # no new rows: nothing is written
+        self.run_incremental(self.samples)
+        assert_frame_equal(self.read_table(self.filtered, "dewolf_errors"), self.read_table(full, "dewolf_errors"))
+
+    def test_rotated_input_starts_a_new_mark(self):
+        write_samples(self.samples, self.rows)
+        self.run_incremental(self.samples)
+        # rotated by renaming: the new file has fewer rows than the mark of the old one
+        self.samples.rename(self.samples.with_suffix(".1"))
+        write_samples(self.samples, [failed_row(10, function, "OSError: new", "dataflow.py:1") for function in range(3)])
+        self.run_incremental(self.samples)
+        with sqlite3.connect(self.filtered) as con:
+            progress = con.execute("SELECT source, last_rowid FROM filter_progress ORDER BY id").fetchall()
+            new_errors = con.execute(
+                "SELECT errors_per_group_count_pre_filter FROM dewolf_errors WHERE dewolf_exception = 'OSError: new'"
+            ).fetchall()
+            summaries = con.execute("SELECT total_functions FROM summary ORDER BY id").fetchall()
+        con.close()
+        stat = self.samples.stat()
+        self.assertEqual(len(progress), 2)
+        self.assertEqual(progress[0][1], len(self.rows))
+        self.assertEqual(progress[1], (f"{stat.st_dev}:{stat.st_ino}", 3))
+        self.assertEqual(new_errors, [(3,), (3,)])
+        self.assertEqual(summaries, [(len(self.rows),), (3,)])
+
+    def test_surplus_cases_are_pruned(self):
+        # the same error in every increment, each smaller than the ones before
+        for basic_blocks in (9, 7, 8, 3, 5):
+            write_samples(self.samples, [failed_row(basic_blocks, 0, function_basic_block_count=basic_blocks)])
+            self.run_incremental(self.samples)
+        with sqlite3.connect(self.filtered) as con:
+            rows = con.execute(
+                "SELECT function_basic_block_count, errors_per_group_count_pre_filter FROM dewolf_errors ORDER BY 1"
+            ).fetchall()
+            representative = con.execute("SELECT function_basic_block_count FROM case_group_representatives").fetchall()
+        con.close()
+        self.assertEqual(rows, [(3, 5), (5, 5)])
+        self.assertEqual(representative, [(3,)])
+
+
+class CaseGroupRepresentativesTests(unittest.TestCase):
+    # the index view without case_group_representatives: smallest case per case group with ROW_NUMBER
+    FALLBACK_QUERY = """SELECT case_group, function_basic_block_count, errors_per_group_count_pre_filter FROM (
+            SELECT *, ROW_NUMBER() OVER (PARTITION BY case_group ORDER BY function_basic_block_count ASC) AS row_number
+            FROM dewolf_errors
+            WHERE dewolf_current_commit = ? AND tag IS ?
+        )
+        WHERE row_number = 1
+        ORDER BY case_group
+    """
+    # the index view with case_group_representatives
+    REPRESENTATIVES_QUERY = """SELECT e.case_group, e.function_basic_block_count, e.errors_per_group_count_pre_filter
+        FROM case_group_representatives r
+        JOIN dewolf_errors e ON e.id = r.dewolf_error_id
+        WHERE r.dewolf_current_commit = ? AND r.tag IS ?
+        ORDER BY e.case_group
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filtered = Path(self.directory.name) / "filtered.sqlite3"
+        rng = random.Random(8)
+        self.rows = [
+            failed_row(
+                sample,
+                function,
+                rng.choice(["ValueError: bad value", "KeyError: 'x'", "IndexError: out of range"]),
+                f"cfg.py:{rng.randint(1, 4)}",
+                function_basic_block_count=rng.choice([None, *range(1, 8)]),
+            )
+            for sample in range(8)
+            for function in range(8)
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def samples(self, name: str, rows: list) -> Path:
+        return write_samples(Path(self.directory.name) / name, rows)
+
+    def assert_same_as_fallback(self, tags: list):
+        with sqlite3.connect(self.filtered) as con:
+            for tag in tags:
+                with self.subTest(tag=tag):
+                    representatives = con.execute(self.REPRESENTATIVES_QUERY, (COMMIT, tag)).fetchall()
+                    self.assertTrue(representatives)
+                    self.assertEqual(representatives, con.execute(self.FALLBACK_QUERY, (COMMIT, tag)).fetchall())
+            # stored columns of the representatives
+            self.assertEqual(
+                con.execute(
+                    """SELECT count(*) FROM case_group_representatives r JOIN dewolf_errors e ON e.id = r.dewolf_error_id
+                    WHERE r.case_group IS NOT e.case_group OR r.tag IS NOT e.tag
+                    OR r.function_basic_block_count IS NOT e.function_basic_block_count
+                    OR r.errors_per_group_count_pre_filter IS NOT e.errors_per_group_count_pre_filter"""
+                ).fetchone()[0],
+                0,
+            )
+        con.close()
+
+    def test_full_write(self):
+        for tag, rows in (("quick", self.rows[:32]), ("long", self.rows[32:]), (None, self.rows)):
+            db_filter = SQLiteDBFilter(self.samples(f"{tag}.sqlite3", rows), chunksize=10, max_cases=3)
+            db_filter.tag = tag
+            db_filter.write(self.filtered)
+        self.assert_same_as_fallback(["quick", "long", None])
+
+    def test_incremental_pruning(self):
+        samples = Path(self.directory.name) / "samples.sqlite3"
+        for i in range(0, len(self.rows), 16):
+            write_samples(samples, self.rows[i : i + 16])
+            db_filter = IncrementalDBFilter(samples, chunksize=10, max_cases=2)
+            db_filter.tag = "long"
+            db_filter.write(self.filtered)
+            self.assert_same_as_fallback(["long"])
+
+
+class DifferentialRunTests(unittest.TestCase):
+    """--worklist of the failed functions of a commit and the --differential report of a run of it"""
+
+    NEW_COMMIT = "fedcba9876543210fedcba9876543210fedcba98"
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        self.baseline = self.path / "filtered.sqlite3"
+        rows = [
+            failed_row(0, 0),  # ValueError@cfg.py:1
+            failed_row(0, 1),  # ValueError@cfg.py:2
+            failed_row(1, 0, "KeyError: 'x'"),  # KeyError@cfg.py:1
+            failed_row(1, 3),  # ValueError@cfg.py:1
+            function_row(2, 0),
+        ]
+        SQLiteDBFilter(write_samples(self.path / "baseline.sqlite3", rows)).write(self.baseline)
+        # failed with another commit
+        other = write_samples(self.path / "other.sqlite3", [failed_row(3, 0, dewolf_current_commit="f" * 40)])
+        SQLiteDBFilter(other).write(self.baseline)
+        new = {"dewolf_current_commit": self.NEW_COMMIT}
+        self.run = write_samples(
+            self.path / "samples.sqlite3",
+            [
+                failed_row(0, 0, **new),
+                function_row(0, 0, **new),  # fixed by the last run of the function
+                failed_row(0, 1, **new),
+                failed_row(1, 0, "KeyError: 'x'", "cfg.py:5", **new),  # changed to a new case group
+                function_row(2, 0, **new),
+            ],
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def worklist(self, commit: str) -> list:
+        output = io.StringIO()
+        with redirect_stdout(output):
+            print_worklist(self.baseline, commit)
+        return output.getvalue().splitlines()
+
+    def test_worklist(self):
+        self.assertEqual(self.worklist(COMMIT), [f"{0:064x}\tsub_0", f"{0:064x}\tsub_1", f"{1:064x}\tsub_0", f"{1:064x}\tsub_3"])
+        self.assertEqual(self.worklist("f" * 8), [f"{3:064x}\tsub_0"])
+
+    def test_report_categories(self):
+        report = differential_report(self.run, self.baseline, COMMIT)
+        self.assertEqual(list(report.columns), ["fixed", "still_failing", "changed", "not_run", "new"])
+        self.assertEqual(
+            report.to_dict("index"),
+            {
+                "KeyError@cfg.py:1": {"fixed": 0, "still_failing": 0, "changed": 1, "not_run": 0, "new": 0},
+                "KeyError@cfg.py:5": {"fixed": 0, "still_failing": 0, "changed": 0, "not_run": 0, "new": 1},
+                "ValueError@cfg.py:1": {"fixed": 1, "still_failing": 0, "changed": 0, "not_run": 1, "new": 0},
+                "ValueError@cfg.py:2": {"fixed": 0, "still_failing": 1, "changed": 0, "not_run": 0, "new": 0},
+            },
+        )
+        output = io.StringIO()
+        with redirect_stdout(output):
+            print_differential_report(self.run, self.baseline, COMMIT)
+        self.assertEqual(output.getvalue().splitlines()[-1], "1 fixed, 1 still failing, 1 changed, 1 not run, 1 new")
+
+
+if __name__ == "__main__":
+    unittest.main()
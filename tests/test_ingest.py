@@ -0,0 +1,57 @@
+import struct
+import tempfile
+import unittest
+from pathlib import Path
+
+from ingest import COFF_HEADER, file_type, inspect
+
+
+def coff_object(machine: int = 0x8664, sections: int = 2, optional_header_size: int = 0) -> bytes:
+    """COFF object file with empty sections, its symbol table follows the section headers"""
+    symbol_table = COFF_HEADER.size + optional_header_size + 40 * sections
+    header = COFF_HEADER.pack(machine, sections, 0, symbol_table, 0, optional_header_size, 0)
+    return header + bytes(symbol_table - COFF_HEADER.size) + struct.pack("<I", 4)
+
+
+class FileTypeTests(unittest.TestCase):
+    def assert_type(self, content: bytes, expected):
+        self.assertEqual(file_type(content[: COFF_HEADER.size], len(content)), expected, content[:8])
+
+    def test_executables(self):
+        self.assert_type(b"\x7fELF\x02\x01\x01" + bytes(57), "ELF")
+        self.assert_type(b"MZ\x90\x00" + bytes(60), "PE/DOS")
+        for magic in (b"\xfe\xed\xfa\xce", b"\xcf\xfa\xed\xfe"):
+            self.assert_type(magic + bytes(28), "Mach-O")
+
+    def test_universal_binary_and_java_class_file(self):
+        self.assert_type(b"\xca\xfe\xba\xbe" + struct.pack(">I", 2) + bytes(40), "Mach-O")
+        self.assert_type(b"\xca\xfe\xba\xbe" + struct.pack(">HH", 0, 52) + bytes(40), None)  # Java 8 class file
+
+    def test_coff_objects(self):
+        for machine in (0x014C, 0x8664, 0xAA64, 0x0200):
+            self.assert_type(coff_object(machine), "COFF")
+
+    def test_rejected_files(self):
+        self.assert_type(b"", None)
+        self.assert_type(b"#!/bin/sh\necho hello\n", None)
+        self.assert_type(b"L\x01", None)  # i386 machine, shorter than a COFF header
+        self.assert_type(bytes(4096), None)
+        self.assert_type(b"\x00\x02" + bytes(4094), None)  # IA64 machine 0x0200, but no sections
+        self.assert_type(b"\x00\x02\x01\x00" + bytes(16) + b"text", None)  # one section, its header does not fit
+        self.assert_type(coff_object(0x1234), None)
+        self.assert_type(coff_object()[:99], None)  # section headers do not fit the file
+        self.assert_type(coff_object(optional_header_size=0xFFFF)[:200], None)
+
+    def test_inspect(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "object.o"
+            path.write_bytes(coff_object())
+            _, kind, sha256, size = inspect(str(path))
+            self.assertEqual((kind, size), ("COFF", len(coff_object())))
+            self.assertEqual(len(sha256), 64)
+            path.write_bytes(bytes(4096))
+            self.assertEqual(inspect(str(path))[1:3], (None, None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+from typing import Optional
+
+from prioritize import REPRESENTATIVE_WEIGHT, priorities
+
+
+def stats(processed_functions: int, errors: int, seconds: float, decompilable_functions: Optional[int] = None) -> dict:
+    """History of a sample as returned by HISTORY_QUERY"""
+    return {
+        "processed_functions": processed_functions,
+        "errors": errors,
+        "decompilable_functions": decompilable_functions,
+        "seconds": seconds,
+    }
+
+
+class PrioritiesTests(unittest.TestCase):
+    def setUp(self):
+        self.history = {
+            "cheap": stats(8, 6, 2.0),  # (6 + 1) / (8 + 2) / 2s
+            "slow": stats(8, 2, 10.0),  # (2 + 1) / (8 + 2) / 10s
+            # no duration (a single timestamp): 3 functions at the mean 12s / 18 functions per function
+            "estimated": stats(2, 0, 0.0, decompilable_functions=3),
+        }
+        self.expected = {"cheap": 0.35, "slow": 0.03, "estimated": 0.125}
+
+    def assert_priorities(self, result: dict, expected: dict):
+        self.assertEqual(list(result), list(expected))
+        for sample_hash, priority in expected.items():
+            self.assertAlmostEqual(result[sample_hash], priority, msg=sample_hash)
+
+    def test_samples_without_history_get_the_median(self):
+        result = priorities(["new", *self.history, "other"], self.history, set(), {})
+        self.assert_priorities(result, {"new": 0.125, **self.expected, "other": 0.125})
+        # median of an even number of samples with history
+        del self.history["estimated"]
+        self.assert_priorities(priorities(["new", "cheap", "slow"], self.history, set(), {}), {"new": 0.19, "cheap": 0.35, "slow": 0.03})
+
+    def test_no_history(self):
+        self.assertEqual(priorities(["a", "b"], {}, set(), {}), {"a": 0.0, "b": 0.0})
+        self.assertEqual(priorities([], self.history, set(), {}), {})
+
+    def test_representatives_and_recorded_seconds(self):
+        # the median is taken over the weighted priorities of the samples to prioritize only
+        result = priorities(["slow", "cheap", "new"], self.history, {"slow"}, {"cheap": 0.5})
+        self.assert_priorities(result, {"slow": 0.03 * REPRESENTATIVE_WEIGHT, "cheap": 0.7, "new": (0.12 + 0.7) / 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
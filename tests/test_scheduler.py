@@ -0,0 +1,212 @@
+import io
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from scheduler import PersistentScheduler, Scheduler
+from webapp.samples.store import SampleStore
+
+ROOT = Path(__file__).absolute().parent.parent
+
+# --command task: logs the sample, copies the healthcheck file written before the start of the task, and
+# exits like a bugfinder run: 124 (hash starts with f, coreutils timeout), hangs (e), fails (d), or succeeds
+TASK = """import sys, time
+from pathlib import Path
+sample_hash, sqlite_file, directory = sys.argv[1:]
+with open(f"{directory}/runs.log", "a") as log:
+    log.write(f"{sample_hash} {sqlite_file}\\n")
+for _ in range(100):  # the scheduler may be rewriting the file for another slot
+    if running := Path(f"{directory}/healthcheck.txt").read_text():
+        break
+    time.sleep(0.01)
+Path(f"{directory}/{sample_hash}.healthcheck").write_text(running)
+if sample_hash.startswith("f"):
+    sys.exit(124)
+if sample_hash.startswith("e"):
+    time.sleep(60)
+sys.exit(1 if sample_hash.startswith("d") else 0)
+"""
+
+
+def sample_hash(prefix: str, number: int) -> str:
+    return prefix + f"{number:063x}"
+
+
+class SchedulerCommandTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        (self.path / "task.py").write_text(TASK)
+        self.command = f"{sys.executable} {self.path / 'task.py'} {{sample_hash}} {{sqlite_file}} {self.path}"
+        self.progress = self.path / "progress.txt"
+        self.healthcheck = self.path / "healthcheck.txt"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def runs(self) -> list:
+        return sorted((self.path / "runs.log").read_text().splitlines())
+
+    def test_every_sample_runs_once(self):
+        samples = [sample_hash("0", i) for i in range(20)] + [sample_hash("d", 0)]
+        scheduler = Scheduler(
+            workers=4,
+            data_dir=self.path,
+            command=self.command,
+            total=len(samples),
+            progress_file=self.progress,
+            healthcheck_file=self.healthcheck,
+        )
+        metrics = scheduler.run(io.StringIO("".join(f"{sample}\n" for sample in samples) + "not a sample hash\n"))
+        self.assertEqual((metrics["processed"], metrics["timeouts"], metrics["failures"]), (21, 0, 1))
+        self.assertEqual(self.runs(), sorted(f"{sample} {self.path / 'samples.sqlite3'}" for sample in samples))
+
+    def test_timeouts(self):
+        samples = [sample_hash("f", 0), sample_hash("e", 0), sample_hash("0", 0)]
+        scheduler = Scheduler(workers=3, max_time=2, data_dir=self.path, command=self.command, healthcheck_file=self.healthcheck)
+        metrics = scheduler.run(io.StringIO("\n".join(samples)))
+        # exit code 124 of the in-container timeout, and a task killed after max_time
+        self.assertEqual((metrics["processed"], metrics["timeouts"], metrics["failures"]), (3, 2, 0))
+        self.assertEqual(len(self.runs()), 3)
+
+    def test_progress_and_healthcheck_files(self):
+        samples = [sample_hash("0", i) for i in range(5)]
+        scheduler = Scheduler(
+            workers=2,
+            data_dir=self.path,
+            command=self.command,
+            label="quick",
+            total=4,
+            progress_file=self.progress,
+            healthcheck_file=self.healthcheck,
+        )
+        scheduler.run(io.StringIO("\n".join(samples)))
+        # total is raised to the number of samples read
+        self.assertEqual(self.progress.read_text(), "5/5\n")
+        self.assertEqual(self.healthcheck.read_text(), "quick run slots (0/2 busy):\n")
+        for sample in samples:
+            running = (self.path / f"{sample}.healthcheck").read_text()
+            self.assertTrue(running.startswith("quick run slots ("), running)
+            self.assertRegex(running, rf"slot [01]: {sample} \(\d+s\)")
+
+    def test_command_line(self):
+        samples = self.path / "samples.txt"
+        samples.write_text("".join(f"{sample_hash('0', i)}\n" for i in range(3)))
+        result = subprocess.run(
+            [sys.executable, "scheduler.py", "-i", samples, "--workers", "2", "--data-dir", self.path, "--command", self.command]
+            + ["--total", "3", "--progress", self.progress, "--healthcheck", self.healthcheck],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertIn("default run: 3 samples", result.stderr)
+        self.assertEqual(self.progress.read_text(), "3/3\n")
+        self.assertEqual(len(self.runs()), 3)
+
+
+# stand-ins for Binary Ninja (a sample file holds its number of functions) and for bugfinder.py, which writes a row
+# per function of BinaryView.functions with the function counts it derives from them
+BINARYNINJA = """class Function:
+    def __init__(self, name):
+        self.name = name
+
+
+class BinaryView:
+    def __init__(self, path):
+        self.path = path
+
+    @property
+    def functions(self):
+        with open(self.path) as sample:
+            return [Function(f"sub_{i}") for i in range(int(sample.read()))]
+"""
+BUGFINDER = """import os, sqlite3, sys
+import binaryninja
+sample_path, _, sqlite_file = sys.argv[1:]
+functions = binaryninja.BinaryView(sample_path).functions
+with sqlite3.connect(sqlite_file) as con:
+    con.execute(
+        "CREATE TABLE IF NOT EXISTS dewolf (id INTEGER NOT NULL PRIMARY KEY, function_name TEXT, sample_hash TEXT, "
+        "sample_total_function_count INTEGER, sample_decompilable_function_count INTEGER)"
+    )
+    for function in functions:
+        con.execute(
+            "INSERT INTO dewolf (function_name, sample_hash, sample_total_function_count, sample_decompilable_function_count) "
+            "VALUES (?, ?, ?, ?)",
+            (function.name, os.path.basename(sample_path), len(functions), len(functions)),
+        )
+"""
+
+
+class ShardTests(unittest.TestCase):
+    """PersistentScheduler --shard-functions, with worker_agent.py as local agent"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        (self.path / "modules").mkdir()
+        (self.path / "modules" / "binaryninja.py").write_text(BINARYNINJA)
+        (self.path / "bugfinder.py").write_text(BUGFINDER)
+        self.store = SampleStore(self.path)
+        self.functions = {}
+        for number, functions in enumerate((12, 3)):
+            sample = self.path / f"sample-{number}"
+            sample.write_text(str(functions))
+            sha256 = sample_hash("0", number)
+            self.store.add(sample, sha256)
+            self.functions[sha256] = functions
+        # known from the history (prioritize.py), 10 of the 12 functions of the large sample were decompilable
+        self.store.set_priorities(dict.fromkeys(self.functions, 1.0), {sample_hash("0", 0): 10, sample_hash("0", 1): 3})
+        self.store.queue()
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def scheduler(self) -> PersistentScheduler:
+        command = (
+            f"env PYTHONPATH={self.path / 'modules'} {sys.executable} {ROOT / 'worker_agent.py'} --socket {{socket}} "
+            f"--script {self.path / 'bugfinder.py'} --max-time 30 --max-samples {{max_samples}} --sqlite-file {{sqlite_file}}"
+        )
+        return PersistentScheduler(workers=3, data_dir=self.path, command=command, samples_per_container=10, shard_functions=4)
+
+    def test_shards_keep_whole_sample_function_counts(self):
+        metrics = self.scheduler().run(io.StringIO("".join(f"{sha256}\n" for sha256 in self.functions)))
+        self.assertEqual((metrics["processed"], metrics["failures"], metrics["timeouts"]), (2, 0, 0))
+        with sqlite3.connect(self.path / "samples.sqlite3") as con:
+            rows = con.execute(
+                "SELECT sample_hash, function_name, sample_total_function_count, sample_decompilable_function_count FROM dewolf"
+            ).fetchall()
+        con.close()
+        large, small = sample_hash("0", 0), sample_hash("0", 1)
+        # the large sample in 3 shards (every 3rd function), each function once, with the counts of the whole sample
+        self.assertEqual(sorted(row[1] for row in rows if row[0] == large), sorted(f"sub_{i}" for i in range(12)))
+        self.assertEqual({row[2:] for row in rows if row[0] == large}, {(12, 10)})
+        # the small sample in one task, counted by bugfinder
+        self.assertEqual(sorted(row[1:] for row in rows if row[0] == small), [(f"sub_{i}", 3, 3) for i in range(3)])
+        self.assertEqual(set(self.store.recorded_runs()), set(self.functions))
+        self.assertEqual(self.store.count(queued=True), 0)
+
+    def test_sample_finishes_with_its_last_shard(self):
+        scheduler = self.scheduler()
+        large = sample_hash("0", 0)
+        shards = scheduler._tasks(large, [])
+        self.assertEqual([(shard.index, shard.count, shard.decompilable_functions) for shard in shards], [(i, 3, 10) for i in range(3)])
+        for slot, shard in enumerate(shards):
+            # the sample stays queued, and its run is not recorded, until the last shard is done
+            self.assertEqual((self.store.count(queued=True), large in self.store.recorded_runs()), (2, False))
+            scheduler._running[slot] = (shard, time.monotonic() - 1)
+            scheduler._record(slot, shard, timed_out=slot == 1, failed=slot == 1)
+        seconds, timed_out = self.store.recorded_runs()[large]
+        self.assertGreaterEqual(seconds, 3)  # time of all shards
+        self.assertTrue(timed_out)
+        self.assertEqual(self.store.count(queued=True), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+import hashlib
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from webapp.samples.store import COLD, HOT, SampleStore
+
+ROOT = Path(__file__).absolute().parent.parent
+
+
+class SampleStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = Path(self.directory.name) / "data"
+        self.store = SampleStore(self.root)
+
+    def tearDown(self):
+        self.store.close()
+        self.directory.cleanup()
+
+    def sample(self, content: bytes) -> tuple:
+        """File outside of the store and its sha256"""
+        path = Path(self.directory.name) / hashlib.md5(content).hexdigest()
+        path.write_bytes(content)
+        return path, hashlib.sha256(content).hexdigest()
+
+    def add_samples(self, count: int) -> list:
+        hashes = []
+        for i in range(count):
+            path, sha256 = self.sample(b"sample %d" % i)
+            self.store.add(path, sha256)
+            hashes.append(sha256)
+        return hashes
+
+    def test_add_and_hardlink_tiers(self):
+        path, sha256 = self.sample(b"\x7fELF sample")
+        self.assertTrue(self.store.add(path, sha256))
+        self.assertFalse(path.exists())
+        hot = self.store.locate(sha256, [HOT])
+        self.assertEqual(hot, self.root / "samples" / sha256[:2] / sha256[2:4] / sha256)
+        # the same sample in another tier is a hardlink, in the same tier it is dropped
+        path, _ = self.sample(b"\x7fELF sample")
+        self.assertTrue(self.store.add(path, tier=COLD))
+        self.assertEqual(self.store.locate(sha256, [COLD]).stat().st_ino, hot.stat().st_ino)
+        path, _ = self.sample(b"\x7fELF sample")
+        self.assertFalse(self.store.add(path, sha256, tier=COLD))
+        self.assertFalse(path.exists())
+        self.assertEqual((self.store.count(HOT), self.store.count(COLD), self.store.count()), (1, 1, 1))
+        # moved to cold storage: only in the cold tier, and no longer queued
+        self.store.queue()
+        self.assertTrue(self.store.move(sha256, COLD))
+        self.assertIsNone(self.store.locate(sha256, [HOT]))
+        self.assertEqual((self.store.count(HOT), self.store.count(COLD), self.store.count(queued=True)), (0, 1, 0))
+        self.assertEqual(self.store.size_and_functions(sha256), (len(b"\x7fELF sample"), None))
+
+    def test_migrate_flat_layout(self):
+        flat = {}
+        for tier, content in ((HOT, b"hot"), (COLD, b"cold")):
+            (self.root / tier).mkdir(parents=True)
+            sha256 = hashlib.sha256(content).hexdigest()
+            (self.root / tier / sha256).write_bytes(content)
+            flat[tier] = sha256
+        (self.root / HOT / "notes.txt").write_text("not a sample")
+        # flat samples are found before the migration
+        self.assertEqual(self.store.locate(flat[HOT]), self.root / HOT / flat[HOT])
+        self.assertEqual(self.store.migrate(), 2)
+        for tier, sha256 in flat.items():
+            self.assertEqual(self.store.locate(sha256, [tier]), self.store.path(sha256, tier))
+            self.assertEqual(list(self.store.hashes(tier)), [sha256])
+            self.assertFalse((self.root / tier / sha256).exists())
+        self.assertTrue((self.root / HOT / "notes.txt").exists())
+        self.assertEqual(self.store.migrate(), 0)
+
+    def test_take_only_and_keep(self):
+        hashes = self.add_samples(5)
+        self.assertEqual(self.store.queue(), 5)
+        self.store.set_priorities({sha256: priority for priority, sha256 in enumerate(hashes)}, {})
+        self.store.record_run(hashes[4], 10.0, timed_out=True)  # unqueued, and taken last once queued again
+        self.store.queue()
+        only = hashes[1:]
+        self.assertEqual(self.store.take(2, only, unqueue=False), [hashes[3], hashes[2]])
+        self.assertEqual(self.store.take(only=only, unqueue=False), [hashes[3], hashes[2], hashes[1], hashes[4]])
+        self.assertEqual(self.store.count(queued=True), 5)
+        # the scheduler unqueues a sample when it records its run
+        self.store.record_run(hashes[3], 1.5, timed_out=False)
+        self.assertEqual(self.store.take(only=only, unqueue=False), [hashes[2], hashes[1], hashes[4]])
+        self.assertEqual(self.store.recorded_runs(), {hashes[3]: (1.5, False), hashes[4]: (10.0, True)})
+        # without keep, taken samples are unqueued at once
+        self.assertEqual(self.store.take(1), [hashes[2]])
+        self.assertEqual(self.store.count(queued=True), 3)
+
+    def test_take_command(self):
+        hashes = self.add_samples(3)
+        self.store.queue()
+        only = Path(self.directory.name) / "only.txt"
+        only.write_text(f"{hashes[0].upper()}\n\n{hashes[2]}\n")
+        command = [sys.executable, "-m", "webapp.samples.store", "--root", self.root, "take", "--only", only]
+        for arguments, queued in ((["--keep"], 3), ([], 1)):
+            result = subprocess.run(command + arguments, cwd=ROOT, capture_output=True, text=True)
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertEqual(sorted(result.stdout.split()), sorted([hashes[0], hashes[2]]))
+            self.assertEqual(self.store.count(queued=True), queued)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from watcher import Watcher, settled_files
+
+SETTLE = 0.3
+
+
+class SettledFilesTests(unittest.TestCase):
+    """settled_files with the polling fallback (Watcher), as without inotify"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def batches(self, timeout: float) -> list:
+        """Batches of settled file names, with the seconds since the start at which they were yielded"""
+        start = time.monotonic()
+        watcher = Watcher(self.path, poll_interval=0.05)
+        return [([path.name for path in batch], time.monotonic() - start) for batch in settled_files(watcher, SETTLE, timeout)]
+
+    def write_later(self, delay: float, name: str, content: bytes):
+        def append():
+            with open(self.path / name, "ab") as file:
+                file.write(content)
+
+        timer = threading.Timer(delay, append)
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+    def test_existing_files(self):
+        old = self.path / "old"
+        old.write_bytes(b"sample")
+        os.utime(old, (time.time() - 60, time.time() - 60))
+        (self.path / "new").write_bytes(b"sample")
+        (self.path / ".gitignore").write_text("*\n")
+        batches = self.batches(timeout=2 * SETTLE)
+        # settled since its modification time, the new file only after settle seconds
+        self.assertEqual([names for names, _ in batches], [["old"], ["new"]])
+        self.assertLess(batches[0][1], SETTLE)
+        self.assertGreaterEqual(batches[1][1], SETTLE * 0.9)
+
+    def test_file_settles_after_the_last_write(self):
+        for delay in (0.1, 0.2, 0.3, 0.4):
+            self.write_later(delay, "copying", b"part")
+        batches = self.batches(timeout=1.5)
+        # yielded once, after it stopped changing, and not again
+        self.assertEqual([names for names, _ in batches], [["copying"]])
+        self.assertGreaterEqual(batches[0][1], 0.4 + SETTLE * 0.9)
+        self.assertEqual((self.path / "copying").read_bytes(), b"part" * 4)
+
+    def test_removed_file_is_not_yielded(self):
+        (self.path / "ingested").write_bytes(b"sample")
+        threading.Timer(0.1, (self.path / "ingested").unlink).start()
+        self.write_later(0.2, "other", b"sample")
+        self.assertEqual([names for names, _ in self.batches(timeout=1.0)], [["other"]])
+
+    def test_timeout_without_files(self):
+        start = time.monotonic()
+        self.assertEqual(self.batches(timeout=0.3), [])
+        self.assertLess(time.monotonic() - start, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+import json
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from tests.samples_db import function_row, write_samples
+from worker_agent import TIMEOUT_EXIT_CODE, append_rows, run_sample
+
+ROOT = Path(__file__).absolute().parent.parent
+
+# stands in for bugfinder.py, the sample name selects the outcome: ok, exit3, crash (SIGSEGV),
+# or hang (also starts a process that has to be killed with it, its pid is written next to the sample)
+BUGFINDER = """import faulthandler, os, signal, subprocess, sys, time
+sample_path, _, sqlite_file = sys.argv[1:]
+name = os.path.basename(sample_path)
+with open(sqlite_file, "a") as output:
+    output.write(f"{name} {os.getpid()}\\n")
+if name == "exit3":
+    sys.exit(3)
+if name == "crash":
+    faulthandler.disable()  # enabled by pytest in the forked test process
+    os.kill(os.getpid(), signal.SIGSEGV)
+if name == "hang":
+    sleeper = subprocess.Popen(["sleep", "60"])
+    with open(sample_path + ".pid", "w") as pid_file:
+        pid_file.write(str(sleeper.pid))
+    time.sleep(60)
+"""
+
+
+def is_running(pid: int) -> bool:
+    """Process exists and is not a zombie"""
+    try:
+        return Path(f"/proc/{pid}/stat").read_text().rpartition(")")[2].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+
+class WorkerAgentTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        self.script = self.path / "bugfinder.py"
+        self.script.write_text(BUGFINDER)
+        self.output = self.path / "output.txt"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_sample(self, name: str, max_time: int = 2) -> dict:
+        return run_sample(str(self.script), str(self.path / name), str(self.output), max_time)
+
+    def test_exit_codes(self):
+        self.assertEqual(self.run_sample("ok")["exit_code"], 0)
+        self.assertEqual(self.run_sample("exit3")["exit_code"], 3)
+        crash = self.run_sample("crash")
+        self.assertEqual((crash["exit_code"], crash["timed_out"]), (-signal.SIGSEGV, False))
+        # every sample ran in its own child
+        pids = [line.split()[1] for line in self.output.read_text().splitlines()]
+        self.assertEqual(len(set(pids)), 3)
+        self.assertNotIn(str(os.getpid()), pids)
+
+    def test_hung_sample_is_killed_with_its_processes(self):
+        result = self.run_sample("hang", max_time=1)
+        self.assertEqual((result["exit_code"], result["timed_out"]), (TIMEOUT_EXIT_CODE, True))
+        self.assertLess(result["seconds"], 10)
+        sleeper = int((self.path / "hang.pid").read_text())
+        for _ in range(50):
+            if not is_running(sleeper):
+                break
+            time.sleep(0.1)
+        self.assertFalse(is_running(sleeper))
+
+
+class AgentProtocolTests(unittest.TestCase):
+    """worker_agent.py as started by PersistentScheduler, the test is the scheduler end of the slot's socket"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name)
+        (self.path / "bugfinder.py").write_text(BUGFINDER)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(str(self.path / "slot.sock"))
+        self.server.listen(1)
+        self.server.settimeout(30)
+
+    def tearDown(self):
+        self.server.close()
+        self.directory.cleanup()
+
+    def start_agent(self, max_samples: int) -> subprocess.Popen:
+        command = [sys.executable, ROOT / "worker_agent.py", "--socket", self.path / "slot.sock", "--script", self.path / "bugfinder.py"]
+        command += ["--samples-dir", self.path, "--sqlite-file", self.path / "output.txt", "--max-time", "1"]
+        command += ["--max-samples", str(max_samples), "--preload", ""]
+        agent = subprocess.Popen(command, stderr=subprocess.DEVNULL)
+        self.addCleanup(agent.wait)
+        self.addCleanup(agent.kill)
+        return agent
+
+    def test_crashed_and_hung_samples_leave_the_agent_alive(self):
+        agent = self.start_agent(max_samples=4)
+        connection, _ = self.server.accept()
+        with connection, connection.makefile("r") as messages:
+            self.assertEqual(json.loads(messages.readline()), {"ready": True})
+            results = []
+            for name in ("crash", "hang", "exit3", "ok"):
+                connection.sendall((json.dumps({"sample_hash": name}) + "\n").encode())
+                results.append(json.loads(messages.readline()))
+                self.assertIsNone(agent.poll())
+            self.assertEqual(messages.readline(), "")  # closed after max_samples
+        self.assertEqual(agent.wait(timeout=10), 0)
+        self.assertEqual([result["sample_hash"] for result in results], ["crash", "hang", "exit3", "ok"])
+        self.assertEqual([result["exit_code"] for result in results], [-signal.SIGSEGV, TIMEOUT_EXIT_CODE, 3, 0])
+        self.assertEqual([result["timed_out"] for result in results], [False, True, False, False])
+        self.assertEqual([result["ready"] for result in results], [True, True, True, False])
+
+    def test_exit_message(self):
+        agent = self.start_agent(max_samples=0)
+        connection, _ = self.server.accept()
+        with connection, connection.makefile("r") as messages:
+            self.assertEqual(json.loads(messages.readline()), {"ready": True})
+            connection.sendall((json.dumps({"sample_hash": "ok", "sample_path": str(self.path / "ok")}) + "\n").encode())
+            self.assertEqual(json.loads(messages.readline())["ready"], True)
+            connection.sendall(b'{"exit": true}\n')
+            self.assertEqual(agent.wait(timeout=10), 0)
+        self.assertEqual((self.path / "output.txt").read_text().split()[0], "ok")
+
+
+class AppendRowsTests(unittest.TestCase):
+    """Rows of a restricted task (shard or function list) get the function counts of the whole sample"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.task_db = Path(self.directory.name) / "task.sqlite3"
+        self.sqlite_file = Path(self.directory.name) / "samples.sqlite3"
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def counts(self) -> list:
+        with sqlite3.connect(self.sqlite_file) as con:
+            rows = con.execute(
+                "SELECT id, function_name, sample_total_function_count, sample_decompilable_function_count FROM dewolf ORDER BY id"
+            ).fetchall()
+        con.close()
+        return rows
+
+    def test_whole_sample_counts(self):
+        # a shard of 3 of the 12 functions, bugfinder counted the functions of the shard
+        shard = [function_row(0, function, sample_total_function_count=3, sample_decompilable_function_count=3) for function in (0, 4, 8)]
+        write_samples(self.task_db, shard)
+        write_samples(self.sqlite_file, [function_row(1, 0)])
+        self.assertEqual(append_rows(str(self.task_db), str(self.sqlite_file), 12, 10), 3)
+        self.assertEqual(self.counts(), [(1, "sub_0", 20, 18), (2, "sub_0", 12, 10), (3, "sub_4", 12, 10), (4, "sub_8", 12, 10)])
+
+    def test_unknown_counts(self):
+        # the child did not report the number of all functions, the scheduler had no history: the total is kept
+        write_samples(self.task_db, [function_row(0, 0, sample_total_function_count=3)])
+        self.assertEqual(append_rows(str(self.task_db), str(self.sqlite_file), None, None), 1)
+        self.assertEqual(self.counts(), [(1, "sub_0", 3, None)])
+
+    def test_no_rows(self):
+        self.assertEqual(append_rows(str(self.task_db), str(self.sqlite_file), 12, 10), 0)
+        sqlite3.connect(self.task_db).close()  # no function finished, bugfinder created no table
+        self.assertEqual(append_rows(str(self.task_db), str(self.sqlite_file), 12, 10), 0)
+        with sqlite3.connect(self.sqlite_file) as con:
+            self.assertEqual(con.execute("SELECT name FROM sqlite_master").fetchall(), [])
+        con.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+"""
+Vectorized traceback parsing for DBFilter.
+
+Failed runs share few distinct tracebacks (the same bug crashes many functions), so every function works on the
+unique values of a column and maps the result back to the rows.
+"""
+import re
+from typing import Callable
+
+from pandas import DataFrame, Series
+
+# last 'File "<path>", line <n>' of a traceback, equivalent to traceback.rpartition("File ")[-1].split(", ")
+LAST_FRAME = re.compile(r"(?s).*File (?P<error_file_path>.*?), (?P<error_line>.*?)(?:, |\Z)")
+# first word of the exception message, e.g., 'ValueError:' of 'ValueError: invalid literal'
+EXCEPTION_TYPE = re.compile(r"^\s*(?P<exception_type>\S+)")
+
+
+def _on_uniques(values: Series, func: Callable[[Series], DataFrame]) -> DataFrame:
+    """Apply func to the unique values of a Series and broadcast the result back to all rows"""
+    # dict hashes str objects directly, pandas.factorize re-encodes every (long) string to UTF-8 first
+    uniques = {}
+    codes = [uniques.setdefault(value, len(uniques)) for value in values]
+    result = func(Series(list(uniques), dtype=object))
+    return result.iloc[codes].set_axis(values.index)
+
+
+def parse_tracebacks(tracebacks: Series) -> DataFrame:
+    """
+    Return DataFrame with error_file_path, error_line and error_location (file.py:42)
+    of the last frame of each traceback
+    """
+
+    def parse(unique_tracebacks: Series) -> DataFrame:
+        frames = unique_tracebacks.str.extract(LAST_FRAME)
+        frames["error_file_path"] = frames["error_file_path"].str.strip('"')
+        frames["error_line"] = frames["error_line"].str.lstrip("line ")
+        frames["error_location"] = frames["error_file_path"].str.rsplit("/", n=1).str[-1] + ":" + frames["error_line"]
+        return frames
+
+    return _on_uniques(tracebacks, parse)
+
+
+def exception_types(exceptions: Series) -> Series:
+    """Return exception type (first word of the message without ': ') for each exception"""
+
+    def parse(unique_exceptions: Series) -> DataFrame:
+        types = unique_exceptions.str.extract(EXCEPTION_TYPE)
+        return types.assign(exception_type=types["exception_type"].str.strip(": "))
+
+    return _on_uniques(exceptions, parse)["exception_type"]
+
+
+def add_case_groups(failed_runs: DataFrame) -> DataFrame:
+    """
+    Add error_file_path, error_line and case_group columns to failed runs.
+    case id for semantic grouping of similar errors: ExceptionType@file.py:42
+    """
+    frames = parse_tracebacks(failed_runs["dewolf_traceback"])
+    failed_runs["error_file_path"] = frames["error_file_path"]
+    failed_runs["error_line"] = frames["error_line"]
+    failed_runs["case_group"] = exception_types(failed_runs["dewolf_exception"]) + "@" + frames["error_location"]
+    return failed_runs
+
+
+def truncate_middle(tracebacks: Series, n: int = 4000, indicator: str = "... TRUNCATED ...") -> Series:
+    """
+    Truncate the middle part of strings that exceed n characters.
+    """
+    half_n = (n - len(indicator)) // 2
+    too_long = tracebacks.str.len() > n
+    if not too_long.any():
+        return tracebacks
+    truncated = tracebacks.copy()
+    long_tracebacks = tracebacks[too_long]
+    truncated[too_long] = long_tracebacks.str[:half_n] + "\n" + indicator + "\n" + long_tracebacks.str[-half_n:]
+    return truncated
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Wait for new files in infolder, instead of sleeping until the next worker loop.
+
+Changes are reported by inotify (Linux, via ctypes), or by scanning the directory every poll_interval seconds if
+inotify is not available. A file is settled once its size and modification time did not change for settle seconds,
+so files that are still being copied (apt_downloader.sh, scp) are not ingested half-written. Settled files are printed
+one path per line; without --stream, the watcher exits after the first batch, or without output after --timeout.
+
+python watcher.py infolder --timeout 600 && python ingest.py infolder data
+"""
+import argparse
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import stat
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT = struct.Struct("iIII")  # wd, mask, cookie, len, followed by the name (len bytes, NUL padded)
+READ_SIZE = 64 * 1024
+IGNORED_NAMES = {".gitignore"}
+
+
+def signature(path: Path) -> Optional[Tuple[int, int]]:
+    """Size and modification time of a regular file, None if it does not exist (anymore)"""
+    try:
+        result = os.stat(path, follow_symlinks=False)
+    except FileNotFoundError:
+        return None
+    return (result.st_size, result.st_mtime_ns) if stat.S_ISREG(result.st_mode) else None
+
+
+def file_names(directory: Path) -> Set[str]:
+    with os.scandir(directory) as entries:
+        return {entry.name for entry in entries if entry.is_file(follow_symlinks=False) and entry.name not in IGNORED_NAMES}
+
+
+class Watcher:
+    """Changed files of a directory (not recursive), found by scanning it every poll_interval seconds"""
+
+    def __init__(self, directory: Path, poll_interval: float = 1.0):
+        self.directory = directory
+        self._poll_interval = poll_interval
+        self._snapshot = self._scan()
+
+    def _scan(self) -> Dict[str, Optional[Tuple[int, int]]]:
+        return {name: signature(self.directory / name) for name in file_names(self.directory)}
+
+    def changes(self, timeout: float) -> Set[str]:
+        """Names of files created or modified within timeout seconds (empty if none)"""
+        deadline = time.monotonic() + timeout
+        while True:
+            snapshot = self._scan()
+            changed = {name for name, value in snapshot.items() if self._snapshot.get(name) != value}
+            self._snapshot = snapshot
+            remaining = deadline - time.monotonic()
+            if changed or remaining <= 0:
+                return changed
+            time.sleep(min(self._poll_interval, remaining))
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(Watcher):
+    """Changed files of a directory, reported by inotify"""
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    def changes(self, timeout: float) -> Set[str]:
+        readable, _, _ = select.select([self._fd], [], [], max(timeout, 0))
+        if not readable:
+            return set()
+        changed = set()
+        try:
+            while data := os.read(self._fd, READ_SIZE):
+                offset = 0
+                while offset < len(data):
+                    _, mask, _, length = EVENT.unpack_from(data, offset)
+                    name = data[offset + EVENT.size : offset + EVENT.size + length].rstrip(b"\0")
+                    offset += EVENT.size + length
+                    if mask & IN_Q_OVERFLOW:
+                        logging.warning("inotify queue overflow, rescanning")
+                        changed.update(file_names(self.directory))
+                    elif name:
+                        changed.add(os.fsdecode(name))
+        except BlockingIOError:
+            pass
+        return {name for name in changed if name not in IGNORED_NAMES}
+
+    def close(self):
+        os.close(self._fd)
+
+
+def open_watcher(directory: Path, poll_interval: float = 1.0) -> Watcher:
+    """inotify watcher, or a polling watcher if inotify is not available (not Linux, no watches left)"""
+    try:
+        return InotifyWatcher(directory)
+    except (OSError, AttributeError) as ex:
+        logging.warning(f"inotify not available ({ex}), polling {directory} every {poll_interval}s")
+        return Watcher(directory, poll_interval)
+
+
+def settled_files(watcher: Watcher, settle: float, timeout: Optional[float] = None) -> Iterator[List[Path]]:
+    """
+    Yield batches of files that did not change for settle seconds, existing files included (unchanged since their
+    modification time). Stops after timeout seconds (None: never), files are yielded again only if they change.
+    """
+    now = time.monotonic()
+    deadline = now + timeout if timeout is not None else None
+    pending = {}
+    for name in file_names(watcher.directory):
+        if (current := signature(watcher.directory / name)) is not None:
+            pending[name] = (current, now - max(0.0, time.time() - current[1] / 1e9))
+    while True:
+        now = time.monotonic()
+        ready = []
+        for name, (last, since) in list(pending.items()):
+            current = signature(watcher.directory / name)
+            if current is None:
+                del pending[name]  # removed or moved away (ingested)
+            elif current != last:
+                pending[name] = (current, now)
+            elif now - since >= settle:
+                ready.append(watcher.directory / name)
+                del pending[name]
+        if ready:
+            yield sorted(ready)
+        wait = min((since + settle - now for _, since in pending.values()), default=None)
+        if deadline is not None:
+            if now >= deadline:
+                return
+            wait = min(wait, deadline - now) if wait is not None else deadline - now
+        for name in watcher.changes(max(wait, 0.05) if wait is not None else 3600):
+            pending[name] = (signature(watcher.directory / name), time.monotonic())
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Print new files of a directory as soon as they are completely written")
+    parser.add_argument("directory", type=Path, help="Directory to watch (not recursive), e.g., infolder")
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds a file must not change to be complete (default: 2)")
+    parser.add_argument("--timeout", type=float, help="Without --stream: exit without output after X seconds (default: wait forever)")
+    parser.add_argument("--stream", action="store_true", help="Keep printing settled files instead of exiting after the first batch")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="Scan interval without inotify (default: 1)")
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace) -> int:
+    args.directory.mkdir(parents=True, exist_ok=True)
+    watcher = open_watcher(args.directory, args.poll_interval)
+    try:
+        for batch in settled_files(watcher, args.settle, None if args.stream else args.timeout):
+            for path in batch:
+                print(path, flush=True)
+            if not args.stream:
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parse_arguments()
+    sys.exit(main(args))
@@ -90,6 +90,18 @@ DATABASES = {
     }
 }
 
+# Cache of filtered.sqlite3 queries and page fragments (samples/cache.py). A file based cache is shared by the
+# gunicorn workers, entries are keyed by the data version of filtered.sqlite3, so old entries are just not read again.
+SAMPLES_CACHE_TIMEOUT = 24 * 60 * 60  # seconds, bounds the lifetime of entries of old data versions
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "data/cache",
+        "TIMEOUT": SAMPLES_CACHE_TIMEOUT,
+        "OPTIONS": {"MAX_ENTRIES": 2000},
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -134,6 +146,7 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN', "none")
 GITHUB_REPO_OWNER = os.environ['GITHUB_REPO_OWNER']
 GITHUB_REPO_NAME = os.environ['GITHUB_REPO_NAME']
+GITHUB_API_URL = os.environ.get('GITHUB_API_URL', "https://api.github.com")  # e.g., GitHub Enterprise or a test server
 
 # email
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
@@ -150,8 +163,11 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = "/accounts/login"
 
 # app settings
-SAMPLE_DIR = BASE_DIR / "data/samples"
-SAMPLE_COLD_STORAGE = BASE_DIR / "data/cold_storage"
+SAMPLE_STORE = BASE_DIR / "data"  # samples/ and cold_storage/ tiers, see samples/store.py
+UPLOAD_SPOOL = BASE_DIR / "data/uploads"  # uploads waiting for their background job, on the file system of the store
+JOB_WORKERS = 2  # background job threads per gunicorn worker, see samples/jobs.py
+# stream uploads to UPLOAD_SPOOL and hash them on the way, instead of keeping small uploads in memory
+FILE_UPLOAD_HANDLERS = ["samples.uploads.HashingFileUploadHandler"]
 ZIP_COMPRESSION_LEVEL = 9
 ZIP_PASSWORD = "infected"
 
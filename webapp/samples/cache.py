@@ -0,0 +1,62 @@
+"""
+Cache of filtered.sqlite3 queries and rendered page fragments.
+
+filtered.sqlite3 only changes when the worker runs filter.py (or an issue is updated), so cached values are keyed by
+a data version derived from the size and modification time of the database and its WAL file. Any write changes the
+version, entries of older versions are never read again and expire. Computing the version needs no SQL, so a page
+whose data and fragments are cached does not query filtered.sqlite3 at all.
+"""
+import hashlib
+import os
+import time
+from typing import Callable, Iterable, TypeVar
+
+from django.conf import settings
+from django.core.cache import cache
+
+T = TypeVar("T")
+ISSUES_VERSION_KEY = "samples:issues_version"
+
+
+def data_version() -> str:
+    """Version of filtered.sqlite3, changes with every write"""
+    database = str(settings.DATABASES["samples"]["NAME"])
+    parts = []
+    for path in (database, f"{database}-wal"):
+        try:
+            stat = os.stat(path)
+            parts.append(f"{stat.st_mtime_ns:x}.{stat.st_size:x}")
+        except FileNotFoundError:
+            parts.append("-")
+    return "_".join(parts)
+
+
+def issues_version() -> str:
+    """Version of the GitHubIssue table, changes when bump_issues_version() is called"""
+    # a timestamp instead of a counter, a version lost to culling is replaced by a new one instead of an old one
+    return cache.get_or_set(ISSUES_VERSION_KEY, lambda: f"{time.time_ns():x}", None)
+
+
+def bump_issues_version():
+    """Invalidate cached issues, call after writing GitHubIssue rows"""
+    cache.set(ISSUES_VERSION_KEY, f"{time.time_ns():x}", None)
+
+
+def digest(values: Iterable[str]) -> str:
+    """Short cache key of a set of values, e.g., the case groups of a page"""
+    return hashlib.sha256("\0".join(sorted(set(values))).encode()).hexdigest()[:32]
+
+
+class _CachedNone:
+    """Stored in place of a computed None, which some cache backends cannot tell from a miss (it would be recomputed)"""
+
+
+def cached(key: str, compute: Callable[[], T], version: str) -> T:
+    """Value of key for the data version, compute it on a miss (evaluate querysets in compute, e.g., with list())"""
+
+    def _compute():
+        value = compute()
+        return _CachedNone() if value is None else value
+
+    value = cache.get_or_set(f"samples:{version}:{key}", _compute, settings.SAMPLES_CACHE_TIMEOUT)
+    return None if isinstance(value, _CachedNone) else value
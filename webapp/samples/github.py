@@ -1,43 +1,128 @@
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs, urlencode, urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
+
+API_URL = "https://api.github.com"
+PER_PAGE = 100  # maximum of the GitHub API
+MAX_FETCH_ATTEMPTS = 3  # fetches of all pages while issues change during paging
 
 
 class Github:
     QUERY_LABELS = "bugfinder"  # comma separated string, e.g., bug,ui,@high
     CREATION_LABELS = ["bug", "bugfinder"]
 
-    def __init__(self, token: str, repo_owner: str, repo_name: str):
+    def __init__(self, token: str, repo_owner: str, repo_name: str, api_url: str = API_URL, workers: int = 4):
         self._token = token
         self._repo_owner = repo_owner
         self._repo_name = repo_name
         self._headers = {"Authorization": f"Bearer {token}", "Accept": "application/vnd.github.v3+json"}
-        self._issues_url = f"https://api.github.com/repos/{self._repo_owner}/{self._repo_name}/issues"
+        self._issues_url = f"{api_url.rstrip('/')}/repos/{self._repo_owner}/{self._repo_name}/issues"
+        self._workers = workers
+        # one session, connections are reused across requests and by the threads fetching pages
+        self._session = requests.Session()
+        self._session.headers.update(self._headers)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self.api_calls = 0  # requests sent, including conditional requests answered with 304 Not Modified
 
-    def iter_existing_issues(self):
-        """iterate through existing issues"""
-        response = requests.get(self._issues_url, headers=self._headers, params={"state": "all", "labels": self.QUERY_LABELS})
-        if response.status_code == 200:
-            for issue in response.json():
-                yield issue
-        else:
+    def _get(self, url: str, params: Optional[dict] = None, headers: Optional[dict] = None) -> requests.Response:
+        response = self._session.get(url, params=params, headers=headers)
+        if response.status_code not in (200, 304):
             logging.error(f"Failed to retrieve issues. Response: {response.text}")
             raise RuntimeError(f"GitHub Issues: {response.text}")
+        return response
+
+    @staticmethod
+    def _page_urls(response: requests.Response) -> Optional[List[str]]:
+        """URLs of pages 2 to last of a paginated response, None if the last page is not known"""
+        last = response.links.get("last", {}).get("url")
+        if last is None:
+            return None
+        url = urlparse(last)
+        query = parse_qs(url.query)
+        if "page" not in query:
+            return None
+        pages = []
+        for page in range(2, int(query["page"][0]) + 1):
+            query["page"] = [str(page)]
+            pages.append(url._replace(query=urlencode(query, doseq=True)).geturl())
+        return pages
+
+    def _remaining_pages(self, response: requests.Response) -> List[dict]:
+        """Issues of the pages after the first page response, fetched concurrently if the last page is known"""
+        issues = []
+        if (pages := self._page_urls(response)) is not None:
+            with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                for page in executor.map(self._get, pages):
+                    self.api_calls += 1
+                    issues.extend(page.json())
+        else:
+            while "next" in response.links:
+                response = self._get(response.links["next"]["url"])
+                self.api_calls += 1
+                issues.extend(response.json())
+        return issues
+
+    def fetch_issues(self, since: Optional[str] = None, etag: Optional[str] = None) -> Tuple[Optional[List[dict]], Optional[str]]:
+        """
+        Issues (label QUERY_LABELS) updated at or after since (ISO 8601, None: all issues), and the ETag of the response.
+        With the ETag of a previous fetch of the same since, returns None if nothing changed (304, no rate limit cost).
+        Pages 2 to last are fetched concurrently. An issue updated while paging moves to the first page, which was
+        already fetched, and the issues after it shift by one, so one of them could be missed: the first page is
+        requested again (free if not modified), and all pages are fetched again if it changed. Raises RuntimeError if
+        issues still change after MAX_FETCH_ATTEMPTS, so a sync does not advance since past missed issues.
+        """
+        # most recently updated first: any change moves the issue to the first page, so its ETag covers all pages
+        params = {"state": "all", "labels": self.QUERY_LABELS, "per_page": PER_PAGE, "sort": "updated", "direction": "desc"}
+        if since is not None:
+            params["since"] = since
+        response = self._get(self._issues_url, params=params, headers={"If-None-Match": etag} if etag else None)
+        self.api_calls += 1
+        if response.status_code == 304:
+            return None, etag
+        for _ in range(MAX_FETCH_ATTEMPTS):
+            etag, first_page = response.headers.get("ETag"), response.json()
+            if "next" not in response.links:
+                issues = first_page
+                break
+            issues = first_page + self._remaining_pages(response)
+            response = self._get(self._issues_url, params=params, headers={"If-None-Match": etag} if etag else None)
+            self.api_calls += 1
+            if response.status_code == 304 or response.json() == first_page:
+                break
+            logging.info("GitHub issues changed while paging, fetching all pages again")
+        else:
+            raise RuntimeError(f"GitHub Issues: issues changed while paging in {MAX_FETCH_ATTEMPTS} attempts")
+        # pull requests are issues too, an issue updated while paging can also be on two pages
+        unique = {issue["number"]: issue for issue in issues if "pull_request" not in issue}
+        return list(unique.values()), etag
+
+    def iter_existing_issues(self):
+        """iterate through existing issues"""
+        issues, _ = self.fetch_issues()
+        yield from issues
 
     @property
     def existing_issue_titles_to_issue_map(self) -> dict:
         """Iterate existing issues and return set of titles (str)"""
         return {issue["title"]: issue for issue in self.iter_existing_issues()}
 
-    def create_issue(self, title: str, body: str):
-        """create issue if title not already exists in issues"""
-        existing_issues = self.existing_issue_titles_to_issue_map
-        if title in existing_issues:
-            logging.warning(f"issue already exists: {title}")
-            return existing_issues[title]
+    def create_issue(self, title: str, body: str, check_existing: bool = True):
+        """create issue if title not already exists in issues (check_existing=False: the caller checked, e.g., after a sync)"""
+        if check_existing:
+            existing_issues = self.existing_issue_titles_to_issue_map
+            if title in existing_issues:
+                logging.warning(f"issue already exists: {title}")
+                return existing_issues[title]
         payload = {"title": title, "body": body, "labels": self.CREATION_LABELS}
-        response = requests.post(self._issues_url, headers=self._headers, data=json.dumps(payload))
+        response = self._session.post(self._issues_url, data=json.dumps(payload))
+        self.api_calls += 1
         if response.status_code == 201:
             logging.info("Issue created successfully!")
             return response.json()
@@ -0,0 +1,97 @@
+"""
+Background jobs for slow web actions (GitHub issue sync and creation, upload processing).
+
+A job runs in a thread pool of the gunicorn worker that received the request, so the request returns at once with the
+job id instead of blocking one of the few workers. Jobs are stored in the Job table of the default database, so their
+status (/jobs/<id>/) can be polled through any worker. Job threads run with a lower CPU priority (Linux), so pages are
+served first while, e.g., a large archive is hashed. Jobs of a worker that exited (restart, timeout) are reported as
+failed.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+from .models import Job
+
+JOB_NICENESS = 10
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _lower_priority():
+    """Lower the CPU priority of the current thread (Linux: nice value per thread)"""
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), JOB_NICENESS)
+    except (AttributeError, OSError) as ex:
+        logging.debug(f"job thread priority not lowered: {ex}")
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    # created on first use, i.e., in the gunicorn worker and not in the master before the fork
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.JOB_WORKERS, thread_name_prefix="job", initializer=_lower_priority)
+        return _executor
+
+
+def _run(job_id: int, func: Callable[..., dict], args: tuple, kwargs: dict):
+    try:
+        Job.objects.filter(id=job_id).update(status=Job.RUNNING, started_at=timezone.now())
+        try:
+            result = func(*args, **kwargs)
+            status, message = Job.DONE, result.get("message", "")
+        except Exception as ex:
+            logging.exception(f"job {job_id} failed")
+            result, status, message = None, Job.FAILED, str(ex)
+        Job.objects.filter(id=job_id).update(status=status, message=message, result=result, finished_at=timezone.now())
+    finally:
+        connections.close_all()
+
+
+def enqueue(kind: str, func: Callable[..., dict], *args, **kwargs) -> Job:
+    """Run func(*args, **kwargs) in the background, its result (a JSON serializable dict with a message) is stored in the job"""
+    job = Job.objects.create(kind=kind, pid=os.getpid())
+    _get_executor().submit(_run, job.id, func, args, kwargs)
+    return job
+
+
+def _is_alive(pid: Optional[int]) -> bool:
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def get_job(job_id: int) -> Job:
+    """Job by id, a job that is not finished and whose worker exited is marked as failed"""
+    job = Job.objects.get(id=job_id)
+    if job.status in (Job.QUEUED, Job.RUNNING) and not _is_alive(job.pid):
+        job.status, job.message, job.finished_at = Job.FAILED, "interrupted, the web worker exited", timezone.now()
+        job.save(update_fields=["status", "message", "finished_at"])
+    return job
+
+
+def job_as_dict(job: Job) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "message": job.message,
+        "result": job.result,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
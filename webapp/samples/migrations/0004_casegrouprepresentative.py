@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-18 17:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('samples', '0003_dewolferror_githubissue_alter_sample_table'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CaseGroupRepresentative',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dewolf_current_commit', models.TextField(blank=True, null=True)),
+                ('tag', models.TextField(blank=True, null=True)),
+                ('case_group', models.TextField(blank=True, null=True)),
+                ('dewolf_error_id', models.IntegerField(blank=True, null=True)),
+                ('function_basic_block_count', models.IntegerField(blank=True, null=True)),
+                ('errors_per_group_count_pre_filter', models.IntegerField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'case_group_representatives',
+                'managed': False,
+            },
+        ),
+    ]
@@ -52,6 +52,19 @@ class DewolfError(models.Model):
         managed = False
         db_table = 'dewolf_errors'
 
+class CaseGroupRepresentative(models.Model):
+    """Smallest DewolfError of each case group per commit and tag, maintained by filter.py"""
+    dewolf_current_commit = models.TextField(blank=True, null=True)
+    tag = models.TextField(blank=True, null=True)
+    case_group = models.TextField(blank=True, null=True)
+    dewolf_error_id = models.IntegerField(blank=True, null=True)
+    function_basic_block_count = models.IntegerField(blank=True, null=True)
+    errors_per_group_count_pre_filter = models.IntegerField(blank=True, null=True)
+
+    class Meta:
+        managed = False
+        db_table = 'case_group_representatives'
+
 class GitHubIssue(models.Model):
     case_group = models.TextField()
     title = models.TextField()
@@ -61,3 +74,21 @@ class GitHubIssue(models.Model):
     html_url = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+
+
+class Job(models.Model):
+    """Background job of the web app (samples/jobs.py), stored in the default database"""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+    kind = models.CharField(max_length=100)
+    status = models.CharField(max_length=20, default=QUEUED)
+    message = models.TextField(blank=True, default="")
+    result = models.JSONField(blank=True, null=True)
+    pid = models.IntegerField(blank=True, null=True)  # gunicorn worker running the job
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
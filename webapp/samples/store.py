@@ -0,0 +1,377 @@
+"""
+Content-addressed sample store.
+
+Samples are stored by sha256 in fan-out directories of a tier, e.g., data/samples/ab/cd/abcd...
+The hot tier (samples) holds the samples processed by the worker, the cold tier (cold_storage) samples that stay
+downloadable but are not processed. A sample in both tiers is hardlinked. The index (data/sample_store.sqlite3)
+maps hashes to size, file type, tiers, and whether the sample is queued for the next run. Queued samples are taken
+by priority (prioritize.py), samples that hit the time limit in their last run come last.
+
+Samples of the old flat layout (data/samples/<sha256>) are still found, `migrate` moves them into the shards.
+Only depends on the standard library, so the worker scripts can use it without Django:
+
+python -m webapp.samples.store --root data count --queued
+"""
+import argparse
+import errno
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from .utils import sha256sum
+
+HOT = "samples"
+COLD = "cold_storage"
+TIERS = (HOT, COLD)
+INDEX_FILE = "sample_store.sqlite3"
+SHA256 = re.compile(r"[0-9a-f]{64}")
+
+INDEX_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS samples (
+        sha256 TEXT PRIMARY KEY,
+        size INTEGER,
+        file_type TEXT,
+        added_at TEXT,
+        queued INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS locations (
+        sha256 TEXT NOT NULL,
+        tier TEXT NOT NULL,
+        PRIMARY KEY (sha256, tier)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_locations_tier ON locations (tier)",
+    "CREATE INDEX IF NOT EXISTS idx_samples_queued ON samples (sha256) WHERE queued = 1",
+    # last run of a sample (recorded by scheduler.py), its priority (higher first) and number of functions from the
+    # history (set by prioritize.py)
+    """CREATE TABLE IF NOT EXISTS priorities (
+        sha256 TEXT PRIMARY KEY,
+        priority REAL,
+        functions INTEGER,
+        seconds REAL,
+        timed_out INTEGER NOT NULL DEFAULT 0
+    ) WITHOUT ROWID""",
+]
+# columns added to existing indexes: table -> [(column, definition)]
+INDEX_COLUMNS = {"priorities": [("functions", "INTEGER")]}
+TAKE_QUERY = """SELECT s.sha256 FROM samples s LEFT JOIN priorities p ON p.sha256 = s.sha256
+    WHERE s.queued = 1 {condition}
+    ORDER BY coalesce(p.timed_out, 0), p.priority IS NULL, p.priority DESC
+    LIMIT ?
+"""
+
+
+def _move_file(source: Union[str, Path], destination: Path):
+    try:
+        os.replace(source, destination)
+    except OSError as ex:
+        if ex.errno != errno.EXDEV:
+            raise
+        shutil.move(source, destination)
+
+
+class SampleStore:
+    """Samples by sha256 in sharded tier directories below root, with a SQLite index"""
+
+    def __init__(self, root: Union[str, Path]):
+        self.root = Path(root)
+        self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+    @property
+    def index(self) -> sqlite3.Connection:
+        """
+        Index connection, shared by worker scripts and web app (WAL, waits for locks).
+        May be used from several threads, but only one at a time (callers hold a lock).
+        """
+        if self._index is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._index = sqlite3.connect(self.root / INDEX_FILE, timeout=60, check_same_thread=False)
+            self._index.execute("PRAGMA journal_mode = WAL")
+            self._index.execute("PRAGMA synchronous = NORMAL")
+            with self._index:
+                for statement in INDEX_SCHEMA:
+                    self._index.execute(statement)
+                for table, columns in INDEX_COLUMNS.items():
+                    existing = {row[1] for row in self._index.execute(f"PRAGMA table_info({table})")}
+                    for column, definition in columns:
+                        if column not in existing:
+                            self._index.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        return self._index
+
+    @property
+    def has_index(self) -> bool:
+        return (self.root / INDEX_FILE).is_file()
+
+    @staticmethod
+    def relative_path(sha256: str, tier: str = HOT) -> str:
+        """Sharded path relative to root, e.g., samples/ab/cd/abcd..."""
+        return f"{tier}/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+    def path(self, sha256: str, tier: str = HOT) -> Path:
+        return self.root / self.relative_path(sha256, tier)
+
+    def locate(self, sha256: str, tiers: Iterable[str] = TIERS) -> Optional[Path]:
+        """Path of a stored sample (sharded or old flat layout), None if it is not in the given tiers"""
+        sha256 = sha256.lower()
+        if not SHA256.fullmatch(sha256):
+            return None
+        for tier in tiers:
+            for path in (self.path(sha256, tier), self.root / tier / sha256):
+                if path.is_file():
+                    return path
+        return None
+
+    def add(self, source: Union[str, Path], sha256: Optional[str] = None, file_type: Optional[str] = None, tier: str = HOT) -> bool:
+        """
+        Move file into tier, return False if the tier already has the sample (the file is removed).
+        A sample of another tier is hardlinked instead of stored twice.
+        """
+        with self.index as con:
+            return self._add(con, source, sha256, file_type, tier)
+
+    def add_many(self, samples: Iterable[Tuple[Union[str, Path], Optional[str], Optional[str]]], tier: str = HOT) -> List[bool]:
+        """add() of (source, sha256, file type) per file in one index transaction, return whether each file was added"""
+        with self.index as con:
+            return [self._add(con, source, sha256, file_type, tier) for source, sha256, file_type in samples]
+
+    def _add(self, con: sqlite3.Connection, source: Union[str, Path], sha256: Optional[str], file_type: Optional[str], tier: str) -> bool:
+        sha256 = sha256 or sha256sum(source)
+        if self.locate(sha256, [tier]) is not None:
+            os.unlink(source)
+            added = False
+        elif self.locate(sha256) is not None:
+            self._link(con, sha256, tier)
+            os.unlink(source)
+            added = True
+        else:
+            destination = self.path(sha256, tier)
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            _move_file(source, destination)
+            added = True
+        self._record(con, sha256, tier, size=self.locate(sha256, [tier]).stat().st_size, file_type=file_type)
+        return added
+
+    def link(self, sha256: str, tier: str) -> bool:
+        """Hardlink a stored sample into tier (copy across file systems), False if it is not stored"""
+        with self.index as con:
+            return self._link(con, sha256, tier)
+
+    def _link(self, con: sqlite3.Connection, sha256: str, tier: str) -> bool:
+        if self.locate(sha256, [tier]) is not None:
+            return True
+        if (source := self.locate(sha256)) is None:
+            return False
+        destination = self.path(sha256, tier)
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.link(source, destination)
+        except OSError as ex:
+            if ex.errno != errno.EXDEV:
+                raise
+            shutil.copy2(source, destination)
+        self._record(con, sha256, tier, size=destination.stat().st_size)
+        return True
+
+    def remove(self, sha256: str, tier: str):
+        """Remove sample from tier, and from the index if no tier has it anymore"""
+        for path in (self.path(sha256, tier), self.root / tier / sha256):
+            path.unlink(missing_ok=True)
+        with self.index as con:
+            con.execute("DELETE FROM locations WHERE sha256 = ? AND tier = ?", (sha256, tier))
+            con.execute("DELETE FROM samples WHERE sha256 = ? AND NOT EXISTS (SELECT 1 FROM locations WHERE sha256 = ?)", (sha256, sha256))
+
+    def move(self, sha256: str, tier: str) -> bool:
+        """Keep sample only in tier (e.g., slow samples to cold storage) and unqueue it, False if it is not stored"""
+        if not self.link(sha256, tier):
+            return False
+        for other in TIERS:
+            if other != tier:
+                self.remove(sha256, other)
+        with self.index as con:
+            con.execute("UPDATE samples SET queued = 0 WHERE sha256 = ?", (sha256,))
+        return True
+
+    @staticmethod
+    def _record(con: sqlite3.Connection, sha256: str, tier: str, size: Optional[int] = None, file_type: Optional[str] = None):
+        """Add sample and its tier to the index (in the caller's transaction)"""
+        con.execute(
+            """INSERT INTO samples (sha256, size, file_type, added_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (sha256) DO UPDATE SET size = coalesce(excluded.size, size), file_type = coalesce(excluded.file_type, file_type)""",
+            (sha256, size, file_type, datetime.now().isoformat(" ", "seconds")),
+        )
+        con.execute("INSERT OR IGNORE INTO locations (sha256, tier) VALUES (?, ?)", (sha256, tier))
+
+    def hashes(self, tier: str = HOT) -> Iterator[str]:
+        for (sha256,) in self.index.execute("SELECT sha256 FROM locations WHERE tier = ?", (tier,)):
+            yield sha256
+
+    def count(self, tier: Optional[str] = None, queued: bool = False) -> int:
+        query = "SELECT count(*) FROM samples WHERE (? IS NULL OR EXISTS (SELECT 1 FROM locations l WHERE l.sha256 = samples.sha256 AND tier = ?))"
+        if queued:
+            query += " AND queued = 1"
+        return self.index.execute(query, (tier, tier)).fetchone()[0]
+
+    def queue(self) -> int:
+        """Queue all samples of the hot tier for the next run, return the number of queued samples"""
+        with self.index as con:
+            con.execute(f"UPDATE samples SET queued = 1 WHERE sha256 IN (SELECT sha256 FROM locations WHERE tier = '{HOT}')")
+        return self.count(queued=True)
+
+    def take(self, limit: Optional[int] = None, only: Optional[Iterable[str]] = None, unqueue: bool = True) -> List[str]:
+        """
+        Unqueue and return queued samples by priority, restricted to `only` if given.
+        Without unqueue, the samples stay queued until their run is recorded (record_run), so an interrupted run keeps them.
+        """
+        limit = -1 if limit is None else limit
+        with self.index as con:
+            condition = ""
+            if only is not None:
+                con.execute("CREATE TEMP TABLE IF NOT EXISTS take_only (sha256 TEXT PRIMARY KEY)")
+                con.execute("DELETE FROM take_only")
+                con.executemany("INSERT OR IGNORE INTO take_only (sha256) VALUES (?)", ((sha256,) for sha256 in only))
+                condition = "AND s.sha256 IN (SELECT sha256 FROM take_only)"
+            taken = [sha256 for (sha256,) in con.execute(TAKE_QUERY.format(condition=condition), (limit,))]
+            if unqueue:
+                con.executemany("UPDATE samples SET queued = 0 WHERE sha256 = ?", ((sha256,) for sha256 in taken))
+        return taken
+
+    def record_run(self, sha256: str, seconds: float, timed_out: bool):
+        """Record duration of the last run of a sample, timed out samples are taken last, unqueue the processed sample"""
+        with self.index as con:
+            con.execute("UPDATE samples SET queued = 0 WHERE sha256 = ? AND queued = 1", (sha256,))
+            con.execute(
+                """INSERT INTO priorities (sha256, seconds, timed_out) VALUES (?, ?, ?)
+                ON CONFLICT (sha256) DO UPDATE SET seconds = excluded.seconds, timed_out = excluded.timed_out""",
+                (sha256, seconds, int(timed_out)),
+            )
+
+    def recorded_runs(self) -> Dict[str, Tuple[Optional[float], bool]]:
+        """Duration and timeout of the last recorded run per sample"""
+        rows = self.index.execute("SELECT sha256, seconds, timed_out FROM priorities WHERE seconds IS NOT NULL")
+        return {sha256: (seconds, bool(timed_out)) for sha256, seconds, timed_out in rows}
+
+    def set_priorities(self, priorities: Dict[str, float], function_counts: Dict[str, int]):
+        """Set priorities and known function counts (samples without count keep theirs)"""
+        with self.index as con:
+            con.executemany(
+                """INSERT INTO priorities (sha256, priority, functions) VALUES (?, ?, ?)
+                ON CONFLICT (sha256) DO UPDATE SET priority = excluded.priority, functions = coalesce(excluded.functions, functions)""",
+                ((sha256, priority, function_counts.get(sha256)) for sha256, priority in priorities.items()),
+            )
+
+    def size_and_functions(self, sha256: str) -> Tuple[Optional[int], Optional[int]]:
+        """File size and number of functions (from the history) of a sample, None if unknown"""
+        query = "SELECT s.size, p.functions FROM samples s LEFT JOIN priorities p ON p.sha256 = s.sha256 WHERE s.sha256 = ?"
+        return self.index.execute(query, (sha256,)).fetchone() or (None, None)
+
+    def migrate(self) -> int:
+        """Move samples of the old flat layout into the shards and index them, return the number of moved samples"""
+        moved = 0
+        for tier in TIERS:
+            if not (self.root / tier).is_dir():
+                continue
+            with os.scandir(self.root / tier) as entries:
+                flat = [entry.name for entry in entries if entry.is_file(follow_symlinks=False) and SHA256.fullmatch(entry.name)]
+            with self.index as con:
+                for sha256 in flat:
+                    destination = self.path(sha256, tier)
+                    destination.parent.mkdir(parents=True, exist_ok=True)
+                    os.replace(self.root / tier / sha256, destination)
+                    self._record(con, sha256, tier, size=destination.stat().st_size)
+                    moved += 1
+            if flat:
+                logging.info(f"migrated {len(flat)} samples of {tier} into the sharded layout")
+        return moved
+
+    def reindex(self) -> int:
+        """Add samples of the shards that are missing in the index (e.g., after copying a store), return their number"""
+        added = 0
+        for tier in TIERS:
+            indexed = set(self.hashes(tier))
+            with self.index as con:
+                for path in (self.root / tier).glob("[0-9a-f][0-9a-f]/[0-9a-f][0-9a-f]/*"):
+                    if path.name not in indexed and SHA256.fullmatch(path.name):
+                        self._record(con, path.name, tier, size=path.stat().st_size)
+                        added += 1
+        return added
+
+
+def _read_hashes(file) -> List[str]:
+    return [line.strip().lower() for line in file if line.strip()]
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Content-addressed sample store")
+    parser.add_argument("--root", type=Path, default=Path("data"), help="Store directory (default: data)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate", help="Move samples of the flat layout into the shards")
+    commands.add_parser("reindex", help="Index sharded samples missing in the index")
+    commands.add_parser("queue", help="Queue all samples of the hot tier for the next run")
+    take = commands.add_parser("take", help="Print and unqueue queued samples")
+    take.add_argument("--limit", type=int, help="Take at most X samples")
+    take.add_argument("--only", type=argparse.FileType("r"), help="Only take samples of this hash list")
+    take.add_argument("--keep", action="store_true", help="Keep the samples queued until scheduler.py records their run")
+    for name, help_text in (("link", "Hardlink samples (hashes from stdin) into tier"), ("move", "Move samples (hashes from stdin) to tier")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("tier", choices=TIERS)
+    path = commands.add_parser("path", help="Print paths of stored samples")
+    path.add_argument("sha256", nargs="+")
+    count = commands.add_parser("count", help="Print number of stored samples")
+    count.add_argument("--tier", choices=TIERS)
+    count.add_argument("--queued", action="store_true", help="Only count queued samples")
+    listing = commands.add_parser("list", help="Print hashes of a tier")
+    listing.add_argument("--tier", choices=TIERS, default=HOT)
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace) -> int:
+    with SampleStore(args.root) as store:
+        if args.command == "migrate":
+            logging.info(f"migrated {store.migrate()} samples")
+        elif args.command == "reindex":
+            logging.info(f"indexed {store.reindex()} samples")
+        elif args.command == "queue":
+            logging.info(f"queued {store.queue()} samples")
+        elif args.command == "take":
+            only = _read_hashes(args.only) if args.only is not None else None
+            for sha256 in store.take(args.limit, only, unqueue=not args.keep):
+                print(sha256, flush=True)
+        elif args.command in ("link", "move"):
+            action = store.link if args.command == "link" else store.move
+            hashes = _read_hashes(sys.stdin)
+            missing = [sha256 for sha256 in hashes if not action(sha256, args.tier)]
+            logging.info(f"{args.command}: {len(hashes) - len(missing)} samples to {args.tier}, {len(missing)} not stored")
+        elif args.command == "path":
+            for sha256 in args.sha256:
+                if (sample_path := store.locate(sha256)) is None:
+                    logging.error(f"{sha256} is not stored")
+                    return 1
+                print(sample_path)
+        elif args.command == "count":
+            print(store.count(args.tier, args.queued))
+        elif args.command == "list":
+            for sha256 in store.hashes(args.tier):
+                print(sha256)
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parse_arguments()
+    sys.exit(main(args))
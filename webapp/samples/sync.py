@@ -0,0 +1,111 @@
+"""
+Sync of the GitHub issues (label bugfinder) into the GitHubIssue table of filtered.sqlite3.
+
+A sync only asks for issues updated since the newest update of the previous sync, with the ETag of the previous
+response: if no issue changed, GitHub answers 304 Not Modified, which does not count against the rate limit. Changed
+issues are written with one bulk_update and one bulk_create. The sync state is kept in the cache (samples/cache.py);
+without it, or if the table lost rows since (e.g., a new filtered.sqlite3), all issues are fetched again.
+"""
+import logging
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .cache import bump_issues_version
+from .github import Github
+from .models import GitHubIssue
+
+SYNC_STATE_KEY = "samples:issue_sync"
+NUMBERS_PER_QUERY = 500  # issue numbers per IN (...), old SQLite versions allow 999 variables
+
+
+@dataclass
+class SyncResult:
+    """Metrics of one sync"""
+
+    api_calls: int = 0
+    seconds: float = 0.0
+    not_modified: bool = False
+    created: int = 0
+    updated: int = 0
+    issues: List[str] = field(default_factory=list)  # '#<number>: <status>' of the fetched issues
+
+    def __str__(self):
+        changes = "not modified" if self.not_modified else f"{len(self.issues)} issues fetched ({self.created} new, {self.updated} updated)"
+        return f"{self.api_calls} API calls in {self.seconds:.2f}s, {changes}"
+
+
+def get_issue_status(issue) -> str:
+    status = issue["state"]
+    if status == "open" and issue["assignee"] is not None:
+        return "in progress"
+    return status
+
+
+def case_group_from_title(title: str) -> str:
+    return title[1 : title.find("]")]
+
+
+def _sync_state(full: bool) -> Optional[dict]:
+    """since, etag, and table size of the last sync, None for a full sync"""
+    state = cache.get(SYNC_STATE_KEY)
+    if full or state is None or GitHubIssue.objects.using("samples").count() < state["count"]:
+        return None
+    return state
+
+
+def _upsert(issues: List[dict], result: SyncResult):
+    existing: Dict[int, List[GitHubIssue]] = defaultdict(list)
+    numbers = [issue["number"] for issue in issues]
+    for i in range(0, len(numbers), NUMBERS_PER_QUERY):
+        for db_issue in GitHubIssue.objects.using("samples").filter(number__in=numbers[i : i + NUMBERS_PER_QUERY]):
+            existing[db_issue.number].append(db_issue)
+    to_update, to_create = [], []
+    for issue in issues:
+        status = get_issue_status(issue)
+        result.issues.append(f"#{issue['number']}: {status}")
+        for db_issue in existing.get(issue["number"], []):
+            if db_issue.status != status:
+                # bulk_update does not set auto_now fields
+                db_issue.status, db_issue.updated_at = status, timezone.now()
+                to_update.append(db_issue)
+        if issue["number"] not in existing:
+            to_create.append(
+                GitHubIssue(
+                    case_group=case_group_from_title(issue["title"]),
+                    title=issue["title"],
+                    description="",
+                    status=status,
+                    number=issue["number"],
+                    html_url=issue["html_url"],
+                )
+            )
+    GitHubIssue.objects.using("samples").bulk_update(to_update, ["status", "updated_at"])
+    GitHubIssue.objects.using("samples").bulk_create(to_create)
+    result.updated, result.created = len(to_update), len(to_create)
+
+
+def sync_issues(repo: Github, full: bool = False) -> SyncResult:
+    """Write new and changed issues of repo to the GitHubIssue table, full: fetch all issues"""
+    start, calls = time.perf_counter(), repo.api_calls
+    result = SyncResult()
+    state = _sync_state(full)
+    since = state["since"] if state is not None else None
+    issues, etag = repo.fetch_issues(since, state["etag"] if state is not None else None)
+    if issues is None:
+        result.not_modified = True
+    else:
+        _upsert(issues, result)
+        # ISO 8601 in UTC (Z), compares like the timestamps. The ETag belongs to the query of the old since.
+        next_since = max([issue["updated_at"] for issue in issues], default=since)
+        since, etag = next_since, etag if next_since == since else None
+        if result.created or result.updated:
+            bump_issues_version()
+    cache.set(SYNC_STATE_KEY, {"since": since, "etag": etag, "count": GitHubIssue.objects.using("samples").count()}, None)
+    result.api_calls, result.seconds = repo.api_calls - calls, time.perf_counter() - start
+    logging.info(f"GitHub issue sync: {result}")
+    return result
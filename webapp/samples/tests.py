@@ -1,3 +1,409 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connections
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .cache import bump_issues_version, cached, data_version
+from .github import PER_PAGE, Github
+from .models import CaseGroupRepresentative, DewolfError, GitHubIssue, Summary
+from .store import COLD, SampleStore
+from .sync import sync_issues
+from .views import _full_text_search
+
+
+class StubGithub(BaseHTTPRequestHandler):
+    """Issues endpoint of the GitHub REST API: pagination (Link), since, ETag/If-None-Match"""
+
+    issues = []  # set by the test
+    requests = []
+    updates = {}  # page -> issue that is updated when the page is requested (once)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        self.requests.append(query)
+        if (update := self.updates.pop(int(query.get("page", ["1"])[0]), None)) is not None:
+            self.issues[update["number"] - 1] = update
+        since = query.get("since", [""])[0]
+        issues = sorted((issue for issue in self.issues if issue["updated_at"] >= since), key=lambda issue: issue["updated_at"], reverse=True)
+        etag = f'"{hash(json.dumps(issues))}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        page, pages = int(query.get("page", ["1"])[0]), max(1, -(-len(issues) // PER_PAGE))
+        body = json.dumps(issues[(page - 1) * PER_PAGE : page * PER_PAGE]).encode()
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        if pages > 1:
+            link = lambda page, rel: f'<http://{self.headers["Host"]}{url.path}?{url.query.split("&page=")[0]}&page={page}>; rel="{rel}"'
+            self.send_header("Link", ", ".join([link(page + 1, "next")] * (page < pages) + [link(pages, "last")]))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def issue(number: int, state: str = "open", updated_at: str = None) -> dict:
+    return {
+        "number": number,
+        "title": f"[ValueError@cfg.py:{number}] ValueError",
+        "state": state,
+        "assignee": None,
+        "html_url": f"https://github.com/o/n/issues/{number}",
+        "updated_at": updated_at or f"2024-01-01T00:{number // 60:02}:{number % 60:02}Z",
+    }
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class GithubSyncTests(TestCase):
+    databases = {"default", "samples"}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubGithub)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.api_url = f"http://127.0.0.1:{cls.server.server_port}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        StubGithub.issues = [issue(number) for number in range(1, 251)]
+        StubGithub.requests = []
+        StubGithub.updates = {}
+        self.repo = Github("token", "o", "n", api_url=self.api_url)
+
+    def test_fetch_all_pages(self):
+        issues, etag = self.repo.fetch_issues()
+        self.assertEqual(sorted(issue["number"] for issue in issues), list(range(1, 251)))
+        # 3 pages and the first page again (not modified, nothing changed while paging)
+        self.assertEqual(self.repo.api_calls, 4)
+        self.assertIsNotNone(etag)
+
+    def test_issue_updated_while_paging(self):
+        # the issue moves from page 2 to the first page, which was already fetched
+        StubGithub.updates[2] = issue(100, "closed", "2024-02-01T00:00:00Z")
+        issues, _ = self.repo.fetch_issues()
+        self.assertEqual(sorted(issue["number"] for issue in issues), list(range(1, 251)))
+        self.assertEqual(next(issue for issue in issues if issue["number"] == 100)["state"], "closed")
+        # first page again (changed), pages 2 and 3 again, first page again (not modified)
+        self.assertEqual(self.repo.api_calls, 7)
+
+    def test_sync_is_conditional_and_incremental(self):
+        result = sync_issues(self.repo)
+        self.assertEqual((result.created, result.updated, result.api_calls), (250, 0, 4))
+        self.assertEqual(GitHubIssue.objects.using("samples").count(), 250)
+        # the next sync asks for issues since the last update, the one after that is not modified
+        sync_issues(self.repo)
+        result = sync_issues(self.repo)
+        self.assertTrue(result.not_modified)
+        self.assertEqual(result.api_calls, 1)
+        self.assertEqual(StubGithub.requests[-1]["since"], ["2024-01-01T00:04:10Z"])
+
+        StubGithub.issues[9] = issue(10, "closed", "2024-02-01T00:00:00Z")
+        StubGithub.issues.append(issue(251, updated_at="2024-02-01T00:00:00Z"))
+        result = sync_issues(self.repo)
+        self.assertEqual((result.created, result.updated, result.api_calls), (1, 1, 1))
+        self.assertEqual(GitHubIssue.objects.using("samples").get(number=10).status, "closed")
+        self.assertEqual(GitHubIssue.objects.using("samples").get(number=251).case_group, "ValueError@cfg.py:251")
+
+
+class UploadJobTests(TransactionTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.store = Path(self.directory.name)
+        self.client.force_login(get_user_model().objects.create_user("user"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def wait_for_job(self, status_url: str) -> dict:
+        for _ in range(100):
+            job = self.client.get(status_url).json()
+            if job["status"] not in ("queued", "running"):
+                return job
+            time.sleep(0.1)
+        self.fail(f"job did not finish: {job}")
+
+    def upload(self, name: str, content: bytes, content_type: str) -> dict:
+        with self.settings(SAMPLE_STORE=self.store, UPLOAD_SPOOL=self.store / "uploads"):
+            response = self.client.post(reverse("upload"), {"file": SimpleUploadedFile(name, content, content_type=content_type)})
+            self.assertEqual(response.status_code, 202)
+            job = self.wait_for_job(response.json()["status_url"])
+        self.assertEqual(job["status"], "done", job["message"])
+        self.assertEqual(list((self.store / "uploads").iterdir()), [])
+        return job["result"]
+
+    def test_upload_without_file_field(self):
+        with self.settings(SAMPLE_STORE=self.store, UPLOAD_SPOOL=self.store / "uploads"):
+            response = self.client.post(reverse("upload"), {"other": SimpleUploadedFile("other", b"unused")})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list((self.store / "uploads").iterdir()), [])
+
+    def test_unused_file_fields_are_removed(self):
+        content = b"\x7fELF sample"
+        with self.settings(SAMPLE_STORE=self.store, UPLOAD_SPOOL=self.store / "uploads"):
+            response = self.client.post(
+                reverse("upload"),
+                {"file": SimpleUploadedFile("sample", content), "other": SimpleUploadedFile("other", b"unused")},
+            )
+            self.assertEqual(response.status_code, 202)
+            job = self.wait_for_job(response.json()["status_url"])
+        self.assertEqual(job["result"]["sample_hashes"], [hashlib.sha256(content).hexdigest()])
+        self.assertEqual(list((self.store / "uploads").iterdir()), [])
+
+    def test_zip_upload_is_processed_in_background(self):
+        members = {"a/one": b"\x7fELF one", "two": b"\x7fELF two"}
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zip_file:
+            for name, content in members.items():
+                zip_file.writestr(name, content)
+        result = self.upload("samples.zip", archive.getvalue(), "application/zip")
+        hashes = [hashlib.sha256(content).hexdigest() for content in members.values()]
+        self.assertEqual(sorted(result["sample_hashes"]), sorted(hashes))
+        with SampleStore(self.store) as store:
+            self.assertTrue(all(store.locate(sample_hash, [COLD]) for sample_hash in hashes))
+        result = self.upload("samples.zip", archive.getvalue(), "application/zip")
+        self.assertEqual(result["message"], "extracted from zip file (2 already in cold storage):")
+
+    def test_upload_is_hashed_while_received(self):
+        content = b"\x7fELF" + bytes(range(256)) * 10000
+        result = self.upload("sample", content, "application/octet-stream")
+        self.assertEqual(result["sample_hashes"], [hashlib.sha256(content).hexdigest()])
+        with SampleStore(self.store) as store:
+            self.assertEqual(store.locate(result["sample_hashes"][0], [COLD]).read_bytes(), content)
+
+
+COMMIT = "0123456789abcdef0123456789abcdef01234567"
+
+
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class FilteredDataTestCase(TestCase):
+    """Tests with the tables of filtered.sqlite3, which are written by filter.py (unmanaged models)"""
+
+    databases = {"default", "samples"}
+
+    @classmethod
+    def setUpClass(cls):
+        with connections["samples"].schema_editor() as editor:
+            for model in (Summary, DewolfError, CaseGroupRepresentative):
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        with connections["samples"].schema_editor() as editor:
+            for model in (Summary, DewolfError, CaseGroupRepresentative):
+                editor.delete_model(model)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(get_user_model().objects.create_user("user"))
+
+    @staticmethod
+    def error(case_group: str, basic_blocks: int, tag: str = "quick", commit: str = COMMIT, **values) -> DewolfError:
+        return DewolfError.objects.using("samples").create(
+            case_group=case_group, function_basic_block_count=basic_blocks, tag=tag, dewolf_current_commit=commit, **values
+        )
+
+
+class IndexIssuesTests(FilteredDataTestCase):
+    def setUp(self):
+        super().setUp()
+        Summary.objects.using("samples").create(dewolf_current_commit=COMMIT)
+        self.error("ValueError@cfg.py:1", 3)
+        self.error("KeyError@cfg.py:2", 5, tag="long")
+        self.error("IndexError@cfg.py:3", 2, commit="f" * 40)  # not on the page
+        for number, case_group in enumerate(["ValueError@cfg.py:1", "KeyError@cfg.py:2", "IndexError@cfg.py:3", "other"], 1):
+            self.issue(number, case_group)
+
+    @staticmethod
+    def issue(number: int, case_group: str) -> GitHubIssue:
+        return GitHubIssue.objects.using("samples").create(
+            number=number, case_group=case_group, title="", description="", status="open", html_url=""
+        )
+
+    def page_issues(self) -> dict:
+        response = self.client.get(reverse("index"))
+        self.assertEqual(response.status_code, 200)
+        return {case_group: [issue.number for issue in issues] for case_group, issues in response.context["issues"].items()}
+
+    def test_only_issues_of_the_page_are_loaded(self):
+        self.assertEqual(self.page_issues(), {"ValueError@cfg.py:1": [1], "KeyError@cfg.py:2": [2]})
+
+    def test_case_groups_are_queried_in_chunks(self):
+        self.page_issues()
+        bump_issues_version()
+        # the errors of the page are cached, only the issues are queried again
+        with mock.patch("samples.views.NUMBERS_PER_QUERY", 1), self.assertNumQueries(2, using="samples"):
+            self.assertEqual(self.page_issues(), {"ValueError@cfg.py:1": [1], "KeyError@cfg.py:2": [2]})
+        # the cached map of these case groups, independent of the chunk size
+        with self.assertNumQueries(0, using="samples"):
+            self.page_issues()
+
+    def test_bump_issues_version_invalidates_cached_issues(self):
+        self.page_issues()
+        self.issue(5, "ValueError@cfg.py:1")
+        self.assertEqual(self.page_issues()["ValueError@cfg.py:1"], [1])
+        bump_issues_version()
+        self.assertEqual(self.page_issues()["ValueError@cfg.py:1"], [1, 5])
+
+
+class CacheTests(FilteredDataTestCase):
+    def test_none_is_cached(self):
+        compute = mock.Mock(return_value=None)
+        self.assertIsNone(cached("summary", compute, "1"))
+        self.assertIsNone(cached("summary", compute, "1"))
+        self.assertEqual(compute.call_count, 1)
+        self.assertIsNone(cached("summary", compute, "2"))
+        self.assertEqual(compute.call_count, 2)
+
+    def test_writes_change_the_data_version(self):
+        with tempfile.TemporaryDirectory() as directory, self.filtered_database(Path(directory) / "filtered.sqlite3") as con:
+            versions = [data_version()]
+            con.execute("INSERT INTO t VALUES (1)")  # appended to the WAL
+            versions.append(data_version())
+            con.execute("PRAGMA wal_checkpoint(TRUNCATE)")  # moved to the database file
+            versions.append(data_version())
+            con.execute("INSERT INTO t VALUES (2)")
+            versions.append(data_version())
+        self.assertEqual(len(set(versions)), len(versions), versions)
+
+    def test_view_queries_again_after_a_write(self):
+        Summary.objects.using("samples").create(dewolf_current_commit=COMMIT)
+        self.error("ValueError@cfg.py:1", 3)
+        with tempfile.TemporaryDirectory() as directory, self.filtered_database(Path(directory) / "filtered.sqlite3") as con:
+            self.assertGreater(self.index_queries(), 0)
+            self.assertEqual(self.index_queries(), 0)
+            con.execute("INSERT INTO t VALUES (1)")
+            self.assertGreater(self.index_queries(), 0)
+            self.assertEqual(self.index_queries(), 0)
+
+    @contextmanager
+    def filtered_database(self, path: Path):
+        """settings.DATABASES points to a database in WAL mode (as written by filter.py), yield an autocommit connection"""
+        con = sqlite3.connect(path, isolation_level=None)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            con.execute("CREATE TABLE t (a INTEGER)")
+            with mock.patch.dict(settings.DATABASES["samples"], NAME=path):
+                yield con
+        finally:
+            con.close()
+
+    def index_queries(self) -> int:
+        with CaptureQueriesContext(connections["samples"]) as queries:
+            self.assertEqual(self.client.get(reverse("index")).status_code, 200)
+        return len(queries)
+
+
+class SearchTestCase(FilteredDataTestCase):
+    def setUp(self):
+        super().setUp()
+        exceptions = ["ValueError: bad value", "KeyError: 'x'", 'RuntimeError: "quoted" 100%', "IndexError: a_b out of range"]
+        for i in range(24):
+            location = ["cfg.py", "dataflow.py", "code_generator.py"][i % 3]
+            self.error(
+                f"group{i % 5}",
+                i,
+                dewolf_exception=exceptions[i % 4],
+                dewolf_traceback=f'File "/home/dewolf/decompiler/{location}", line {i}, in run\n{exceptions[i % 4]}',
+                function_name=f"sub_{i:x}" if i % 6 else "parse_header",
+            )
+
+    @staticmethod
+    def previous_search(query: str) -> set:
+        """Rows of the search before the full-text index"""
+        rows = DewolfError.objects.using("samples").filter(Q(dewolf_exception__icontains=query) | Q(dewolf_traceback__icontains=query))
+        return set(rows.values_list("id", flat=True))
+
+    def search(self, query: str) -> set:
+        """Rows of all result pages"""
+        ids, page = [], 1
+        while page is not None:
+            response = self.client.get(reverse("search"), {"q": query, "page": page})
+            self.assertEqual(response.status_code, 200)
+            ids.extend(result.id for result in response.context["results"])
+            page = response.context["next_page"]
+        self.assertEqual(len(ids), len(set(ids)), "pages overlap")
+        return set(ids)
+
+
+class SearchTests(SearchTestCase):
+    # full-text index of filter.py (SEARCH_INDEX_SCHEMA), built from the rows of each test instead of by triggers
+    SEARCH_INDEX = """CREATE VIRTUAL TABLE dewolf_errors_fts USING fts5(
+        dewolf_exception, dewolf_traceback, function_name, content='dewolf_errors', content_rowid='id', tokenize='trigram'
+    )"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # outside of the transaction of the tests
+        with connections["samples"].cursor() as cursor:
+            cursor.execute(cls.SEARCH_INDEX)
+
+    @classmethod
+    def tearDownClass(cls):
+        with connections["samples"].cursor() as cursor:
+            cursor.execute("DROP TABLE dewolf_errors_fts")
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        with connections["samples"].cursor() as cursor:
+            cursor.execute("INSERT INTO dewolf_errors_fts (dewolf_errors_fts) VALUES ('rebuild')")
+
+    def test_same_rows_as_previous_search(self):
+        queries = ["ValueError", "valueerror", "bad value", "'x'", '"quoted"', "100%", "a_b", "dataflow.py", "line 1", "no match"]
+        full_text_search = mock.patch("samples.views._full_text_search", wraps=_full_text_search)
+        # no warning: the index is used, not the fallback
+        with mock.patch("samples.views.SEARCH_PAGE_SIZE", 5), full_text_search as fts, self.assertNoLogs(level="WARNING"):
+            for query in queries:
+                with self.subTest(query=query):
+                    self.assertEqual(self.search(query), self.previous_search(query))
+        self.assertEqual({call.args[0] for call in fts.call_args_list}, set(queries))
+        # function names are indexed too
+        parse_header = DewolfError.objects.using("samples").filter(function_name="parse_header").values_list("id", flat=True)
+        self.assertEqual(self.search("parse_head"), set(parse_header))
+
+    def test_short_queries_use_previous_search(self):
+        with mock.patch("samples.views._full_text_search") as fts:
+            for query in ["Ke", "%", "_"]:
+                with self.subTest(query=query):
+                    self.assertEqual(self.search(query), self.previous_search(query))
+        fts.assert_not_called()
+
+
+class SearchWithoutIndexTests(SearchTestCase):
+    def test_previous_search_without_index(self):
+        """filtered.sqlite3 written by an older filter.py"""
+        with mock.patch("samples.views.SEARCH_PAGE_SIZE", 5), self.assertLogs(level="WARNING"):
+            self.assertEqual(self.search("bad value"), self.previous_search("bad value"))
@@ -0,0 +1,97 @@
+"""
+Streaming uploads: the request body is written to data/uploads in chunks while its sha256 is computed, so memory
+stays bounded for multi-GB uploads and a sample is not read again to hash it. Zip members are decompressed once into
+a spool file, hashed on the way, and renamed into the store (same file system), members already stored are dropped.
+"""
+import hashlib
+import os
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import BinaryIO, Iterable, List, Optional, Tuple, Union
+
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+
+from .store import SampleStore
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _spool_file(spool: Path):
+    spool.mkdir(parents=True, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=spool, prefix="upload-", delete=False)
+
+
+class HashedUploadedFile(UploadedFile):
+    """Uploaded file in the upload spool with its sha256, kept on close (the upload job removes or stores it)"""
+
+    def __init__(self, file, name: str, content_type: str, size: int, charset: Optional[str], content_type_extra: dict, sha256: str):
+        super().__init__(file, name, content_type, size, charset, content_type_extra)
+        self.sha256 = sha256
+
+    def temporary_file_path(self) -> str:
+        return self.file.name
+
+
+class HashingFileUploadHandler(FileUploadHandler):
+    """Write uploaded files to settings.UPLOAD_SPOOL and hash them while they are received"""
+
+    chunk_size = CHUNK_SIZE
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = _spool_file(settings.UPLOAD_SPOOL)
+        self.hash = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data: bytes, start: int):
+        self.file.write(raw_data)
+        self.hash.update(raw_data)
+
+    def file_complete(self, file_size: int) -> HashedUploadedFile:
+        self.file.flush()
+        self.file.seek(0)
+        return HashedUploadedFile(
+            self.file, self.file_name, self.content_type, file_size, self.charset, self.content_type_extra, self.hash.hexdigest()
+        )
+
+    def upload_interrupted(self):
+        if hasattr(self, "file"):
+            self.file.close()
+            Path(self.file.name).unlink(missing_ok=True)
+
+
+def discard_uploads(files: Iterable[UploadedFile]):
+    """Close uploaded files and remove them from the upload spool"""
+    for file in files:
+        file.close()
+        Path(file.temporary_file_path()).unlink(missing_ok=True)
+
+
+def stream_to_store(source: BinaryIO, store: SampleStore, tier: str, spool: Path) -> Tuple[str, bool]:
+    """Copy source into tier while hashing it, return sha256 and False if the tier already had the sample"""
+    sha256 = hashlib.sha256()
+    with _spool_file(spool) as f:
+        try:
+            while chunk := source.read(CHUNK_SIZE):
+                f.write(chunk)
+                sha256.update(chunk)
+        except BaseException:
+            os.unlink(f.name)
+            raise
+    return sha256.hexdigest(), store.add(f.name, sha256=sha256.hexdigest(), tier=tier)
+
+
+def extract_to_store(zip_path: Union[str, Path], store: SampleStore, tier: str, spool: Path, pwd: Optional[str] = None) -> List[Tuple[str, bool]]:
+    """Add the files of a zip file (folder structure ignored) to tier, return sha256 and whether it was added per file"""
+    if isinstance(pwd, str):
+        pwd = pwd.encode("utf-8")
+    samples = []
+    with zipfile.ZipFile(zip_path, "r") as zip_file:
+        for info in zip_file.infolist():
+            if info.is_dir():
+                continue
+            with zip_file.open(info, pwd=pwd) as member:
+                samples.append(stream_to_store(member, store, tier, spool))
+    return samples
@@ -8,6 +8,7 @@ urlpatterns = [
     path("dashboard/", views.dashboard, name="dashboard"),
     path("search/", views.search, name="search"),
     path("update/", views.update_issues, name="update"),
+    path("jobs/<int:job_id>/", views.job_status, name="job_status"),
     path("samples/upload/", views.upload, name="upload"),
     path("samples/uploads/", views.upload_view, name="upload_view"),
     path("case/<int:row_id>/", views.dewolf_error, name="dewolf_error"),
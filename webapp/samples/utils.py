@@ -1,22 +1,8 @@
 import hashlib
-import os
-import zipfile
 from pathlib import Path
 from typing import Tuple, Union
 
 
-def unzip_flat(zip_file_path, target_dir, pwd=None):
-    """Extract zipfile content files into target directory, without preserving folder structure"""
-    if isinstance(pwd, str):
-        pwd = pwd.encode("utf-8")
-    with zipfile.ZipFile(zip_file_path, "r") as zip_ref:
-        for zip_info in zip_ref.infolist():
-            if zip_info.is_dir():
-                continue
-            zip_info.filename = os.path.basename(zip_info.filename)
-            zip_ref.extract(zip_info, target_dir, pwd=pwd)
-
-
 def get_file_last_modified_and_content(path: Path):
     """Return last modified timestamp and contents of healthcheck file"""
     if not path.exists():
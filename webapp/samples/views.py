@@ -1,23 +1,53 @@
 import logging
-import shutil
 import tempfile
 from collections import defaultdict
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Iterable, Optional
 
 import pyminizip
 from django.conf import Path, settings
 from django.contrib.auth.decorators import login_required
+from django.db import OperationalError
 from django.db.models import F, Q, Window
 from django.db.models.functions import RowNumber
 from django.http import FileResponse, Http404, HttpResponse, JsonResponse
-from django.shortcuts import redirect
 from django.template import loader
+from django.urls import reverse
 
+from .cache import bump_issues_version, cached, data_version, digest, issues_version
 from .github import Github
-from .models import DewolfError, GitHubIssue, Summary
-from .utils import (get_file_last_modified_and_content, get_last_line, get_progress, is_hex,
-                    sha256sum, unzip_flat)
+from .jobs import enqueue, get_job, job_as_dict
+from .models import CaseGroupRepresentative, DewolfError, GitHubIssue, Job, Summary
+from .store import COLD, SampleStore
+from .sync import NUMBERS_PER_QUERY, get_issue_status, sync_issues
+from .uploads import discard_uploads, extract_to_store
+from .utils import get_file_last_modified_and_content, get_last_line, get_progress, is_hex, sha256sum
+
+
+# columns of the case group tables on the index page
+INDEX_COLUMNS = ["id", "case_group", "function_basic_block_count", "errors_per_group_count_pre_filter"]
+
+
+def _cache_context(version: str) -> dict:
+    """Context of the page fragments cached by the {% cache %} tag"""
+    return {"data_version": version, "cache_timeout": settings.SAMPLES_CACHE_TIMEOUT}
+
+
+def _issues_by_case_group(case_groups: Iterable[str]) -> dict:
+    """
+    GitHub issues of the given case groups (only these are loaded), grouped by case group.
+    Memoized until the issues are updated (bump_issues_version), independent of writes of filter.py.
+    """
+
+    def _query() -> dict:
+        issues = defaultdict(list)
+        for i in range(0, len(groups), NUMBERS_PER_QUERY):
+            for issue in GitHubIssue.objects.using("samples").filter(case_group__in=groups[i : i + NUMBERS_PER_QUERY]).order_by("id"):
+                issues[issue.case_group].append(issue)
+        return dict(issues)
+
+    groups = sorted(set(case_groups))
+    return cached(f"issues:{digest(groups)}", _query, issues_version()) if groups else {}
 
 
 @login_required
@@ -25,8 +55,9 @@ def index(request):
     """
     Index view, list smallest cases per case group
     """
+    version = data_version()
     # query summary for current dewolf commit
-    summary = Summary.objects.using("samples").order_by("-id").first()
+    summary = cached("summary", lambda: Summary.objects.using("samples").order_by("-id").first(), version)
 
     if summary is None:
         context = {
@@ -39,13 +70,33 @@ def index(request):
         template = loader.get_template("index.html")
         return HttpResponse(template.render(context, request))
 
+    def _has_representatives(commit: str) -> bool:
+        """filtered.sqlite3 written by an older filter.py has no (or no current) case_group_representatives"""
+        try:
+            return CaseGroupRepresentative.objects.using("samples").filter(dewolf_current_commit=commit).exists()
+        except OperationalError:
+            return False
+
+    def _representatives_per_case_group_and_tag(commit: str, tag: Optional[str]):
+        """
+        Return query set containing the smallest representative of each case group,
+        given commit and run-type, precomputed by filter.py.
+        """
+        representatives = CaseGroupRepresentative.objects.using("samples").filter(dewolf_current_commit=commit, tag=tag)
+        return (
+            DewolfError.objects.using("samples")
+            .only(*INDEX_COLUMNS)
+            .filter(id__in=representatives.values("dewolf_error_id"))
+            .order_by("-errors_per_group_count_pre_filter")
+        )
+
     def _smallest_sample_per_case_group_and_tag(commit: str, tag: Optional[str]):
         """
         Return query set containing the smallest representative of each case group,
         given commit and run-type.
         """
         # select the smallest representative from a case group
-        errors_current_commit = DewolfError.objects.using("samples").filter(dewolf_current_commit=commit, tag=tag)
+        errors_current_commit = DewolfError.objects.using("samples").only(*INDEX_COLUMNS).filter(dewolf_current_commit=commit, tag=tag)
         # annotate each error wit row number, partition by 'case_group', and ordered by #basicblocks
         rows_minimized_per_group = errors_current_commit.annotate(
             row_number=Window(expression=RowNumber(), partition_by=[F("case_group")], order_by=F("function_basic_block_count").asc())
@@ -53,22 +104,27 @@ def index(request):
         # select representative with least basic blocks, then order by error count descending
         return rows_minimized_per_group.filter(row_number=1).order_by("-errors_per_group_count_pre_filter")
 
-    quickrun_errors = _smallest_sample_per_case_group_and_tag(summary.dewolf_current_commit, "quick")
-    longrun_errors = _smallest_sample_per_case_group_and_tag(summary.dewolf_current_commit, "long")
-    untagged_errors = _smallest_sample_per_case_group_and_tag(summary.dewolf_current_commit, None)
+    def _errors_per_tag(commit: str) -> dict:
+        """Smallest case of each case group per run-type"""
+        if _has_representatives(commit):
+            errors_per_case_group_and_tag = _representatives_per_case_group_and_tag
+        else:
+            errors_per_case_group_and_tag = _smallest_sample_per_case_group_and_tag
+        return {tag: list(errors_per_case_group_and_tag(commit, tag)) for tag in ("quick", "long", None)}
 
-    # retrieve all GitHub issues, group them in a default dict by 'case_group'
-    github_issues_by_case_group = defaultdict(list)
-    for issue in GitHubIssue.objects.using("samples").all():
-        github_issues_by_case_group[issue.case_group].append(issue)
+    commit = summary.dewolf_current_commit
+    errors = cached(f"index_errors:{commit}", lambda: _errors_per_tag(commit), version)
 
     template = loader.get_template("index.html")
     context = {
-        "quickrun_errors": quickrun_errors,
-        "longrun_errors": longrun_errors,
-        "untagged_errors": untagged_errors,
+        "quickrun_errors": errors["quick"],
+        "longrun_errors": errors["long"],
+        "untagged_errors": errors[None],
         "summary": summary,
-        "issues": github_issues_by_case_group,
+        # issues of the case groups on the page
+        "issues": _issues_by_case_group(error.case_group for tag_errors in errors.values() for error in tag_errors),
+        "issues_version": issues_version(),
+        **_cache_context(version),
     }
     return HttpResponse(template.render(context, request))
 
@@ -96,42 +152,93 @@ def dashboard(request):
     return HttpResponse(template.render(context, request))
 
 
+SEARCH_PAGE_SIZE = 50
+# columns shown in search results, the others (e.g., undecorated code) are loaded on access
+SEARCH_COLUMNS = ["id", "dewolf_exception", "dewolf_current_commit", "function_platform", "function_name", "function_basic_block_count"]
+
+
+def _full_text_search(query: str, offset: int, limit: int) -> list:
+    """
+    Search exception, traceback and function name in the full-text index of filter.py, best matches first.
+    The trigram index matches substrings of at least three characters.
+    """
+    phrase = '"' + query.replace('"', '""') + '"'
+    columns = ", ".join(f"dewolf_errors.{column}" for column in SEARCH_COLUMNS)
+    return list(
+        DewolfError.objects.using("samples").raw(
+            f"""SELECT {columns} FROM (
+                SELECT rowid, rank FROM dewolf_errors_fts WHERE dewolf_errors_fts MATCH %s ORDER BY rank LIMIT %s OFFSET %s
+            ) AS matches
+            JOIN dewolf_errors ON dewolf_errors.id = matches.rowid
+            ORDER BY matches.rank""",
+            [phrase, limit, offset],
+        )
+    )
+
+
 @login_required
 def search(request):
-    query = request.GET.get("q")
+    query = request.GET.get("q", "")
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+    offset = (page - 1) * SEARCH_PAGE_SIZE
+    # fetch one more row to know if there is a next page
+    limit = SEARCH_PAGE_SIZE + 1
     template = loader.get_template("search.html")
+    results = None
     if is_hex(query) and len(query) >= 4:
-        results = DewolfError.objects.using("samples").filter(sample_hash__startswith=query)
-    else:
-        results = DewolfError.objects.using("samples").filter(Q(dewolf_exception__icontains=query) | Q(dewolf_traceback__icontains=query))
+        results = DewolfError.objects.using("samples").filter(sample_hash__startswith=query).order_by("id")[offset : offset + limit]
+    elif len(query) >= 3:
+        try:
+            results = _full_text_search(query, offset, limit)
+        except OperationalError as ex:
+            # filtered.sqlite3 without full-text index
+            logging.warning(f"full-text search: {ex}")
+    if results is None:
+        results = (
+            DewolfError.objects.using("samples")
+            .filter(Q(dewolf_exception__icontains=query) | Q(dewolf_traceback__icontains=query))
+            .order_by("id")[offset : offset + limit]
+        )
+    results = list(results)
 
-    context = {"results": results}
+    context = {
+        "results": results[:SEARCH_PAGE_SIZE],
+        "query": query,
+        "page": page,
+        "previous_page": page - 1 if page > 1 else None,
+        "next_page": page + 1 if len(results) > SEARCH_PAGE_SIZE else None,
+    }
     return HttpResponse(template.render(context, request))
 
 
 @login_required
 def dewolf_error(request, row_id):
-    dewolf_error = DewolfError.objects.using("samples").get(id=row_id)
-    related_cases = (
-        DewolfError.objects.using("samples")
-        .filter(case_group=dewolf_error.case_group)
-        .exclude(id=row_id)
-        .order_by("function_basic_block_count")
-    )[:10]
-    try:
-        issues = GitHubIssue.objects.using("samples").filter(case_group=dewolf_error.case_group).all()
-    except GitHubIssue.DoesNotExist:
-        issues = []
-
-    context = {"failed_case": dewolf_error, "related_cases": related_cases, "issues": issues}
+    def _case():
+        dewolf_error = DewolfError.objects.using("samples").get(id=row_id)
+        related_cases = (
+            DewolfError.objects.using("samples")
+            .filter(case_group=dewolf_error.case_group)
+            .exclude(id=row_id)
+            .order_by("function_basic_block_count")
+        )[:10]
+        return dewolf_error, list(related_cases)
+
+    version = data_version()
+    dewolf_error, related_cases = cached(f"dewolf_error:{row_id}", _case, version)
+    issues = _issues_by_case_group([dewolf_error.case_group]).get(dewolf_error.case_group, [])
+    context = {"failed_case": dewolf_error, "related_cases": related_cases, "issues": issues, **_cache_context(version)}
     template = loader.get_template("dewolf_error.html")
     return HttpResponse(template.render(context, request))
 
 
 @login_required
 def samples(request):
-    summary = Summary.objects.using("samples").order_by("-id").all()
-    context = {"summary": summary, "avg_duration": "not implemented"}
+    version = data_version()
+    summary = cached("summaries", lambda: list(Summary.objects.using("samples").order_by("-id").all()), version)
+    context = {"summary": summary, "avg_duration": "not implemented", **_cache_context(version)}
     template = loader.get_template("samples.html")
     return HttpResponse(template.render(context, request))
 
@@ -143,8 +250,8 @@ def download_sample(request, sample_hash):
     if not is_hex(sample_hash):
         raise Http404()
 
-    if not (sample_file := Path(settings.SAMPLE_DIR) / sample_hash).exists():
-        sample_file = Path(settings.SAMPLE_COLD_STORAGE) / sample_hash
+    if (sample_file := SampleStore(settings.SAMPLE_STORE).locate(sample_hash)) is None:
+        raise Http404("sample does not exist")
 
     with tempfile.TemporaryDirectory() as tdir:
         zip_path = Path(tdir) / f"{sample_hash}.zip"
@@ -155,55 +262,68 @@ def download_sample(request, sample_hash):
         return FileResponse(open(zip_path, "rb"), as_attachment=True, filename=f"{sample_hash}.zip")
 
 
-def get_issue_status(issue) -> str:
-    status = issue["state"]
-    if status == "open" and issue["assignee"] is not None:
-        return "in progress"
-    return status
+def _github() -> Github:
+    return Github(settings.GITHUB_TOKEN, settings.GITHUB_REPO_OWNER, settings.GITHUB_REPO_NAME, api_url=settings.GITHUB_API_URL)
+
+
+def _job_page(request, job: Job, next_url: Optional[str] = None) -> HttpResponse:
+    """Page polling the status of a background job, continues to next_url when it is done"""
+    context = {"job": job, "next_url": next_url}
+    template = loader.get_template("update.html")
+    return HttpResponse(template.render(context, request))
 
 
-def _case_group_from_title(title: str) -> str:
-    return title[1 : title.find("]")]
+@login_required
+def job_status(request, job_id):
+    try:
+        job = get_job(job_id)
+    except Job.DoesNotExist:
+        raise Http404()
+    return JsonResponse(job_as_dict(job))
 
 
-def _update_issues():
+def _update_issues(full: bool = False) -> dict:
     """
-    Iterate repo issues (tagged 'bugfinder'), match them to case group and write to issue db
+    Fetch repo issues (tagged 'bugfinder') changed since the last update, match them to case group and write to issue db
     """
-    issues = []
-    repo = Github(settings.GITHUB_TOKEN, settings.GITHUB_REPO_OWNER, settings.GITHUB_REPO_NAME)
-    for title, issue in repo.existing_issue_titles_to_issue_map.items():
-        issues.append(f"#{issue['number']}: {get_issue_status(issue)}")
-        try:
-            db_issue = GitHubIssue.objects.using("samples").get(number=issue["number"])
-            db_issue.status = get_issue_status(issue)
-            db_issue.updated_at = datetime.now()
-            db_issue.save()
-        except GitHubIssue.DoesNotExist:
-            github_issue = GitHubIssue.objects.using("samples").create(
-                case_group=_case_group_from_title(title),
-                title=title,
-                description="",
-                status=get_issue_status(issue),
-                number=issue["number"],
-                html_url=issue["html_url"],
-                created_at=datetime.now(),
-                updated_at=datetime.now(),
-            )
-            github_issue.save()
-    return issues
+    result = sync_issues(_github(), full=full)
+    return {"message": f'Success! {result}. {" ".join(result.issues)}'}
 
 
 @login_required
 def update_issues(request):
-    try:
-        issues = _update_issues()
-        response = {"message": f'Success! {" ".join(issues)}', "status": 200}
-    except Exception as ex:
-        response = {"message": f"ERROR: {ex}", "status": 500}
-    context = {"response": response}
-    template = loader.get_template("update.html")
-    return HttpResponse(template.render(context, request))
+    job = enqueue("update issues", _update_issues, full="full" in request.GET)
+    return _job_page(request, job)
+
+
+def _create_github_issue(case_id: int) -> dict:
+    """Create the GitHub issue of a case, unless its case group has one, and write it to the issue db"""
+    dewolf_error = DewolfError.objects.using("samples").get(id=case_id)
+    context = {"issue": dewolf_error}
+    issue_title = f"[{dewolf_error.case_group}] {dewolf_error.dewolf_exception}"
+    issue_text = loader.render_to_string("issue.md", context)
+    repo = _github()
+    # a conditional sync (usually 304 Not Modified) instead of fetching all issues to check the title
+    sync_issues(repo)
+    if GitHubIssue.objects.using("samples").filter(title=issue_title).exists():
+        logging.warning(f"issue already exists: {issue_title}")
+        return {"message": f"issue already exists: {issue_title}"}
+    if (issue := repo.create_issue(title=issue_title, body=issue_text, check_existing=False)) is None:
+        raise RuntimeError("no issue was created")
+    # Create a new instance of the GitHubIssue model
+    github_issue = GitHubIssue.objects.using("samples").create(
+        case_group=dewolf_error.case_group,
+        title=issue_title,
+        description="",
+        status=get_issue_status(issue),
+        number=issue["number"],
+        html_url=issue["html_url"],
+        created_at=datetime.now(),
+        updated_at=datetime.now(),
+    )
+    github_issue.save()
+    bump_issues_version()
+    return {"message": f"created issue #{issue['number']}", "html_url": issue["html_url"]}
 
 
 @login_required
@@ -220,71 +340,64 @@ def create_github_issue(request, case_id):
             raise Http404()
     elif request.method == "POST":
         # create issue
-        context = {"issue": dewolf_error}
-        issue_title = f"[{dewolf_error.case_group}] {dewolf_error.dewolf_exception}"
-        issue_text = loader.render_to_string("issue.md", context)
-        repo = Github(settings.GITHUB_TOKEN, settings.GITHUB_REPO_OWNER, settings.GITHUB_REPO_NAME)
-        if (issue := repo.create_issue(title=issue_title, body=issue_text)) is not None:
-            # Create a new instance of the GitHubIssue model
-            github_issue = GitHubIssue.objects.using("samples").create(
-                case_group=dewolf_error.case_group,
-                title=issue_title,
-                description="",
-                status=get_issue_status(issue),
-                number=issue["number"],
-                html_url=issue["html_url"],
-                created_at=datetime.now(),
-                updated_at=datetime.now(),
-            )
-            github_issue.save()
-        else:
-            logging.warning("no issue was created")
-        return redirect(request.META["HTTP_REFERER"])
+        job = enqueue("create issue", _create_github_issue, dewolf_error.id)
+        return _job_page(request, job, next_url=request.META.get("HTTP_REFERER"))
 
 
-def move_to_coldstorage(file_path: Path):
-    sample_hash = sha256sum(file_path)
-    shutil.move(file_path, Path(settings.SAMPLE_COLD_STORAGE) / sample_hash)
+def move_to_coldstorage(file_path: Path, sample_hash: Optional[str] = None):
+    sample_hash = sample_hash or sha256sum(file_path)
+    with SampleStore(settings.SAMPLE_STORE) as store:
+        store.add(file_path, sha256=sample_hash, tier=COLD)
     return sample_hash
 
 
 def handle_zip_file(zipfile_path):
-    with tempfile.TemporaryDirectory() as tdir:
-        response_data = {"message": "extracted from zip file:", "sample_hashes": []}
-        try:
-            unzip_flat(zipfile_path, tdir, pwd=settings.ZIP_PASSWORD)
-        except Exception as ex:
-            response_data["message"] = str(ex)
-            logging.error(f"unzip: {ex}")
-            return 500, response_data
-        for sample in Path(tdir).iterdir():
-            if not sample.is_file():
-                continue
-            sample_hash = move_to_coldstorage(sample)
-            response_data["sample_hashes"].append(sample_hash)
-        return 200, response_data
-
-
-def handle_file(file_path):
-    sample_hash = move_to_coldstorage(file_path)
+    response_data = {"message": "extracted from zip file:", "sample_hashes": []}
+    try:
+        # members are hashed while they are extracted into cold storage, stored members are dropped
+        with SampleStore(settings.SAMPLE_STORE) as store:
+            samples = extract_to_store(zipfile_path, store, COLD, settings.UPLOAD_SPOOL, pwd=settings.ZIP_PASSWORD)
+    except Exception as ex:
+        response_data["message"] = str(ex)
+        logging.error(f"unzip: {ex}")
+        return 500, response_data
+    if skipped := sum(not added for _, added in samples):
+        response_data["message"] = f"extracted from zip file ({skipped} already in cold storage):"
+    response_data["sample_hashes"] = [sample_hash for sample_hash, _ in samples]
+    return 200, response_data
+
+
+def handle_file(file_path, sample_hash: Optional[str] = None):
+    sample_hash = move_to_coldstorage(file_path, sample_hash)
     response_data = {"message": "uploaded sample hash:", "sample_hashes": [sample_hash]}
     return 200, response_data
 
 
+def _process_upload(path: str, is_zip: bool, sample_hash: str) -> dict:
+    """Move an uploaded file (or the files of an uploaded zip file) to cold storage, remove the upload"""
+    try:
+        status, response_data = handle_zip_file(path) if is_zip else handle_file(path, sample_hash)
+    finally:
+        Path(path).unlink(missing_ok=True)
+    if status != 200:
+        raise RuntimeError(response_data["message"])
+    return response_data
+
+
 @login_required
 def upload(request):
     if request.method == "POST" and request.FILES:
+        # streamed to the upload spool and hashed by HashingFileUploadHandler (settings.FILE_UPLOAD_HANDLERS)
         file = request.FILES.get("file")
-
-        with tempfile.NamedTemporaryFile(delete=False) as temp_file:
-            temp_file.write(file.read())
-            temp_file.flush()
-
-            if file.content_type == "application/zip":
-                status, response_data = handle_zip_file(temp_file.name)
-            else:
-                status, response_data = handle_file(temp_file.name)
-            return JsonResponse(response_data, status=status)
+        # every file field is spooled, remove the ones not used (other fields, earlier values of "file")
+        discard_uploads(other for _, files in request.FILES.lists() for other in files if other is not file)
+        if file is None:
+            return JsonResponse({"error": "Missing file"}, status=400)
+        file.close()
+        is_zip = file.content_type == "application/zip"
+        job = enqueue(f"upload {file.name}", _process_upload, file.temporary_file_path(), is_zip, file.sha256)
+        response_data = {"message": "processing upload", "sample_hashes": [], "job": job.id, "status_url": reverse("job_status", args=[job.id])}
+        return JsonResponse(response_data, status=202)
     return JsonResponse({"error": "Invalid request"}, status=400)
 
 
@@ -5,8 +5,19 @@ max_size=90000
 image_name="bugfinder-dewolf"
 dewolf_repo="$(pwd)/dewolf/repo"
 dewolf_branch="main"
-max_workers=8
+max_workers=$(nproc) # ceiling of parallel dewolf containers
+min_workers=2 # floor, the scheduler sizes the pool in between by load and memory (min_workers=max_workers: fixed pool)
+memory_reserve=4096 # MiB of available memory, the pool shrinks below and only grows above it
 max_time=600
+samples_per_container=100 # samples per long-lived dewolf container (1: new container for each sample)
+shard_functions=1000 # split samples with more functions across slots (needs samples_per_container > 1, 0: disabled)
+differential_quick_run=1 # quick run: only functions that failed on the last commit (needs samples_per_container > 1)
+filter_chunksize=100000
+ingest_batch_size=1000 # files hashed and moved per batch during a long run
+settle_seconds=2 # new files in infolder are ingested once they did not change for this time (completely written)
+refresh_interval=300 # seconds between incremental updates of filtered.sqlite3 during a run
+collect_interval=30 # seconds between merges of the per-slot result shards (data/results) into samples.sqlite3 (0: shared samples.sqlite3)
+last_refresh=0
 
 # globals for rate limiting GitHub queries
 last_commit_check=0
@@ -34,26 +45,6 @@ docker_stop_image () {
     fi
 }
 
-docker_wait_image () {
-    echo "[+] wait for running containers..."
-    local container_ids=$(docker ps -q --filter ancestor="${image_name}")
-
-    if [[ -z "${container_ids}" ]]; then
-        echo "[+] no containers running for image: ${image_name}"
-        return
-    fi
-
-    echo "[+] waiting for containers:"
-    for container_id in $container_ids; do
-        if docker ps -q | grep -q "^${container_id}$"; then
-            echo "    - Waiting for container: ${container_id}"
-            docker wait "${container_id}"
-        else
-            echo "    - No such container: ${container_id}"
-        fi
-    done    
-}
-
 finish() {
     local result=$?
     echo "[+] - $(get_timestamp) - exiting worker.sh with ${result}"
@@ -63,60 +54,45 @@ finish() {
 trap finish EXIT ERR
 
 
-filter_sample_file () {
-    local file=$1
-    # local size=$(wc -c < "${file}")
-    # if (( ${size} > ${max_size} )); then
-    #     echo "[-] file too big (${size} bytes)"
-    #     rm ${file}
-    #     return 0
-    # fi
-
-    local file_info=$(file ${file})
-    if ! echo "${file_info}" | grep -q -E "ELF|Mach-O|PE32|COFF|DOS exe|COM exe"; then
-        echo "[-] file type not allowed: ${file_info}"
-        rm "${file}"
-        return 0
-    fi
-    return 1 # file was not filtered
+run_scheduler () {
+    # process sample hashes from stdin with a pool of ${min_workers} to ${max_workers} dewolf containers
+    # writes data/<tag>_run.progress and data/healthcheck.txt, returns when all samples are processed
+    local tag=$1
+    local total=$2
+    source "$(pwd)/.venv/bin/activate"
+    python scheduler.py --workers ${max_workers} --min-workers ${min_workers} --memory-reserve ${memory_reserve} --max-time ${max_time} --image ${image_name} --data-dir "$(pwd)/data" \
+        --samples-per-container ${samples_per_container} --shard-functions ${shard_functions} --collect-interval ${collect_interval} \
+        --label ${tag} --total ${total} --progress "data/${tag}_run.progress" --healthcheck data/healthcheck.txt
+    local status=$?
+    deactivate
+    return ${status}
 }
 
-run_task () {
-    # docker run task in background
-    local sample_hash=$1
-    local command="python decompiler/util/bugfinder/bugfinder.py /data/samples/${sample_hash} --sqlite-file /data/samples.sqlite3"
-    docker run --rm --detach --mount type=bind,source="$(pwd)/data",target=/data \
-        ${image_name} timeout ${max_time} ${command}
+migrate_store () {
+    # move samples of the old flat layout (data/samples/<hash>) into the sharded sample store
+    source "$(pwd)/.venv/bin/activate"
+    python -m webapp.samples.store migrate
+    deactivate
 }
 
-refill_infolder () {
-    # save relevant samples (linked on webapp)
-    # move samples to infolder for processing
-    echo "[+] refilling infolder and copying relevant samples cold storage..."
+requeue_samples () {
+    # save relevant samples (linked on webapp) to cold storage (hardlinks)
+    # queue all samples for processing with the new dewolf version
+    echo "[+] queueing samples and linking relevant samples to cold storage..."
+    source "$(pwd)/.venv/bin/activate"
     if [ -f "data/filtered.sqlite3" ]; then
-        source "$(pwd)/.venv/bin/activate"
-        for i in $(python filter.py -i data/filtered.sqlite3 --list); do 
-            cp -n data/samples/$i data/cold_storage 2> /dev/null
-        done
-        deactivate
+        python filter.py -i data/filtered.sqlite3 --list | python -m webapp.samples.store link cold_storage
     fi
-    rmdir ${infolder} && mv data/samples ${infolder}
-    mkdir -p data/samples
+    python -m webapp.samples.store queue
+    deactivate
+    prioritize_samples
 }
 
-queue_sample_by_hash () {
-    # add a sample by hash to the worker pool
-    local sample_hash=$1
-
-    # Wait for a free worker to process the sample
-    local running_containers=$(sudo docker ps --filter ancestor="${image_name}" -q | wc -l)
-    while [ ${running_containers} -ge ${max_workers} ]; do
-      sleep 1
-      running_containers=$(sudo docker ps --filter ancestor="${image_name}" -q | wc -l)
-    done
-    # Start a new worker/container
-    echo "[+] $(get_timestamp) - starting worker container"
-    run_task ${sample_hash}
+prioritize_samples () {
+    # order queued samples by the history of the last runs (likely crashing and cheap first, timeouts last)
+    source "$(pwd)/.venv/bin/activate"
+    python prioritize.py --store data --filtered data/filtered.sqlite3
+    deactivate
 }
 
 update_db () {
@@ -139,43 +115,100 @@ update_db () {
     fi
     echo "[+] filtering and rotating samples.sqlite3"
     source "$(pwd)/.venv/bin/activate"
-    python filter.py -i data/samples.sqlite3 -o data/filtered.sqlite3 --tag ${tag}
+    python filter.py -i data/samples.sqlite3 -o data/filtered.sqlite3 --tag ${tag} --incremental --chunksize ${filter_chunksize}
     deactivate
     mv --backup=numbered data/samples.sqlite3 data/"${tag}_${current_commit}.sqlite3"
 }
 
+refresh_db () {
+    # merge rows added to samples.sqlite3 since the last refresh into filtered.sqlite3 (rate limited)
+    local tag=$1
+    local current_time=$(date +%s)
+    if [ $((current_time - last_refresh)) -lt ${refresh_interval} ] || [ ! -f "data/samples.sqlite3" ]; then
+        return
+    fi
+    last_refresh=${current_time}
+    echo "[*] refreshing filtered.sqlite3 (${tag})..."
+    source "$(pwd)/.venv/bin/activate"
+    python filter.py -i data/samples.sqlite3 -o data/filtered.sqlite3 --tag ${tag} --incremental --chunksize ${filter_chunksize}
+    deactivate
+}
+
+
+quick_run_samples () {
+    # print hashes of queued samples of the quick run list (stdout only for hashes), samples that are not queued were
+    # already processed, or are missing. The scheduler unqueues each sample once it is processed, so the samples of an
+    # interrupted quick run stay queued
+    source "$(pwd)/.venv/bin/activate"
+    python -m webapp.samples.store take --only "./data/quick_run" --keep | while IFS= read -r sample_hash; do
+        echo "${sample_hash}"
+        refresh_db "quick" >&2
+    done
+    local status=$?
+    deactivate
+    return ${status}
+}
+
+quick_run_differential () {
+    # decompile only the functions that failed on the last processed commit and report per case group
+    # which are fixed, still failing, or fail differently; the samples stay queued for the long run
+    # report only: the results are not filtered into filtered.sqlite3 (no summary of the new commit from some functions),
+    # they are kept in data/quick_run_differential.sqlite3 until the next differential run
+    local last_processed_commit=$1
+    pushd "${dewolf_repo}"
+    local current_commit="$(git rev-parse HEAD)"
+    popd
+    if [[ "${current_commit}" == "${last_processed_commit}"* ]]; then
+        echo "[*] quick run: no new dewolf commit since ${last_processed_commit}"
+        return
+    fi
+    source "$(pwd)/.venv/bin/activate"
+    python filter.py -i data/filtered.sqlite3 --worklist --commit ${last_processed_commit} > "./data/quick_run"
+    deactivate
+    # progress is counted in scheduler tasks: consecutive lines of a sample form one task
+    local total_tasks=$(cut -f1 "./data/quick_run" | uniq | wc -l)
+    echo "[+] functions to process in quick run: $(wc -l < "./data/quick_run") (tasks: ${total_tasks})"
+    echo "0/${total_tasks}" > data/quick_run.progress
+    if ! run_scheduler "quick" ${total_tasks} < "./data/quick_run"; then
+        echo "[-] ERROR: quick run failed"
+        exit 1
+    fi
+    if [ ! -f "data/samples.sqlite3" ]; then
+        echo "[*] quick run: no results"
+        return
+    fi
+    source "$(pwd)/.venv/bin/activate"
+    python filter.py -i data/samples.sqlite3 --differential data/filtered.sqlite3 --commit ${last_processed_commit} | tee data/quick_run_report.txt
+    deactivate
+    # not named <tag>_<commit>.sqlite3, so prioritize.py does not take the partial samples as history
+    mv data/samples.sqlite3 data/quick_run_differential.sqlite3
+}
 
 quick_run () {
     # process crashing samples from last commit
-    # samples must be in infolder and will be moved to data/samples
+    # samples must be queued in the sample store
     echo "[+] starting quick run..."
     if [ ! -f "data/filtered.sqlite3" ]; then
         echo "[-] no filtered.sqlite3 found. Make sure to init database."
         return
     fi
     local last_processed_commit=$(sqlite3 data/filtered.sqlite3 "SELECT dewolf_current_commit FROM summary ORDER BY id DESC LIMIT 1;") 
+    if [ "${differential_quick_run}" -eq 1 ] && [ "${samples_per_container}" -gt 1 ] && [ -n "${last_processed_commit}" ]; then
+        quick_run_differential ${last_processed_commit}
+        return
+    fi
     source "$(pwd)/.venv/bin/activate"
     python filter.py -i data/filtered.sqlite3 --list --commit ${last_processed_commit} > "./data/quick_run"
+    local queued_files=$(python -m webapp.samples.store count --queued)
     deactivate
     total_files=$(wc -l "./data/quick_run" | awk '{print $1}')
-    processed_files=0
-    echo "[+] samples to process in quick run: ${total_files} (infolder: $(ls ${infolder} | wc -l))"
-    echo "${processed_files}/${total_files}" > data/quick_run.progress
-    while IFS= read -r file; do
-        if [ ! -f "${infolder}/${file}" ]; then
-            # already processed, or missing
-            continue
-        fi
-        mv "${infolder}/${file}" "./data/samples/${file}"
-        queue_sample_by_hash ${file}
-        ((processed_files++))
-        echo "${processed_files}/${total_files}" > data/quick_run.progress
-        echo "quick run containers:" > data/healthcheck.txt
-        docker ps >> data/healthcheck.txt
-    done < "./data/quick_run"
-    docker_wait_image
-    echo "quick run containers:" > data/healthcheck.txt
-    docker ps >> data/healthcheck.txt
+    echo "[+] samples to process in quick run: ${total_files} (queued: ${queued_files})"
+    echo "0/${total_files}" > data/quick_run.progress
+    if ! quick_run_samples | run_scheduler "quick" ${total_files}; then
+        echo "[-] ERROR: quick run failed"
+        exit 1
+    fi
+    local processed_files=$(cut -d/ -f1 data/quick_run.progress)
     if [ "$processed_files" -ne 0 ]; then
         # quickrun did process files
         echo "[*] finalizing quick run"
@@ -186,23 +219,18 @@ quick_run () {
 }
 
 clear_infolder () {
-    # move files from infolder to data/samples
+    # move files from infolder into the sample store
     # filter, and name by sha256
     echo "[+] clearing infolder..."
     mkdir -p ${infolder}
-    for f in $(find ${infolder} -maxdepth 1 -type f ! -name '.gitignore'); do
-        echo "[+] clear - $(get_timestamp) - file: ${f}"
-        if filter_sample_file $f; then
-            continue # file was filtered
-        fi
-        hash=$(sha256sum $f | awk '{ print $1 }')
-        status=$?
-        if [[ ${status} -ne 0 ]]; then
-            echo "[-] ERROR: hashing failed (${status})"
-            exit 1
-        fi
-        mv "${f}" "./data/samples/${hash}"
-    done
+    source "$(pwd)/.venv/bin/activate"
+    python ingest.py ${infolder} ./data --manifest data/ingest_manifest.csv --min-age ${settle_seconds} > /dev/null
+    local status=$?
+    deactivate
+    if [[ ${status} -ne 0 ]]; then
+        echo "[-] ERROR: ingesting infolder failed (${status})"
+        exit 1
+    fi
 }
 
 check_new_commit() {
@@ -234,40 +262,53 @@ check_new_commit() {
     fi
 }
 
-long_run () {
-    # process all remaining files in infolder
-    # perform renaming and filtering
-    echo "[+] starting long run..."
-    total_files=$(ls "${infolder}" | wc -l)
-    processed_files=0
-    echo "[+] samples to process in long run: ${total_files}"
-    echo "${processed_files}/${total_files}" > data/long_run.progress
-    for file in $(find ${infolder} -maxdepth 1 -type f ! -name '.gitignore'); do
-        check_new_commit
+long_run_samples () {
+    # print hashes of queued samples, then of new files from infolder (filtered, renamed, and moved into the sample
+    # store), in batches (stdout only for hashes), stops at a new upstream commit
+    # when idle, waits for new files in infolder, so they are processed within seconds by the running scheduler
+    # the run only ends at a new commit, so its results are finalized (update_db) once per commit, and merged
+    # into filtered.sqlite3 by refresh_db in between
+    while true; do
+        check_new_commit >&2
         if [ $? -eq 1 ]; then
-            echo "[+] Breaking long run due to new commit in upstream"
+            echo "[+] Breaking long run due to new commit in upstream" >&2
             break
         fi
-        echo "[+] long run - $(get_timestamp) - filename: ${file}"
-        if filter_sample_file $file; then
-            continue # file was filtered
+        source "$(pwd)/.venv/bin/activate"
+        local sample_hashes=$(python -m webapp.samples.store take --limit ${ingest_batch_size})
+        local status=0
+        if [ -n "${sample_hashes}" ]; then
+            echo "${sample_hashes}"
+        elif [ -n "$(python watcher.py ${infolder} --settle ${settle_seconds} --timeout ${refresh_interval})" ]; then
+            # returns at once if infolder has completely written files
+            echo "[+] long run - $(get_timestamp) - ingesting up to ${ingest_batch_size} files" >&2
+            python ingest.py ${infolder} ./data --manifest data/ingest_manifest.csv --limit ${ingest_batch_size} --min-age ${settle_seconds}
+            status=$?
         fi
-        hash=$(sha256sum $file | awk '{ print $1 }')
-        status=$?
+        deactivate
         if [[ ${status} -ne 0 ]]; then
-            echo "[-] ERROR: hashing failed (${status})"
+            echo "[-] ERROR: ingesting infolder failed (${status})" >&2
             exit 1
         fi
-        mv "${file}" "./data/samples/${hash}"
-        queue_sample_by_hash ${hash}
-        ((processed_files++))
-        echo "${processed_files}/${total_files}" > data/long_run.progress
-        echo "long run containers:" > data/healthcheck.txt
-        docker ps >> data/healthcheck.txt
+        refresh_db "long" >&2
     done
-    docker_wait_image
-    echo "long run containers:" > data/healthcheck.txt
-    docker ps >> data/healthcheck.txt
+}
+
+long_run () {
+    # process all queued samples and new files in infolder until a new upstream commit
+    # perform renaming and filtering, finalize the results of the commit
+    echo "[+] starting long run..."
+    prioritize_samples
+    source "$(pwd)/.venv/bin/activate"
+    local queued_files=$(python -m webapp.samples.store count --queued)
+    deactivate
+    total_files=$((queued_files + $(find ${infolder} -maxdepth 1 -type f ! -name '.gitignore' | wc -l)))
+    echo "[+] samples to process in long run: ${total_files}"
+    echo "0/${total_files}" > data/long_run.progress
+    if ! long_run_samples | run_scheduler "long" ${total_files}; then
+        echo "[-] ERROR: long run failed"
+        exit 1
+    fi
     clear_infolder
     update_db "long"
 }
@@ -296,7 +337,7 @@ init_new_run () {
             exit 1
         fi
         clear_infolder
-        refill_infolder
+        requeue_samples
     else
         echo "[+] no new dewolf version" 
     fi
@@ -304,11 +345,10 @@ init_new_run () {
 
 set -o pipefail
 
+migrate_store
+
 while [[ true ]]; do
     quick_run
     long_run
     init_new_run
-
-    echo "[+] sleeping for ${rate_limit_duration}..."
-    sleep ${rate_limit_duration}
 done
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+"""
+Persistent bugfinder worker, runs inside a dewolf container started by `scheduler.py --samples-per-container N`.
+
+The agent connects to the unix socket of its scheduler slot and processes sample hashes until it is told to exit
+or has processed max_samples. Heavy modules (Binary Ninja) are imported once, each sample runs bugfinder.py in a
+forked child: a crash or timeout of one sample only kills the child, like `timeout <max_time> python bugfinder.py`.
+
+Protocol (one JSON object per line):
+    agent -> scheduler: {"ready": true}
+    scheduler -> agent: {"sample_hash": "<hash>", "sample_path": "/data/samples/ab/cd/<hash>"} or {"exit": true}
+                        large samples are split by the scheduler, "shard": [index, count] in the task,
+                        differential runs limit the functions, "functions": ["<name>", ...] in the task,
+                        both with "decompilable_functions": <number of the whole sample from the history or null>
+    agent -> scheduler: {"sample_hash": "<hash>", "exit_code": 0, "timed_out": false, "seconds": 1.2, "ready": true}
+The agent exits after a result with "ready": false.
+
+Bugfinder derives the function counts of a sample from BinaryView.functions, which only has the functions of the
+task if the task is restricted. Such a task writes to its own database, and its rows are appended to sqlite_file with
+the counts of the whole sample: sample_total_function_count as counted in the child, sample_decompilable_function_count
+as sent by the scheduler (null if unknown).
+
+Only depends on the standard library, the container's Python runs it.
+"""
+import argparse
+import importlib
+import json
+import logging
+import os
+import runpy
+import select
+import signal
+import shutil
+import socket
+import sqlite3
+import sys
+import tempfile
+import time
+import traceback
+from typing import Callable, List, Optional
+
+TIMEOUT_EXIT_CODE = 124  # same as `timeout`
+BUSY_TIMEOUT_SECONDS = 60  # sqlite_file may be shared with the agents of other slots
+
+
+def wait_child(pid: int, timeout: float) -> Optional[int]:
+    """Wait for child process, return its exit code (negative signal number if killed), None on timeout"""
+    try:
+        pidfd = os.pidfd_open(pid)  # Linux >= 5.3, Python >= 3.9: readable when the child exits
+    except (AttributeError, OSError):
+        pidfd = None
+    if pidfd is not None:
+        try:
+            ready, _, _ = select.select([pidfd], [], [], timeout)
+        finally:
+            os.close(pidfd)
+        if not ready:
+            return None
+        return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        waited_pid, status = os.waitpid(pid, os.WNOHANG)
+        if waited_pid:
+            return os.waitstatus_to_exitcode(status)
+        time.sleep(0.1)
+    return None
+
+
+def restrict_functions(select: Callable[[list], list], report: Callable[[int], None]):
+    """Restrict BinaryView.functions to select(functions), report the number of all functions once (in the forked child only)"""
+    import binaryninja
+
+    functions = binaryninja.BinaryView.functions
+    reported = []
+
+    def restricted(view) -> list:
+        all_functions = list(functions.fget(view))
+        if not reported:
+            reported.append(True)
+            report(len(all_functions))
+        return select(all_functions)
+
+    binaryninja.BinaryView.functions = property(restricted)
+
+
+def shard_functions(index: int, count: int, report: Callable[[int], None]):
+    """Restrict BinaryView.functions to every count-th function, starting at index"""
+    restrict_functions(lambda functions: functions[index::count], report)
+
+
+def select_functions(names: List[str], report: Callable[[int], None]):
+    """Restrict BinaryView.functions to functions with the given names"""
+    names = set(names)
+    restrict_functions(lambda functions: [function for function in functions if function.name in names], report)
+
+
+def append_rows(task_db: str, sqlite_file: str, total_functions: Optional[int], decompilable_functions: Optional[int]) -> int:
+    """
+    Append the rows of a restricted task to sqlite_file in one transaction, with the function counts of the whole
+    sample instead of those of the task (the total is kept if the child did not count it), return their number
+    """
+    if not os.path.exists(task_db):
+        return 0
+    con = sqlite3.connect(sqlite_file, timeout=BUSY_TIMEOUT_SECONDS, isolation_level=None)
+    try:
+        con.execute("ATTACH DATABASE ? AS task", (task_db,))
+        table = con.execute("SELECT sql FROM task.sqlite_master WHERE type = 'table' AND name = 'dewolf'").fetchone()
+        if table is None:
+            return 0  # no function finished
+        con.execute("BEGIN IMMEDIATE")
+        try:
+            if con.execute("SELECT 1 FROM main.sqlite_master WHERE type = 'table' AND name = 'dewolf'").fetchone() is None:
+                con.execute(table[0])  # unqualified CREATE TABLE creates the table in main
+            # the INTEGER PRIMARY KEY (id) is assigned by sqlite_file
+            columns = [row[1] for row in con.execute("PRAGMA task.table_info(dewolf)") if not (row[5] and row[2].upper() == "INTEGER")]
+            counts = {
+                "sample_total_function_count": ("COALESCE(?, sample_total_function_count)", total_functions),
+                "sample_decompilable_function_count": ("?", decompilable_functions),
+            }
+            values = ", ".join(counts[column][0] if column in counts else column for column in columns)
+            rows = con.execute(
+                f"INSERT INTO main.dewolf ({', '.join(columns)}) SELECT {values} FROM task.dewolf ORDER BY rowid",
+                [counts[column][1] for column in columns if column in counts],
+            ).rowcount
+            con.execute("COMMIT")
+        except BaseException:
+            con.execute("ROLLBACK")
+            raise
+        return rows
+    finally:
+        con.close()
+
+
+def run_sample(
+    script: str,
+    sample_path: str,
+    sqlite_file: str,
+    max_time: int,
+    shard: Optional[List[int]] = None,
+    functions: Optional[List[str]] = None,
+    decompilable_functions: Optional[int] = None,
+) -> dict:
+    """
+    Run bugfinder script on one sample in a forked child, kill it (and its children) after max_time.
+    Only every count-th function for a shard [index, count], only the named functions for a function list, the rows
+    of these go through a task database and get the function counts of the whole sample.
+    """
+    start = time.monotonic()
+    restricted = shard is not None or functions is not None
+    task_dir = tempfile.mkdtemp(prefix="bugfinder-task-") if restricted else None
+    output = os.path.join(task_dir, "task.sqlite3") if restricted else sqlite_file
+    count_read, count_write = os.pipe()  # number of all functions, from the child
+    pid = os.fork()
+    if pid == 0:
+        # child: own process group, so a timeout also kills processes started by bugfinder
+        os.setpgid(0, 0)
+        os.close(count_read)
+        report = lambda total: os.write(count_write, f"{total}\n".encode())
+        exit_code = 1
+        try:
+            if shard is not None:
+                shard_functions(*shard, report)
+            if functions is not None:
+                select_functions(functions, report)
+            sys.argv = [script, sample_path, "--sqlite-file", output]
+            sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+            runpy.run_path(script, run_name="__main__")
+            exit_code = 0
+        except SystemExit as ex:
+            exit_code = ex.code if isinstance(ex.code, int) else int(ex.code is not None)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(exit_code)
+    os.close(count_write)
+    exit_code = wait_child(pid, max_time)
+    timed_out = exit_code is None
+    if timed_out:
+        os.killpg(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+        exit_code = TIMEOUT_EXIT_CODE
+    os.set_blocking(count_read, False)  # processes started by bugfinder may still hold the write end
+    try:
+        reported = os.read(count_read, 64).split()
+    except BlockingIOError:
+        reported = []
+    finally:
+        os.close(count_read)
+    if restricted:
+        try:
+            append_rows(output, sqlite_file, int(reported[0]) if reported else None, decompilable_functions)
+        except sqlite3.Error as ex:
+            logging.error(f"could not append the rows of {sample_path} to {sqlite_file}: {ex}")
+            exit_code = exit_code or 1
+        finally:
+            shutil.rmtree(task_dir, ignore_errors=True)
+    return {"exit_code": exit_code, "timed_out": timed_out, "seconds": time.monotonic() - start}
+
+
+def send(connection: socket.socket, message: dict):
+    connection.sendall((json.dumps(message) + "\n").encode())
+
+
+def serve(args: argparse.Namespace) -> int:
+    """Process samples from the scheduler, return number of processed samples"""
+    processed = 0
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(args.socket)
+        messages = connection.makefile("r")
+        send(connection, {"ready": True})
+        for line in messages:
+            task = json.loads(line)
+            if task.get("exit"):
+                break
+            sample_hash = task["sample_hash"]
+            sample_path = task.get("sample_path") or os.path.join(args.samples_dir, sample_hash)
+            result = run_sample(
+                args.script,
+                sample_path,
+                args.sqlite_file,
+                args.max_time,
+                task.get("shard"),
+                task.get("functions"),
+                task.get("decompilable_functions"),
+            )
+            processed += 1
+            ready = args.max_samples <= 0 or processed < args.max_samples
+            send(connection, {"sample_hash": sample_hash, **result, "ready": ready})
+            if not ready:
+                break
+    return processed
+
+
+def parse_arguments() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Persistent bugfinder worker for scheduler.py")
+    parser.add_argument("--socket", required=True, help="Unix socket of the scheduler slot")
+    parser.add_argument("--script", default="decompiler/util/bugfinder/bugfinder.py", help="bugfinder script")
+    parser.add_argument("--samples-dir", default="/data/samples", help="Directory of samples named by hash, if the scheduler sends no path")
+    parser.add_argument("--sqlite-file", default="/data/samples.sqlite3", help="Output database of bugfinder")
+    parser.add_argument("--max-time", type=int, default=600, help="Time limit per sample in seconds (default: 600)")
+    parser.add_argument("--max-samples", type=int, default=0, help="Exit after X samples (default: 0, no limit)")
+    parser.add_argument(
+        "--preload",
+        default="binaryninja",
+        help="Comma separated modules imported once before forking (default: binaryninja), empty to disable",
+    )
+    return parser.parse_args()
+
+
+def main(args: argparse.Namespace) -> int:
+    for module in filter(None, args.preload.split(",")):
+        try:
+            importlib.import_module(module)
+        except ImportError as ex:
+            logging.warning(f"could not preload {module}: {ex}")
+    processed = serve(args)
+    logging.info(f"worker agent exiting after {processed} samples")
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = parse_arguments()
+    sys.exit(main(args))